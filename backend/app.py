@@ -1,37 +1,50 @@
-from fastapi import FastAPI, Form, Request
+from fastapi import FastAPI, Form, Header, HTTPException, Request, WebSocket
 from fastapi.concurrency import asynccontextmanager
 from fastapi.middleware.cors import CORSMiddleware
+from fastapi.responses import Response
 import uvicorn
 import os
+import hmac
 from typing import Optional
 
 from dotenv import load_dotenv
 
-# import asyncio
+# Before anything reads the environment: logging setup below reads LOG_* from .env too
+load_dotenv()
+
+import asyncio
 import logging
+from concurrent.futures import ThreadPoolExecutor
 from helper.api_service import APIService
 
 # Import the TradeSettlementClient
 from src.trade_settlement_client import (
     SettlementClient,
+    load_abi,
     # AllowanceChecker,
     # AllowanceManager,
 )
 from helper.api_helper import APIHelper
+from src.event_store import EventStore
+from src.settled_index import SettledTradeIndex
+from src.event_indexer import ContractEventIndexer, EventIndexStore
+from src import metrics
+from helper.profiler import SamplingProfiler
+from helper import logs
+from helper.responses import FastJSONResponse
+from helper.gateway import OrderGateway
+from helper.prices import PriceService
+from src.signing import SigningService
+from src.rpc_pool import provider_for
+from src.tokens import TokenRegistry
 import httpx
+from web3 import Web3
 
-# Configure logging
-root = logging.getLogger()
-if root.handlers:
-    root.handlers.clear()
-
-LOG_FORMAT = (
-    "%(asctime)s %(levelname)s " "[%(filename)s:%(lineno)d %(funcName)s] " "%(message)s"
-)
-
-logging.basicConfig(level=logging.INFO, format=LOG_FORMAT, datefmt="%Y-%m-%d %H:%M:%S")
+# Queue-backed structured logging; see helper/logs.py for LOG_LEVEL, LOG_FORMAT and rate limits
+logs.configure_logging()
+# httpx logs every request at INFO, which would dominate the log under load
+logging.getLogger("httpx").setLevel(logging.WARNING)
 logger = logging.getLogger(__name__)
-load_dotenv()
 
 order_books = {}  # Dictionary to store multiple order books, keyed by symbol
 
@@ -93,19 +106,71 @@ SUPPORTED_NETWORKS = {
 
 @asynccontextmanager
 async def lifespan(app: FastAPI):
-    logger.error("SHOULD RUN ON STARTUP!")
-    api_service.register_startup_event(
+    global settlement_client
+    logger.info("Starting up")
+    settlement_client = api_service.register_startup_event(
         WEB3_PROVIDER=SUPPORTED_NETWORKS["hedera"]["rpc"],
         TRADE_SETTLEMENT_CONTRACT_ADDRESS=TRADE_SETTLEMENT_CONTRACT_ADDRESS,
         PRIVATE_KEY=PRIVATE_KEY,
     )
+    gateway_server = None
+    if gateway is not None and GATEWAY_PORT:
+        gateway_server = await gateway.serve_tcp(port=GATEWAY_PORT)
+    expiry_task = asyncio.ensure_future(expire_orders_periodically())
+    flush_task = asyncio.ensure_future(flush_event_store_periodically()) if event_store is not None else None
+    # Readiness does not wait on remote RPCs; their reachability is checked in the background
+    connection_task = asyncio.ensure_future(check_rpc_connections_periodically())
+    indexer_tasks = start_event_indexers()
+    price_task = asyncio.ensure_future(price_service.run(PRICE_REFRESH_INTERVAL)) if PRICE_REFRESH_INTERVAL > 0 else None
     yield
+    expiry_task.cancel()
+    connection_task.cancel()
+    if flush_task is not None:
+        flush_task.cancel()
+    if price_task is not None:
+        price_task.cancel()
+    await price_service.close()
+    for task in indexer_tasks:
+        task.cancel()
+    if chain_events is not None:
+        await asyncio.gather(*indexer_tasks, return_exceptions=True)
+        chain_events.close()
+    if gateway_server is not None:
+        gateway_server.close()
+    gateway_settlement_executor.shutdown(wait=False, cancel_futures=True)
+    if api_service.signer is not None:
+        api_service.signer.close()
+    api_service.settled_index.close()
+    if event_store is not None:
+        event_store.close()
+
+
+app = FastAPI(lifespan=lifespan, default_response_class=FastJSONResponse)
+
+
+# Gate.io ticker cache behind /api/price. With PRICE_REFRESH_INTERVAL set, pairs asked for in the
+# last PRICE_HOT_WINDOW seconds are refreshed in the background instead of on request
+PRICE_REFRESH_INTERVAL = float(os.getenv("PRICE_REFRESH_INTERVAL", "0"))
+price_service = PriceService(
+    ttl=float(os.getenv("PRICE_CACHE_TTL", "2")),
+    stale_ttl=float(os.getenv("PRICE_STALE_TTL", "60")),
+    hot_window=float(os.getenv("PRICE_HOT_WINDOW", "30")),
+)
 
+# Persistent trade/order-event history, enabled by pointing EVENT_STORE_DIR at a directory
+EVENT_STORE_DIR = os.getenv("EVENT_STORE_DIR")
+event_store = EventStore(EVENT_STORE_DIR) if EVENT_STORE_DIR else None
 
-app = FastAPI(lifespan=lifespan)
-
+# Trades past a book's in-memory tape spill to segment files here, by default next to the journal
+TAPE_SPILL_DIR = os.getenv("TAPE_SPILL_DIR") or (
+    os.path.join(EVENT_STORE_DIR, "tape") if EVENT_STORE_DIR else None
+)
 
-api_service = APIService()
+api_service = APIService(event_store=event_store, tape_spill_dir=TAPE_SPILL_DIR)
+# Which fills have settled on which chain, logged next to the journal when there is one
+api_service.settled_index = SettledTradeIndex(
+    os.path.join(EVENT_STORE_DIR, "settled.log") if EVENT_STORE_DIR else None
+)
 # Add CORS middleware configuration
 app.add_middleware(
     CORSMiddleware,
@@ -117,17 +182,22 @@ app.add_middleware(
 
 # Global settlement client - initialize on startup
 settlement_client: Optional[SettlementClient] = None
+# Builds settlement clients per chain; the load-test harness swaps in a fake
+settlement_client_factory = SettlementClient
 # allowance_checker: Optional[AllowanceChecker] = None
 # allowance_manager: Optional[AllowanceManager] = None
 
 
 PRIVATE_KEY = os.getenv("PRIVATE_KEY")  # Should be loaded securely
-try:
-    CONTRACT_ABI = APIHelper.load_abi("orderbook/settlement_abi.json")
-except Exception:
-    CONTRACT_ABI = []  # fallback
-
-TOKEN_ADDRESSES = {
+logs.add_secret(PRIVATE_KEY)
+# Symbol -> address, with decimals; TOKEN_DECIMALS ("USDT:6,cNGN_BSC:6") skips the on-chain decimals() read
+TOKEN_DECIMALS = dict(
+    (symbol, int(decimals))
+    for symbol, decimals in (
+        entry.split(":", 1) for entry in os.getenv("TOKEN_DECIMALS", "").split(",") if ":" in entry
+    )
+)
+TOKEN_ADDRESSES = TokenRegistry({
     "HBAR": os.getenv(
         "HBAR_TOKEN_ADDRESS", "0xb1F616b8134F602c3Bb465fB5b5e6565cCAd37Ed"
     ),
@@ -161,33 +231,177 @@ TOKEN_ADDRESSES = {
     "cGHS_CELO": os.getenv(
         "CGHS_CELO_ADDRESS", "0xfAeA5F3404bbA20D3cc2f8C4B0A888F55a3c7313"
     ),
-}
+}, decimals=TOKEN_DECIMALS)
 
 
-print(SUPPORTED_NETWORKS, "SUPPORTED NETWORKS IN APP.PY")
+logger.info("Supported networks: %s", ", ".join(SUPPORTED_NETWORKS))
 
 
-@asynccontextmanager
-async def lifespan(app: FastAPI):
-    global settlement_client
-    logger.error("SHOULD RUN ON STARTUP!")
-    settlement_client = api_service.register_startup_event(
-        WEB3_PROVIDER=SUPPORTED_NETWORKS["hedera"]["rpc"],
-        TRADE_SETTLEMENT_CONTRACT_ADDRESS=TRADE_SETTLEMENT_CONTRACT_ADDRESS,
-        PRIVATE_KEY=PRIVATE_KEY,
-    )
-    yield
+# Binary order-entry gateway (helper/gateway.py). GATEWAY_TOKENS is a comma separated
+# list of account:token pairs; the TCP listener starts when GATEWAY_PORT is also set.
+GATEWAY_PORT = int(os.getenv("GATEWAY_PORT", "0"))
+GATEWAY_TOKENS = dict(
+    entry.split(":", 1) for entry in os.getenv("GATEWAY_TOKENS", "").split(",") if ":" in entry
+)
+for _token in GATEWAY_TOKENS.values():
+    logs.add_secret(_token)
+_settlement_tasks = set()
+# Gateway fills settle on their own thread and event loop: settlement makes blocking RPC
+# calls (nonces, transaction receipts) that must not hold up order entry
+gateway_settlement_executor = ThreadPoolExecutor(max_workers=1, thread_name_prefix="gateway-settlement")
 
 
-@app.post("/api/register_order")
-async def register_order(request: Request):
-    logger.info("Got here")
- 
-    settlement_client = SettlementClient(
+def current_settlement_client():
+    # Reuse the client built on startup instead of reconnecting on every order
+    return settlement_client or settlement_client_factory(
         web3_provider=SUPPORTED_NETWORKS["hedera"]["rpc"],
         contract_address=TRADE_SETTLEMENT_CONTRACT_ADDRESS,
         private_key=PRIVATE_KEY,
     )
+
+
+async def check_gateway_order(message, book):
+    return await api_service.check_order(
+        message,
+        book,
+        current_settlement_client(),
+        SUPPORTED_NETWORKS["hedera"]["rpc"],
+        TOKEN_ADDRESSES,
+    )
+
+
+def _gateway_settled(future):
+    _settlement_tasks.discard(future)
+    if not future.cancelled() and future.exception() is not None:
+        metrics.ERRORS.labels("settlement").inc()
+        logger.error("Gateway settlement failed: %s", future.exception())
+
+
+def settle_gateway_fills(symbol, order_id, trades):
+    """Settle fills from gateway orders on the settlement thread; the gateway never waits on RPC."""
+    base_asset, quote_asset = symbol.split("_", 1)
+    order_dict = {
+        "orderId": order_id,
+        "baseAsset": base_asset,
+        "quoteAsset": quote_asset,
+        "trades": api_service.convert_trades(trades),
+    }
+    task = asyncio.get_running_loop().run_in_executor(
+        gateway_settlement_executor,
+        asyncio.run,
+        APIHelper.settle_trades_if_any(
+            order_dict,
+            SUPPORTED_NETWORKS,
+            TRADE_SETTLEMENT_CONTRACT_ADDRESS,
+            load_abi("settlement_abi"),
+            PRIVATE_KEY,
+            TOKEN_ADDRESSES,
+            settlement_client=settlement_client,
+            REQUIRE_CLIENT_SIGNATURES=api_service.require_client_signatures,
+            client_factory=settlement_client_factory,
+            signer=api_service.signer,
+            settled_index=api_service.settled_index,
+        )
+    )
+    _settlement_tasks.add(task)
+    task.add_done_callback(_gateway_settled)
+
+
+# Settlement signatures are made in a worker pool off the event loop; SIGNING_WORKERS=0
+# signs inline on the settlement clients instead
+SIGNING_WORKERS = int(os.getenv("SIGNING_WORKERS", str(os.cpu_count() or 1)))
+if SIGNING_WORKERS > 0:
+    api_service.signer = SigningService(workers=SIGNING_WORKERS)
+
+
+# Settlement contract events of every network, indexed into SQLite by background tasks
+# when CHAIN_EVENTS_DB is set; EVENT_INDEXER_START_BLOCK_<NETWORK> backfills from a block
+CHAIN_EVENTS_DB = os.getenv("CHAIN_EVENTS_DB")
+chain_events = EventIndexStore(CHAIN_EVENTS_DB) if CHAIN_EVENTS_DB else None
+api_service.chain_events = chain_events
+
+
+def start_event_indexers():
+    if chain_events is None:
+        return []
+    loop = asyncio.get_running_loop()
+
+    def record_settled(events):
+        # Called from the indexer's worker thread; the index belongs to the event loop
+        loop.call_soon_threadsafe(api_service.settled_index.add_events, events)
+
+    tasks = []
+    for name, cfg in SUPPORTED_NETWORKS.items():
+        start_block = os.getenv("EVENT_INDEXER_START_BLOCK_" + name.upper())
+        indexer = ContractEventIndexer(
+            Web3(provider_for(cfg["rpc"])),
+            cfg.get("contract_address", TRADE_SETTLEMENT_CONTRACT_ADDRESS),
+            cfg["chain_id"],
+            chain_events,
+            load_abi("settlement_abi"),
+            start_block=int(start_block) if start_block else None,
+            on_settled=record_settled,
+            network=name,
+        )
+        tasks.append(asyncio.ensure_future(indexer.run()))
+    return tasks
+
+
+# GTT orders are removed by this sweep; the books' timer wheels make each pass O(expired)
+ORDER_EXPIRY_INTERVAL = float(os.getenv("ORDER_EXPIRY_INTERVAL_MS", "50")) / 1000
+
+
+# How often each network's RPC is probed for /api/settlement_health and givex_rpc_up
+RPC_CHECK_INTERVAL = float(os.getenv("RPC_CHECK_INTERVAL", "30"))
+
+
+async def check_rpc_connections_periodically():
+    while True:
+        for name, cfg in SUPPORTED_NETWORKS.items():
+            try:
+                if name == "hedera" and settlement_client is not None:
+                    # The startup client is on this RPC; checking it also sets settlement_client.connected
+                    connected = await asyncio.to_thread(settlement_client.check_connection)
+                else:
+                    connected = await asyncio.to_thread(Web3(provider_for(cfg["rpc"])).is_connected)
+            except Exception:
+                connected = False
+            api_service.rpc_status[name] = connected
+            metrics.RPC_UP.labels(name).set(1 if connected else 0)
+        await asyncio.sleep(RPC_CHECK_INTERVAL)
+
+
+async def flush_event_store_periodically():
+    # Appends flush the journal as they come; this covers events written just before a quiet spell
+    while True:
+        await asyncio.sleep(event_store.flush_interval)
+        event_store.flush()
+
+
+async def expire_orders_periodically():
+    while True:
+        await asyncio.sleep(ORDER_EXPIRY_INTERVAL)
+        try:
+            api_service.expire_orders(order_books)
+        except Exception:
+            logger.exception("Order expiry sweep failed")
+
+
+gateway = None
+if GATEWAY_TOKENS:
+    gateway = OrderGateway(
+        order_books,
+        lambda symbol: api_service.get_or_create_order_book(order_books, symbol),
+        GATEWAY_TOKENS,
+        on_trades=settle_gateway_fills,
+        check_order=check_gateway_order,
+    )
+    api_service.gateway = gateway
+
+
+@app.post("/api/register_order")
+async def register_order(request: Request):
+    client = current_settlement_client()
     return await api_service.register_order(
         request=request,
         order_books=order_books,
@@ -195,9 +409,10 @@ async def register_order(request: Request):
         TOKEN_ADDRESSES=TOKEN_ADDRESSES,
         SUPPORTED_NETWORKS=SUPPORTED_NETWORKS,
         TRADE_SETTLEMENT_CONTRACT_ADDRESS=TRADE_SETTLEMENT_CONTRACT_ADDRESS,
-        CONTRACT_ABI=CONTRACT_ABI,
+        CONTRACT_ABI=load_abi("settlement_abi"),
         PRIVATE_KEY=PRIVATE_KEY,
-        settlement_client=settlement_client,
+        settlement_client=client,
+        settlement_client_factory=settlement_client_factory,
     )
 
 
@@ -206,9 +421,19 @@ async def cancel_order(request: Request):
     return await api_service.cancel_order(request, order_books=order_books)
 
 
+@app.post("/api/mass_cancel")
+async def mass_cancel(request: Request):
+    return await api_service.mass_cancel(request, order_books=order_books)
+
+
+@app.post("/api/modify_order")
+async def modify_order(request: Request):
+    return await api_service.modify_order(request, order_books=order_books)
+
+
 @app.post("/api/order")
 async def get_order(payload: str = Form(...)):
-    return await api_service.get_order(payload=payload, order_books=order_books)
+    return api_service.get_order(payload=payload, order_books=order_books)
 
 
 @app.post("/api/orderbook")
@@ -216,6 +441,73 @@ async def get_orderbook(request: Request):
     return await api_service.get_orderbook(request=request, order_books=order_books)
 
 
+@app.get("/api/candles")
+async def get_candles(
+    symbol: str,
+    resolution: str = "1m",
+    limit: Optional[int] = 500,
+    start: Optional[int] = None,
+    end: Optional[int] = None,
+):
+    return api_service.get_candles(
+        symbol=symbol,
+        resolution=resolution,
+        order_books=order_books,
+        limit=limit,
+        start=start,
+        end=end,
+    )
+
+
+@app.get("/api/analytics")
+async def get_analytics(symbol: str, levels: int = 20, size: Optional[float] = None):
+    return api_service.get_analytics(
+        symbol=symbol,
+        order_books=order_books,
+        levels=levels,
+        size=size,
+    )
+
+
+@app.get("/api/simulate")
+async def simulate_order(
+    symbol: str,
+    side: str,
+    quantity: float,
+    from_network: str,
+    to_network: str,
+    price: Optional[float] = None,
+):
+    return api_service.simulate_order(
+        symbol=symbol,
+        side=side,
+        quantity=quantity,
+        from_network=from_network,
+        to_network=to_network,
+        order_books=order_books,
+        price=price,
+    )
+
+
+@app.get("/api/settlement_status")
+async def get_settlement_status(settlementId: str):
+    return api_service.get_settlement_status(settlement_id=settlementId)
+
+
+@app.get("/api/escrow_activity")
+async def get_escrow_activity(network: str, user: str, token: str, limit: int = 100):
+    # SQLite reads run on a worker thread (with its own read connection), never on the event loop
+    return await asyncio.to_thread(
+        api_service.get_escrow_activity,
+        network=network,
+        user=user,
+        token=token,
+        SUPPORTED_NETWORKS=SUPPORTED_NETWORKS,
+        TOKEN_ADDRESSES=TOKEN_ADDRESSES,
+        limit=limit,
+    )
+
+
 @app.get("/api/get_settlement_address")
 async def get_settlement_address():
     return api_service.get_settlement_address(
@@ -233,17 +525,69 @@ async def check_available_funds(payload: str = Form(...)):
 # Price proxy to avoid CORS from frontend
 @app.get("/api/price")
 async def get_price(currency_pair: str):
-    url = f"https://api.gateio.ws/api/v4/spot/tickers?currency_pair={currency_pair}"
     try:
-        async with httpx.AsyncClient(timeout=10.0) as client:
-            r = await client.get(url, headers={"Accept": "application/json"})
-            r.raise_for_status()
-            # Pass-through JSON
-            return r.json()
+        # Pass-through JSON, shared by every caller within PRICE_CACHE_TTL
+        return await price_service.get(currency_pair)
     except httpx.HTTPError as e:
-        logger.error(f"Price proxy error: {e}")
+        logger.error("Price proxy error: %s", e)
         return {"error": "failed_to_fetch_price", "details": str(e)}
 
+
+def _book_gauge(attribute):
+    def collect():
+        values = {}
+        for symbol, order_book in list(order_books.items()):
+            values[(symbol, "bid")] = getattr(order_book.bids, attribute)
+            values[(symbol, "ask")] = getattr(order_book.asks, attribute)
+        return values
+
+    return collect
+
+
+# Book gauges are read from the live books at scrape time, costing nothing per order
+metrics.BOOK_DEPTH.set_function(_book_gauge("depth"))
+metrics.BOOK_ORDERS.set_function(_book_gauge("num_orders"))
+
+
+@app.get("/metrics")
+async def get_metrics():
+    return Response(content=metrics.REGISTRY.render(), media_type=metrics.CONTENT_TYPE)
+
+
+# Admin endpoints are disabled unless ADMIN_TOKEN is set; callers send it as X-Admin-Token
+ADMIN_TOKEN = os.getenv("ADMIN_TOKEN")
+profiler = SamplingProfiler()
+
+
+def require_admin(token):
+    if not ADMIN_TOKEN:
+        raise HTTPException(status_code=404, detail="Not Found")
+    if not token or not hmac.compare_digest(token, ADMIN_TOKEN):
+        raise HTTPException(status_code=403, detail="Invalid admin token")
+
+
+@app.get("/admin/profile")
+async def admin_profile(
+    seconds: float = 10,
+    interval_ms: float = 5,
+    format: str = "collapsed",
+    x_admin_token: Optional[str] = Header(None),
+):
+    require_admin(x_admin_token)
+    return await api_service.capture_profile(
+        profiler, seconds=seconds, interval_ms=interval_ms, output=format
+    )
+
+
+@app.websocket("/ws/orders")
+async def order_entry_websocket(websocket: WebSocket):
+    if gateway is None:
+        await websocket.close(code=1008)
+        return
+    await websocket.accept()
+    await gateway.handle_websocket(websocket)
+
+
 # Add a health check endpoint for the settlement system
 @app.get("/api/settlement_health")
 async def settlement_health():
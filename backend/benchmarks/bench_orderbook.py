@@ -0,0 +1,397 @@
+"""
+Matching engine micro-benchmarks
+
+Each benchmark runs in a fresh subprocess so peak RSS is attributable to it,
+--repeat times (and benchmarks over small books several times within each
+subprocess); every figure reported is the median of those runs, since
+single runs of the same build differ by up to 25%. Results are written as
+JSON (ops/sec, p50/p99 latency in microseconds and peak RSS in MB) and
+compared against a stored baseline of medians; a benchmark whose ops/sec
+drops or p99 rises by more than --threshold percent is reported as a
+regression and makes the run exit non-zero. A flagged benchmark is measured
+again first and only counts if the second median regresses as well.
+
+Usage (from backend/):
+    python -m benchmarks.bench_orderbook                      # compare to baseline
+    python -m benchmarks.bench_orderbook --full               # include 1M-order runs
+    python -m benchmarks.bench_orderbook --only insert_100k --repeat 9
+    python -m benchmarks.bench_orderbook --save-baseline
+"""
+
+import gc
+import os
+import sys
+import json
+import time
+import random
+import argparse
+import resource
+import statistics
+import subprocess
+from array import array
+from decimal import Decimal
+
+from helper.responses import orderbook_json
+from src.orderbook import OrderBook
+from src.replay import ReplayEngine, generate_commands
+
+BASELINE = os.path.join(os.path.dirname(os.path.abspath(__file__)), "baseline.json")
+NETWORKS = {"bid": ("polygon", "hedera"), "ask": ("hedera", "polygon")}
+MID = Decimal("0.0500")
+TICK = Decimal("0.0001")
+
+
+# ==================== FLOW ====================
+
+
+def make_quote(order_id, side, price, quantity, account, timestamp, networks=None):
+    from_network, to_network = networks or NETWORKS[side]
+    return {
+        "type": "limit",
+        "timestamp": timestamp,
+        "order_id": order_id,
+        "side": side,
+        "price": price,
+        "quantity": Decimal(quantity),
+        "trade_id": account,
+        "account": account,
+        "private_key": None,
+        "baseAsset": "HBAR",
+        "quoteAsset": "USDT",
+        "from_network": from_network,
+        "to_network": to_network,
+    }
+
+
+def passive_flow(count, seed=7, levels=200):
+    '''Resting orders on both sides, clustered near the touch like a real book.'''
+    rng = random.Random(seed)
+    accounts = ["0x%040x" % (i + 1) for i in range(100)]
+    quotes = []
+    for order_id in range(1, count + 1):
+        side = "bid" if order_id % 2 else "ask"
+        # Exponential distance from the touch: most orders sit within a few ticks
+        distance = 1 + min(levels - 1, int(rng.expovariate(1.0 / 10)))
+        price = MID - distance * TICK if side == "bid" else MID + distance * TICK
+        quotes.append(
+            make_quote(order_id, side, price, rng.randint(1, 100), rng.choice(accounts), order_id)
+        )
+    return quotes
+
+
+def filled_book(count):
+    book = OrderBook()
+    for quote in passive_flow(count):
+        book.process_order(quote, True, False)
+    return book
+
+
+# ==================== BENCHMARKS ====================
+
+
+def bench_insert(count):
+    quotes = passive_flow(count)
+    book = OrderBook()
+    return _timed(lambda quote: book.process_order(quote, True, False), quotes)
+
+
+def bench_cancel(count):
+    quotes = passive_flow(count)
+    book = OrderBook()
+    for quote in quotes:
+        book.process_order(quote, True, False)
+    rng = random.Random(11)
+    targets = [(q["side"], q["order_id"]) for q in quotes]
+    rng.shuffle(targets)
+    return _timed(lambda target: book.cancel_order(target[0], target[1], 1), targets)
+
+
+def bench_modify(count):
+    quotes = passive_flow(count)
+    book = OrderBook()
+    for quote in quotes:
+        book.process_order(quote, True, False)
+    rng = random.Random(13)
+    updates = []
+    for quote in quotes:
+        price = quote["price"]
+        if rng.random() < 0.5:
+            # Price amend: moves the order to another level
+            price = price - TICK if quote["side"] == "bid" else price + TICK
+        updates.append(
+            (quote["order_id"], {"side": quote["side"], "price": price, "quantity": Decimal(rng.randint(1, 100))})
+        )
+    return _timed(lambda update: book.modify_order(update[0], dict(update[1]), 1), updates)
+
+
+def bench_aggressive(count):
+    '''Takers that each fill the best resting order, walking down through depth.'''
+    book = filled_book(count)
+    takers = []
+    order_id = count
+    for i in range(count // 2):
+        order_id += 1
+        side = "ask" if i % 2 else "bid"
+        takers.append((order_id, side))
+
+    def take(taker):
+        order_id, side = taker
+        opposite = book.asks.min_price_list() if side == "bid" else book.bids.max_price_list()
+        if opposite is None:
+            return
+        head = opposite.head_order
+        book.process_order(
+            make_quote(order_id, side, head.price, head.quantity, "0xtaker", order_id), True, False
+        )
+
+    return _timed(take, takers)
+
+
+def bench_skip_scan(count, incompatible=50):
+    '''Takers that must skip `incompatible` orders on another network pair at the touch.'''
+    book = OrderBook()
+    price = MID + TICK
+    order_id = 0
+    for _ in range(incompatible):
+        order_id += 1
+        book.process_order(
+            make_quote(order_id, "ask", price, 10, "0xmaker", order_id, ("bsc", "celo")), True, False
+        )
+    clock = time.perf_counter_ns
+    latencies = array("q")
+    gc.collect()
+    elapsed = 0
+    for _ in range(count):
+        # Untimed: a compatible maker queued behind the incompatible ones
+        order_id += 1
+        book.process_order(make_quote(order_id, "ask", price, 10, "0xmaker", order_id), True, False)
+        order_id += 1
+        taker = make_quote(order_id, "bid", price, 10, "0xtaker", order_id)
+        t0 = clock()
+        book.process_order(taker, True, False)
+        latency = clock() - t0
+        latencies.append(latency)
+        elapsed += latency
+    ordered = sorted(latencies)
+    return {
+        "ops": count,
+        "ops_per_sec": round(count / (elapsed / 1e9), 1) if elapsed else None,
+        "p50_us": round(_percentile(ordered, 50) / 1000.0, 3),
+        "p99_us": round(_percentile(ordered, 99) / 1000.0, 3),
+        "incompatible_per_level": incompatible,
+    }
+
+
+def bench_get_orderbook(count):
+    book = filled_book(count)
+    iterations = max(3, min(200, 200000 // count))
+    result = _timed(lambda _: book.get_orderbook("HBAR_USDT"), range(iterations))
+    result["orders"] = count
+    return result
+
+
+def bench_orderbook_json(count):
+    '''Encoding the depth snapshot /api/orderbook serves, after every book change.'''
+    book = filled_book(count)
+    iterations = max(3, min(200, 200000 // count))
+
+    def encode(_):
+        book.version += 1  # as any order, cancel or fill does: the cached snapshot is stale
+        orderbook_json(book, "HBAR_USDT")
+
+    result = _timed(encode, range(iterations))
+    # Polls between two changes are served from the cached snapshot
+    cached = _timed(lambda _: orderbook_json(book, "HBAR_USDT"), range(1000))
+    result["cached_p50_us"] = cached["p50_us"]
+    result["orders"] = count
+    return result
+
+
+def bench_multi_symbol(count, symbols=4):
+    commands = list(generate_commands(count, tuple("SYM%d_USDT" % i for i in range(symbols)), seed=3))
+    gc.collect()
+    report = ReplayEngine().run(commands)
+    return {
+        "ops": report["commands"],
+        "ops_per_sec": report["events_per_sec"],
+        "p50_us": report["latency_us"]["p50"],
+        "p99_us": report["latency_us"]["p99"],
+        "trades": report["trades"],
+    }
+
+
+def _timed(operation, items):
+    gc.collect()
+    clock = time.perf_counter_ns
+    latencies = array("q")
+    started = clock()
+    for item in items:
+        t0 = clock()
+        operation(item)
+        latencies.append(clock() - t0)
+    elapsed = (clock() - started) / 1e9
+    ordered = sorted(latencies)
+    return {
+        "ops": len(ordered),
+        "ops_per_sec": round(len(ordered) / elapsed, 1) if elapsed else None,
+        "p50_us": round(_percentile(ordered, 50) / 1000.0, 3),
+        "p99_us": round(_percentile(ordered, 99) / 1000.0, 3),
+    }
+
+
+def _percentile(ordered, q):
+    if not ordered:
+        return 0
+    return ordered[min(len(ordered) - 1, int(round(q / 100.0 * (len(ordered) - 1))))]
+
+
+def _size_name(count):
+    return "%dk" % (count // 1000) if count < 1000000 else "%dm" % (count // 1000000)
+
+
+def benchmarks(full=False):
+    sizes = [1000, 100000] + ([1000000] if full else [])
+    suite = {}
+    for count in sizes:
+        name = _size_name(count)
+        suite["insert_" + name] = (bench_insert, count)
+        suite["cancel_" + name] = (bench_cancel, count)
+        suite["modify_" + name] = (bench_modify, count)
+        suite["aggressive_" + name] = (bench_aggressive, count)
+        suite["skip_scan_" + name] = (bench_skip_scan, count)
+        suite["get_orderbook_" + name] = (bench_get_orderbook, count)
+        suite["orderbook_json_" + name] = (bench_orderbook_json, count)
+    suite["multi_symbol_100k"] = (bench_multi_symbol, 100000)
+    return suite
+
+
+# ==================== RUNNER ====================
+
+
+def run_one(name, full):
+    function, count = benchmarks(full)[name]
+    # Small benchmarks are over in milliseconds, where one scheduler hiccup decides the figure:
+    # they are repeated in-process (on fresh state) and the medians taken
+    rounds = max(1, min(20, 100000 // count))
+    result = _medians([function(count) for _ in range(rounds)])
+    result["peak_rss_mb"] = round(_peak_rss_mb(), 1)
+    return result
+
+
+def _medians(runs):
+    '''Median of every numeric figure over runs, other fields from the first run.'''
+    result = {}
+    for key, value in runs[0].items():
+        values = [run.get(key) for run in runs]
+        if all(isinstance(v, int) for v in values) and len(set(values)) == 1:
+            result[key] = value
+        elif all(isinstance(v, (int, float)) for v in values):
+            result[key] = round(statistics.median(values), 3)
+        else:
+            result[key] = value
+    return result
+
+
+def _peak_rss_mb():
+    peak = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+    # Linux reports kilobytes, macOS bytes
+    return peak / (1024.0 * 1024.0) if sys.platform == "darwin" else peak / 1024.0
+
+
+def run_isolated(name, full):
+    command = [sys.executable, "-m", "benchmarks.bench_orderbook", "--child", name]
+    if full:
+        command.append("--full")
+    output = subprocess.run(command, check=True, capture_output=True, text=True).stdout
+    return json.loads(output.strip().splitlines()[-1])
+
+
+def run_repeated(name, full, repeat):
+    '''Median of every figure over repeat isolated runs, with the ops/sec spread between them.'''
+    runs = [run_isolated(name, full) for _ in range(repeat)]
+    result = _medians(runs)
+    speeds = [run["ops_per_sec"] for run in runs if run.get("ops_per_sec")]
+    if len(speeds) > 1:
+        result["ops_per_sec_spread_pct"] = round((max(speeds) - min(speeds)) / statistics.median(speeds) * 100, 1)
+    result["runs"] = repeat
+    return result
+
+
+def compare(results, baseline, threshold):
+    regressions = []
+    for name, result in results.items():
+        previous = baseline.get(name)
+        if not previous:
+            continue
+        if previous.get("ops_per_sec") and result.get("ops_per_sec"):
+            change = (result["ops_per_sec"] - previous["ops_per_sec"]) / previous["ops_per_sec"] * 100
+            result["ops_per_sec_change_pct"] = round(change, 1)
+            if change < -threshold:
+                regressions.append("%s: ops/sec %.1f%%" % (name, change))
+        if previous.get("p99_us") and result.get("p99_us"):
+            change = (result["p99_us"] - previous["p99_us"]) / previous["p99_us"] * 100
+            result["p99_change_pct"] = round(change, 1)
+            if change > threshold:
+                regressions.append("%s: p99 +%.1f%%" % (name, change))
+    return regressions
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="OrderBook micro-benchmarks")
+    parser.add_argument("--full", action="store_true", help="include 1M-order benchmarks")
+    parser.add_argument("--only", action="append", help="run only the named benchmark(s)")
+    parser.add_argument("--output", help="write results JSON here")
+    parser.add_argument("--baseline", default=BASELINE)
+    parser.add_argument("--save-baseline", action="store_true")
+    parser.add_argument("--threshold", type=float, default=10.0, help="regression threshold in percent")
+    parser.add_argument("--repeat", type=int, default=5, help="runs per benchmark; the median is reported")
+    parser.add_argument("--child", help=argparse.SUPPRESS)
+    args = parser.parse_args(argv)
+
+    if args.child:
+        print(json.dumps(run_one(args.child, args.full)))
+        return 0
+
+    names = args.only or list(benchmarks(args.full))
+    results = {}
+    for name in names:
+        results[name] = run_repeated(name, args.full, max(1, args.repeat))
+        print(
+            "%-22s %12s ops/s  p50 %9.3fus  p99 %9.3fus  rss %7.1fMB"
+            % (name, results[name]["ops_per_sec"], results[name]["p50_us"],
+               results[name]["p99_us"], results[name]["peak_rss_mb"]),
+            file=sys.stderr,
+        )
+
+    if args.save_baseline:
+        baseline = {}
+        if os.path.exists(args.baseline):
+            with open(args.baseline, "r", encoding="utf-8") as f:
+                baseline = json.load(f)
+        baseline.update(results)
+        with open(args.baseline, "w", encoding="utf-8") as f:
+            json.dump(baseline, f, indent=2, sort_keys=True)
+            f.write("\n")
+
+    regressions = []
+    if os.path.exists(args.baseline) and not args.save_baseline:
+        with open(args.baseline, "r", encoding="utf-8") as f:
+            baseline = json.load(f)
+        flagged = set(line.split(":")[0] for line in compare(results, baseline, args.threshold))
+        # Host noise rarely slows the same benchmark down twice in a row; a real regression does
+        rechecked = dict((name, run_repeated(name, args.full, max(1, args.repeat))) for name in sorted(flagged))
+        for result in rechecked.values():
+            result["rechecked"] = True
+        regressions = compare(rechecked, baseline, args.threshold)
+        results.update(rechecked)
+
+    report = {"results": results, "regressions": regressions}
+    if args.output:
+        with open(args.output, "w", encoding="utf-8") as f:
+            json.dump(report, f, indent=2, sort_keys=True)
+    print(json.dumps(report, indent=2, sort_keys=True))
+    return 1 if regressions else 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -0,0 +1,347 @@
+"""
+End-to-end HTTP load test for the order API
+
+Drives the FastAPI app in app.py with a configurable mix of order, cancel
+and order book requests across symbols and network pairs, then reports
+end-to-end latency plus per-stage latency (validation, matching,
+serialization, settlement) as percentiles and log2 histograms.
+
+By default the app runs in-process over httpx.ASGITransport with
+FakeSettlementClient standing in for the chain, so no testnet is touched.
+--rpc points every supported network at a local EVM node (anvil or a
+hardhat node with the settlement contract from smart_contract/ deployed at
+--contract) and uses the real SettlementClient. --url targets an already
+running server; only end-to-end latency is available then.
+
+Usage (from backend/):
+    python -m benchmarks.loadtest --requests 5000 --concurrency 32
+    python -m benchmarks.loadtest --mix order=60,cancel=20,orderbook=20 --symbols HBAR_USDT,cNGN_USDT
+    python -m benchmarks.loadtest --rpc http://127.0.0.1:8545 --contract 0x...
+"""
+
+import sys
+import json
+import time
+import random
+import asyncio
+import argparse
+from array import array
+
+import httpx
+
+DEFAULT_PAIRS = (("hedera", "polygon"), ("polygon", "hedera"))
+DEMO_PRIVATE_KEY = "0x" + "11" * 32
+
+
+class FakeSettlementClient(object):
+    '''
+    In-memory stand-in for SettlementClient.
+
+    Every account has an unlimited escrow balance. RPC-backed calls sleep
+    for rpc_latency seconds (blocking, like web3's HTTP provider) so the
+    event loop sees the same stalls it would against a real node.
+    '''
+
+    rpc_latency = 0.0
+    web3 = None  # token decimals resolve from configuration, never from a chain
+
+    def __init__(self, web3_provider=None, contract_address=None, private_key=None):
+        self.web3_provider = web3_provider
+        self.contract_address = contract_address
+        self.nonces = {}
+
+    def _rpc(self):
+        if self.rpc_latency:
+            time.sleep(self.rpc_latency)
+
+    def check_escrow_balance(self, user_address, token_address, token_decimals=18):
+        self._rpc()
+        return self._balance()
+
+    def check_escrow_balances(self, pairs, token_decimals=18):
+        self._rpc()  # one batched round trip
+        return {pair: self._balance() for pair in pairs}
+
+    @staticmethod
+    def _balance():
+        return {
+            "total": 10**12, "total_wei": 10**30,
+            "available": 10**12, "available_wei": 10**30,
+            "locked": 0, "locked_wei": 0,
+        }
+
+    def get_user_nonce(self, user_address, token_address):
+        self._rpc()
+        return self.nonces.get((user_address, token_address), 0)
+
+    def create_trade_signature(self, *args, **kwargs):
+        return "0x" + "00" * 65
+
+    def create_matching_engine_signature(self, *args, **kwargs):
+        return "0x" + "00" * 65
+
+    def settle_cross_chain_trade(self, *args, **kwargs):
+        self._rpc()
+        return {"success": True, "transaction_hash": "0x" + "00" * 32, "is_source_chain": kwargs.get("is_source_chain")}
+
+
+class StageTimer(object):
+    '''Wraps the app's stage entry points and records their durations in nanoseconds.'''
+
+    STAGES = ("validation", "matching", "serialization", "settlement")
+
+    def __init__(self):
+        self.samples = {stage: array("q") for stage in self.STAGES}
+        self.restore = []
+
+    def install(self):
+        from helper.api_helper import APIHelper
+        from helper.responses import FastJSONResponse
+        from src.orderbook import OrderBook
+
+        self._wrap_async(APIHelper, "validate_order_prerequisites", "validation", static=True)
+        self._wrap_async(APIHelper, "settle_trades_if_any", "settlement", static=True)
+        self._wrap(OrderBook, "process_order", "matching")
+        self._wrap(FastJSONResponse, "render", "serialization")
+
+    def uninstall(self):
+        for owner, name, original in reversed(self.restore):
+            setattr(owner, name, original)
+        self.restore = []
+
+    def _wrap(self, owner, name, stage):
+        original = owner.__dict__[name]
+        samples = self.samples[stage]
+
+        def timed(*args, **kwargs):
+            t0 = time.perf_counter_ns()
+            try:
+                return original(*args, **kwargs)
+            finally:
+                samples.append(time.perf_counter_ns() - t0)
+
+        setattr(owner, name, timed)
+        self.restore.append((owner, name, original))
+
+    def _wrap_async(self, owner, name, stage, static=False):
+        original = owner.__dict__[name]
+        function = original.__func__ if static else original
+        samples = self.samples[stage]
+
+        async def timed(*args, **kwargs):
+            t0 = time.perf_counter_ns()
+            try:
+                return await function(*args, **kwargs)
+            finally:
+                samples.append(time.perf_counter_ns() - t0)
+
+        setattr(owner, name, staticmethod(timed) if static else timed)
+        self.restore.append((owner, name, original))
+
+
+# ==================== WORKLOAD ====================
+
+
+def parse_mix(text):
+    mix = {}
+    for part in text.split(","):
+        name, weight = part.split("=")
+        mix[name.strip()] = float(weight)
+    unknown = set(mix) - {"order", "cancel", "orderbook"}
+    if unknown:
+        raise ValueError("Unknown request types in mix: %s" % ", ".join(sorted(unknown)))
+    return mix
+
+
+class Workload(object):
+    def __init__(self, symbols, pairs, mix, seed=1, accounts=20):
+        self.rng = random.Random(seed)
+        self.symbols = symbols
+        self.pairs = pairs
+        self.kinds = list(mix)
+        self.weights = [mix[k] for k in self.kinds]
+        self.accounts = ["0x%040x" % (i + 1) for i in range(accounts)]
+        self.resting = []  # (symbol, side, order_id) of orders known to rest
+        self.mids = {symbol: 0.05 for symbol in symbols}
+
+    def next_request(self):
+        kind = self.rng.choices(self.kinds, self.weights)[0]
+        if kind == "cancel" and not self.resting:
+            kind = "order"
+        symbol = self.rng.choice(self.symbols)
+        base_asset, quote_asset = symbol.split("_", 1)
+        if kind == "orderbook":
+            return kind, "/api/orderbook", {"symbol": symbol}
+        if kind == "cancel":
+            symbol, side, order_id = self.resting.pop(self.rng.randrange(len(self.resting)))
+            base_asset, quote_asset = symbol.split("_", 1)
+            return kind, "/api/cancel_order", {
+                "orderId": order_id, "side": side, "baseAsset": base_asset, "quoteAsset": quote_asset,
+            }
+        side = self.rng.choice(("bid", "ask"))
+        from_network, to_network = self.rng.choice(self.pairs)
+        if side == "ask":
+            from_network, to_network = to_network, from_network
+        offset = self.rng.randint(-2, 20) * 0.0001
+        price = self.mids[symbol] - offset if side == "bid" else self.mids[symbol] + offset
+        return kind, "/api/register_order", {
+            "account": self.rng.choice(self.accounts),
+            "baseAsset": base_asset,
+            "quoteAsset": quote_asset,
+            "side": side,
+            "type": "limit",
+            "price": "%.4f" % price,
+            "quantity": str(self.rng.randint(1, 50)),
+            "from_network": from_network,
+            "to_network": to_network,
+            "privateKey": DEMO_PRIVATE_KEY,
+        }
+
+    def observe(self, kind, payload, response):
+        if kind != "order" or response.status_code != 200:
+            return
+        order = response.json().get("order") or {}
+        if not order.get("trades"):
+            symbol = "%s_%s" % (payload["baseAsset"], payload["quoteAsset"])
+            self.resting.append((symbol, payload["side"], order.get("orderId")))
+
+
+# ==================== RUNNER ====================
+
+
+async def run(client, workload, requests, concurrency):
+    latencies = {"all": array("q")}
+    statuses = {}
+    queue = asyncio.Queue()
+    for _ in range(requests):
+        queue.put_nowait(None)
+
+    async def worker():
+        while True:
+            try:
+                queue.get_nowait()
+            except asyncio.QueueEmpty:
+                return
+            kind, path, payload = workload.next_request()
+            t0 = time.perf_counter_ns()
+            response = await client.post(path, json=payload)
+            elapsed = time.perf_counter_ns() - t0
+            latencies["all"].append(elapsed)
+            latencies.setdefault(kind, array("q")).append(elapsed)
+            key = "%s:%s" % (kind, response.status_code)
+            statuses[key] = statuses.get(key, 0) + 1
+            workload.observe(kind, payload, response)
+
+    started = time.perf_counter()
+    await asyncio.gather(*(worker() for _ in range(concurrency)))
+    return latencies, statuses, time.perf_counter() - started
+
+
+def summarize(samples):
+    ordered = sorted(samples)
+    if not ordered:
+        return {"count": 0}
+
+    def pct(q):
+        return round(ordered[min(len(ordered) - 1, int(round(q / 100.0 * (len(ordered) - 1))))] / 1000.0, 1)
+
+    histogram = {}
+    for value in ordered:
+        # log2 buckets in microseconds: "<=1us", "<=2us", "<=4us", ...
+        bucket = 1
+        while bucket * 1000 < value:
+            bucket *= 2
+        label = "<=%dus" % bucket
+        histogram[label] = histogram.get(label, 0) + 1
+    return {
+        "count": len(ordered),
+        "p50_us": pct(50),
+        "p90_us": pct(90),
+        "p99_us": pct(99),
+        "max_us": pct(100),
+        "histogram": histogram,
+    }
+
+
+def build_app(args):
+    import app as app_module
+
+    if args.rpc:
+        for network in app_module.SUPPORTED_NETWORKS.values():
+            network["rpc"] = args.rpc
+            if args.contract:
+                network["contract_address"] = args.contract
+    else:
+        FakeSettlementClient.rpc_latency = args.rpc_latency_ms / 1000.0
+        app_module.settlement_client_factory = FakeSettlementClient
+        app_module.settlement_client = FakeSettlementClient()
+        app_module.api_service.signer = None  # sign through the fake client's stubs
+    if args.private_key:
+        app_module.PRIVATE_KEY = args.private_key
+    app_module.api_service.require_client_signatures = not args.demo_signatures
+    app_module.order_books.clear()
+    return app_module.app
+
+
+async def main_async(args):
+    workload = Workload(
+        args.symbols.split(","),
+        [tuple(pair.split(":")) for pair in args.pairs.split(",")] if args.pairs else DEFAULT_PAIRS,
+        parse_mix(args.mix),
+        args.seed,
+    )
+    stages = None
+    if args.url:
+        client = httpx.AsyncClient(base_url=args.url, timeout=60.0)
+    else:
+        stages = StageTimer()
+        stages.install()
+        transport = httpx.ASGITransport(app=build_app(args))
+        client = httpx.AsyncClient(transport=transport, base_url="http://loadtest", timeout=60.0)
+    try:
+        async with client:
+            latencies, statuses, elapsed = await run(client, workload, args.requests, args.concurrency)
+    finally:
+        if stages is not None:
+            stages.uninstall()
+    report = {
+        "requests": args.requests,
+        "concurrency": args.concurrency,
+        "elapsed_s": round(elapsed, 3),
+        "requests_per_sec": round(args.requests / elapsed, 1) if elapsed else None,
+        "statuses": statuses,
+        "end_to_end": {kind: summarize(samples) for kind, samples in latencies.items()},
+    }
+    if stages is not None:
+        report["stages"] = {stage: summarize(samples) for stage, samples in stages.samples.items()}
+    return report
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="HTTP load test for the order API")
+    parser.add_argument("--requests", type=int, default=2000)
+    parser.add_argument("--concurrency", type=int, default=16)
+    parser.add_argument("--mix", default="order=70,cancel=15,orderbook=15")
+    parser.add_argument("--symbols", default="HBAR_USDT")
+    parser.add_argument("--pairs", help="network pairs as from:to,from:to")
+    parser.add_argument("--seed", type=int, default=1)
+    parser.add_argument("--url", help="load an already running server instead of the in-process app")
+    parser.add_argument("--rpc", help="local EVM node URL used for every supported network")
+    parser.add_argument("--contract", help="settlement contract address on the local node")
+    parser.add_argument("--private-key", help="matching engine key for the local node")
+    parser.add_argument("--rpc-latency-ms", type=float, default=0.0, help="simulated RPC latency of the fake client")
+    parser.add_argument("--demo-signatures", action="store_true", help="let the server sign for parties")
+    parser.add_argument("--output", help="write the JSON report here")
+    args = parser.parse_args(argv)
+
+    report = asyncio.run(main_async(args))
+    text = json.dumps(report, indent=2, sort_keys=True)
+    if args.output:
+        with open(args.output, "w", encoding="utf-8") as f:
+            f.write(text)
+    print(text)
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
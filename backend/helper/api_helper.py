@@ -1,5 +1,7 @@
 from fastapi import HTTPException, Request
 import json
+import uuid
+from typing import Optional
 
 from dotenv import load_dotenv
 
@@ -7,36 +9,38 @@ from dotenv import load_dotenv
 import logging
 
 from src.trade_settlement_client import SettlementClient
+from src import signing
+from src.signing import SigningService
+from src.settled_index import SettledTradeIndex
+from src.tokens import PRICE_DECIMALS, DecimalsUnavailable, TokenRegistry, to_decimal
 
 # Import the TradeSettlementClient
 # from orderbook.trade_settlement_client import (
 #     AllowanceManager,
 # )
 
-# Configure logging
-root = logging.getLogger()
-if root.handlers:
-    root.handlers.clear()
-
-LOG_FORMAT = (
-    "%(asctime)s %(levelname)s " "[%(filename)s:%(lineno)d %(funcName)s] " "%(message)s"
-)
-# Use %(pathname)s instead of %(filename)s if you want full path
-# e.g. "[%(pathname)s:%(lineno)d %(funcName)s]"
-
-logging.basicConfig(level=logging.INFO, format=LOG_FORMAT, datefmt="%Y-%m-%d %H:%M:%S")
 logger = logging.getLogger(__name__)
 load_dotenv()
 
+# Order ids restart at 0 on every boot and repeat across symbols; settlement ids carry this
+# run's id and the symbol so a fill never matches a settlement another trade made
+SETTLEMENT_RUN_ID = uuid.uuid4().hex[:16]
+
+
+def settlement_id(symbol: str, order_id, index: int = 0) -> str:
+    """On-chain settlement id of the index-th fill of order_id on symbol, unique across runs"""
+    fill = str(order_id) if index == 0 else "%s-%d" % (order_id, index)
+    return "%s:%s:%s" % (SETTLEMENT_RUN_ID, symbol, fill)
+
 
 class APIHelper:
 
     @staticmethod
     def get_token_address(symbol: str, TOKEN_ADDRESSES: dict) -> str:
         """Get token address from symbol"""
-        token_address = TOKEN_ADDRESSES.get(symbol.upper(), symbol)
-        print(token_address, "TOKEN_ADDRESS")
-        return token_address
+        if isinstance(TOKEN_ADDRESSES, TokenRegistry):
+            return TOKEN_ADDRESSES.address(symbol)
+        return TOKEN_ADDRESSES.get(symbol.upper(), symbol)
 
     @staticmethod
     def load_abi(abi_path):
@@ -60,16 +64,13 @@ class APIHelper:
         try:
             account = order_data["account"]
             side = order_data["side"]
-            quantity = float(order_data["quantity"])
-            price = float(order_data["price"])
+            quantity = to_decimal(order_data["quantity"])
+            price = to_decimal(order_data["price"])
 
             # Get token addresses
-            base_asset = APIHelper.get_token_address(
-                order_data["baseAsset"], TOKEN_ADDRESSES
-            )
-            quote_asset = APIHelper.get_token_address(
-                order_data["quoteAsset"], TOKEN_ADDRESSES
-            )
+            tokens = TokenRegistry.of(TOKEN_ADDRESSES)
+            base_asset = tokens.address(order_data["baseAsset"])
+            quote_asset = tokens.address(order_data["quoteAsset"])
 
             if side.lower() == "ask":
                 # Seller needs base asset in escrow
@@ -80,12 +81,13 @@ class APIHelper:
                 required_amount = quantity * price
                 token_to_check = quote_asset
 
-
-            print(settlement_client, "SETTLEMENT CLIENT")
+            # Compared in the token's base units, exactly
+            decimals = tokens.decimals(token_to_check, settlement_client.web3)
+            required_wei = tokens.to_wei(token_to_check, required_amount)
 
             # Check escrow balance
             balance_info = settlement_client.check_escrow_balance(
-                account, token_to_check
+                account, token_to_check, token_decimals=decimals
             )
 
             available = balance_info.get("available", 0)
@@ -100,7 +102,7 @@ class APIHelper:
                 "locked_escrow": balance_info.get("locked", 0),
             }
 
-            if available < required_amount:
+            if balance_info.get("available_wei", 0) < required_wei:
                 results["valid"] = False
                 results["errors"].append(
                     f"Insufficient available escrow balance. Required: {required_amount}, Available: {available}"
@@ -109,11 +111,126 @@ class APIHelper:
             return results
 
         except Exception as e:
-            logger.error(f"Error validating prerequisites: {e}")
+            logger.error("Error validating prerequisites: %s", e)
             results["valid"] = False
             results["errors"].append(f"Validation error: {str(e)}")
             return results
 
+    @staticmethod
+    async def verify_order_signature(message, signer: Optional[SigningService] = None) -> bool:
+        """
+        Check an order's client signature locally (ecrecover, no RPC).
+
+        The signature must come from the order's account and cover every field
+        of the order (signing.order_message_hash). Results are cached, so a
+        signature is only ever recovered once.
+        """
+        try:
+            message_hash = signing.order_message_hash(
+                message.account,
+                message.baseAsset,
+                message.quoteAsset,
+                message.side,
+                message.type,
+                message.timeInForce,
+                signing.to_wei(message.price or 0),
+                signing.to_wei(message.quantity),
+                message.from_network,
+                message.to_network,
+                message.receive_wallet or message.receiveWallet or message.account,
+                message.expireTime or 0,
+                message.salt,
+            )
+        except ValueError:
+            return False  # account or receive wallet is not an address
+        if signer is not None:
+            return await signer.verify_signature(message_hash, message.signature, message.account)
+        return signing.verify_signature(message_hash, message.signature, message.account)
+
+    @staticmethod
+    async def verify_amend_signature(message, signer: Optional[SigningService] = None) -> bool:
+        """Check an amend's client signature (signing.amend_message_hash) against its account."""
+        try:
+            message_hash = signing.amend_message_hash(
+                message.account,
+                message.baseAsset,
+                message.quoteAsset,
+                message.side,
+                message.orderId,
+                signing.to_wei(message.price or 0),
+                signing.to_wei(message.quantity or 0),
+                message.salt,
+            )
+        except ValueError:
+            return False  # account is not an address
+        if signer is not None:
+            return await signer.verify_signature(message_hash, message.signature, message.account)
+        return signing.verify_signature(message_hash, message.signature, message.account)
+
+    @staticmethod
+    async def check_counterparty_escrow(
+        fills,
+        order_data: dict,
+        settlement_client: SettlementClient,
+        TOKEN_ADDRESSES: dict,
+    ) -> set:
+        """
+        Order ids in fills (OrderBook.plan_fills) whose owners lack the escrow to settle them.
+
+        Every maker in the fill set is read in one batched call. A maker's
+        total escrow (available plus locked for its own resting orders) must
+        cover all of its fills, taken in fill order; fills past that point
+        are ruled out.
+        """
+        if not fills:
+            return set()
+        tokens = TokenRegistry.of(TOKEN_ADDRESSES)
+        base_asset = tokens.address(order_data["baseAsset"])
+        quote_asset = tokens.address(order_data["quoteAsset"])
+        web3 = settlement_client.web3
+
+        # Required amounts in base units, so the running balances below are exact
+        required = []
+        unfunded = set()
+        for order, quantity in fills:
+            try:
+                if order.side == "ask":
+                    # Maker sells base asset
+                    required.append((order, (order.account, base_asset), tokens.to_wei(base_asset, quantity, web3)))
+                else:
+                    required.append(
+                        (order, (order.account, quote_asset), tokens.quote_wei(quote_asset, quantity, order.price, web3))
+                    )
+            except DecimalsUnavailable as e:
+                # Neither checkable nor settleable without the token's decimals
+                logger.error("Skipping fill against order %s: %s", order.order_id, e)
+                unfunded.add(order.order_id)
+        if not required:
+            return unfunded
+
+        try:
+            balances = settlement_client.check_escrow_balances([pair for _, pair, _ in required])
+        except Exception as e:
+            logger.error("Error checking counterparty escrow: %s", e)
+            return unfunded
+
+        remaining = {}
+        for order, pair, amount in required:
+            if pair not in remaining:
+                balance = balances.get(pair) or {}
+                if "error" in balance:
+                    # Unknown balance: leave the fill to on-chain settlement, as before this check
+                    remaining[pair] = float("inf")
+                else:
+                    remaining[pair] = balance.get("total_wei", 0)
+            if remaining[pair] < amount:
+                unfunded.add(order.order_id)
+            else:
+                remaining[pair] -= amount
+        if unfunded:
+            logger.warning("Skipping %d resting order(s) without escrow to settle", len(unfunded))
+        return unfunded
+
     @staticmethod
     def create_trade_signature_for_user(
         party_addr: str,
@@ -148,7 +265,7 @@ class APIHelper:
             # return "0x" + "0" * 130  # Placeholder - replace with actual signature logic
 
         except Exception as e:
-            logger.error(f"Error creating signature: {e}")
+            logger.error("Error creating signature: %s", e)
             return ""
 
     @staticmethod
@@ -161,21 +278,32 @@ class APIHelper:
         TOKEN_ADDRESSES: dict,
         settlement_client: SettlementClient,
         REQUIRE_CLIENT_SIGNATURES: bool = False,
+        client_factory=SettlementClient,
+        signer: Optional[SigningService] = None,
+        settled_index: Optional[SettledTradeIndex] = None,
     ) -> dict:
         """
         Settle cross-chain trades using the new settlement contract.
         Handles both source and destination chain settlements.
+        With a signer, each trade's signatures are made in its pool instead of on the event loop.
+        With a settled_index, fills already settled on a chain are skipped there and new
+        settlements are recorded in it.
         """
         if not order_dict.get("trades"):
             return {"settled": False, "reason": "No trades to settle"}
 
         settlement_results = []
+        tokens = TokenRegistry.of(TOKEN_ADDRESSES)
+        # One client per chain for the whole batch: a sweep settles many fills on the same chains
+        clients = {}
+
+        def client_for(rpc, contract):
+            if (rpc, contract) not in clients:
+                clients[(rpc, contract)] = client_factory(rpc, contract, PRIVATE_KEY)
+            return clients[(rpc, contract)]
 
         try:
-            # Import SettlementClient
-            
-            
-            for trade in order_dict["trades"]:
+            for index, trade in enumerate(order_dict["trades"]):
                 # Extract party information
                 party1_addr = trade["party1"][0]
                 party1_side = trade["party1"][1]
@@ -213,22 +341,49 @@ class APIHelper:
                 source_chain_id = source_network_cfg.get("chain_id")
                 dest_chain_id = dest_network_cfg.get("chain_id")
 
-                # Create clients for both chains (using matching engine key)
-                client_source = SettlementClient(source_rpc, source_contract, PRIVATE_KEY)
-                client_dest = SettlementClient(dest_rpc, dest_contract, PRIVATE_KEY)
+                # Clients for both chains (using matching engine key)
+                client_source = client_for(source_rpc, source_contract)
+                client_dest = client_for(dest_rpc, dest_contract)
 
                 # Get token addresses
-                base_token = APIHelper.get_token_address(order_dict["baseAsset"], TOKEN_ADDRESSES)
-                quote_token = APIHelper.get_token_address(order_dict["quoteAsset"], TOKEN_ADDRESSES)
+                base_token = tokens.address(order_dict["baseAsset"])
+                quote_token = tokens.address(order_dict["quoteAsset"])
+
+                # Settled orders are keyed by id on-chain, so each further fill of a sweep gets its own
+                order_id = settlement_id(
+                    "%s_%s" % (order_dict["baseAsset"], order_dict["quoteAsset"]), order_dict["orderId"], index
+                )
+                if (
+                    settled_index is not None
+                    and settled_index.is_settled(order_id, source_chain_id)
+                    and settled_index.is_settled(order_id, dest_chain_id)
+                ):
+                    # Never settle the same fill twice; known without a chain read
+                    settlement_results.append({
+                        "trade": trade,
+                        "settlement_id": order_id,
+                        "settlement_result": {"success": True, "already_settled": True}
+                    })
+                    continue
+
+                # Quantities settle in the base token's own decimals; never in guessed ones
+                try:
+                    quantity_decimals = tokens.decimals(base_token, client_source.web3)
+                except DecimalsUnavailable as e:
+                    settlement_results.append({
+                        "trade": trade,
+                        "settlement_id": order_id,
+                        "settlement_result": {"success": False, "error": str(e)}
+                    })
+                    continue
 
                 # Get nonces
                 nonce1 = client_source.get_user_nonce(party1_addr, base_token)
                 nonce2 = client_dest.get_user_nonce(party2_addr, base_token)
 
                 # Trade parameters
-                order_id = str(order_dict["orderId"])
-                price = float(trade["price"])
-                quantity = float(trade["quantity"])
+                price = to_decimal(trade["price"])
+                quantity = to_decimal(trade["quantity"])
                 timestamp = int(trade["timestamp"])
 
                 # Get or create signatures
@@ -236,73 +391,151 @@ class APIHelper:
                 sig2 = trade.get("signature2") or (trade["party2"][8] if len(trade["party2"]) > 8 else None)
 
                 # Create signatures if not provided (demo mode)
-                if not sig1:
-                    if REQUIRE_CLIENT_SIGNATURES:
-                        settlement_results.append({
-                            "trade": trade,
-                            "settlement_result": {"success": False, "error": "Missing client signature for party1"}
-                        })
-                        continue
-                    sig1 = client_source.create_trade_signature(
-                        party1_priv_key, order_id, base_token, quote_token,
-                        price, quantity, party1_side, party1_receive_wallet,
-                        source_chain_id, dest_chain_id, timestamp, nonce1
-                    )
+                if REQUIRE_CLIENT_SIGNATURES and not (sig1 and sig2):
+                    settlement_results.append({
+                        "trade": trade,
+                        "settlement_result": {
+                            "success": False,
+                            "error": "Missing client signature for %s" % ("party1" if not sig1 else "party2"),
+                        }
+                    })
+                    continue
 
-                if not sig2:
-                    if REQUIRE_CLIENT_SIGNATURES:
-                        settlement_results.append({
-                            "trade": trade,
-                            "settlement_result": {"success": False, "error": "Missing client signature for party2"}
-                        })
+                # Client signatures are checked locally (cached ecrecover) so a bad one fails here,
+                # not in the contract after gas estimation
+                price_wei = signing.to_wei(price, PRICE_DECIMALS)
+                quantity_wei = signing.to_wei(quantity, quantity_decimals)
+                invalid = None
+                for party, signature, addr, side, wallet, nonce in (
+                    ("party1", sig1, party1_addr, party1_side, party1_receive_wallet, nonce1),
+                    ("party2", sig2, party2_addr, party2_side, party2_receive_wallet, nonce2),
+                ):
+                    if not signature:
                         continue
-                    sig2 = client_dest.create_trade_signature(
-                        party2_priv_key, order_id, base_token, quote_token,
-                        price, quantity, party2_side, party2_receive_wallet,
-                        source_chain_id, dest_chain_id, timestamp, nonce2
+                    message_hash = signing.trade_message_hash(
+                        order_id, base_token, quote_token, price_wei, quantity_wei,
+                        side, wallet, source_chain_id, dest_chain_id, timestamp, nonce
                     )
+                    if signer is not None:
+                        valid = await signer.verify_signature(message_hash, signature, addr)
+                    else:
+                        valid = signing.verify_signature(message_hash, signature, addr)
+                    if not valid:
+                        invalid = party
+                        break
+                if invalid:
+                    settlement_results.append({
+                        "trade": trade,
+                        "settlement_result": {"success": False, "error": "Invalid client signature for %s" % invalid}
+                    })
+                    continue
 
-                # Create matching engine signatures for both chains
-                me_sig_source = client_source.create_matching_engine_signature(
-                    PRIVATE_KEY, order_id, party1_addr, party2_addr,
-                    party1_receive_wallet, party2_receive_wallet,
-                    base_token, quote_token, price, quantity,
-                    is_source_chain=True, chain_id=source_chain_id
-                )
-
-                me_sig_dest = client_dest.create_matching_engine_signature(
-                    PRIVATE_KEY, order_id, party1_addr, party2_addr,
-                    party1_receive_wallet, party2_receive_wallet,
-                    base_token, quote_token, price, quantity,
-                    is_source_chain=False, chain_id=dest_chain_id
-                )
+                if signer is not None:
+                    # The trade's signatures as one batch, signed in the pool off the event loop
+                    jobs = [
+                        (PRIVATE_KEY, signing.matching_engine_message_hash(
+                            order_id, party1_addr, party2_addr,
+                            party1_receive_wallet, party2_receive_wallet,
+                            base_token, quote_token, price_wei, quantity_wei, True, source_chain_id
+                        )),
+                        (PRIVATE_KEY, signing.matching_engine_message_hash(
+                            order_id, party1_addr, party2_addr,
+                            party1_receive_wallet, party2_receive_wallet,
+                            base_token, quote_token, price_wei, quantity_wei, False, dest_chain_id
+                        )),
+                    ]
+                    if not sig1:
+                        jobs.append((party1_priv_key, signing.trade_message_hash(
+                            order_id, base_token, quote_token, price_wei, quantity_wei,
+                            party1_side, party1_receive_wallet,
+                            source_chain_id, dest_chain_id, timestamp, nonce1
+                        )))
+                    if not sig2:
+                        jobs.append((party2_priv_key, signing.trade_message_hash(
+                            order_id, base_token, quote_token, price_wei, quantity_wei,
+                            party2_side, party2_receive_wallet,
+                            source_chain_id, dest_chain_id, timestamp, nonce2
+                        )))
+                    signatures = await signer.sign(jobs)
+                    me_sig_source, me_sig_dest = signatures[0], signatures[1]
+                    party_signatures = iter(signatures[2:])
+                    sig1 = sig1 or next(party_signatures)
+                    sig2 = sig2 or next(party_signatures)
+                else:
+                    if not sig1:
+                        sig1 = client_source.create_trade_signature(
+                            party1_priv_key, order_id, base_token, quote_token,
+                            price, quantity, party1_side, party1_receive_wallet,
+                            source_chain_id, dest_chain_id, timestamp, nonce1,
+                            quantity_decimals=quantity_decimals,
+                        )
+
+                    if not sig2:
+                        sig2 = client_dest.create_trade_signature(
+                            party2_priv_key, order_id, base_token, quote_token,
+                            price, quantity, party2_side, party2_receive_wallet,
+                            source_chain_id, dest_chain_id, timestamp, nonce2,
+                            quantity_decimals=quantity_decimals,
+                        )
+
+                    # Create matching engine signatures for both chains
+                    me_sig_source = client_source.create_matching_engine_signature(
+                        PRIVATE_KEY, order_id, party1_addr, party2_addr,
+                        party1_receive_wallet, party2_receive_wallet,
+                        base_token, quote_token, price, quantity,
+                        is_source_chain=True, chain_id=source_chain_id,
+                        quantity_decimals=quantity_decimals,
+                    )
 
-                # Settle on source chain
-                logger.info(f"Settling on source chain (Chain ID: {source_chain_id})")
-                result_source = client_source.settle_cross_chain_trade(
-                    order_id, party1_addr, party2_addr,
-                    party1_receive_wallet, party2_receive_wallet,
-                    base_token, quote_token, price, quantity,
-                    party1_side, party2_side,
-                    source_chain_id, dest_chain_id,
-                    timestamp, nonce1, nonce2,
-                    sig1, sig2, me_sig_source, is_source_chain=True
-                )
+                    me_sig_dest = client_dest.create_matching_engine_signature(
+                        PRIVATE_KEY, order_id, party1_addr, party2_addr,
+                        party1_receive_wallet, party2_receive_wallet,
+                        base_token, quote_token, price, quantity,
+                        is_source_chain=False, chain_id=dest_chain_id,
+                        quantity_decimals=quantity_decimals,
+                    )
 
-                # Settle on destination chain
-                logger.info(f"Settling on destination chain (Chain ID: {dest_chain_id})")
-                result_dest = client_dest.settle_cross_chain_trade(
-                    order_id, party1_addr, party2_addr,
-                    party1_receive_wallet, party2_receive_wallet,
-                    base_token, quote_token, price, quantity,
-                    party1_side, party2_side,
-                    source_chain_id, dest_chain_id,
-                    timestamp, nonce1, nonce2,
-                    sig1, sig2, me_sig_dest, is_source_chain=False
-                )
+                # Settle on each chain the index does not already have it settled on
+                results = {}
+                for is_source_chain, client, chain_id, me_sig in (
+                    (True, client_source, source_chain_id, me_sig_source),
+                    (False, client_dest, dest_chain_id, me_sig_dest),
+                ):
+                    if settled_index is not None and settled_index.is_settled(order_id, chain_id):
+                        results[is_source_chain] = {
+                            "success": True,
+                            "already_settled": True,
+                            "is_source_chain": is_source_chain,
+                            "chain_id": chain_id,
+                        }
+                        continue
+                    logger.info(
+                        "Settling on %s chain (Chain ID: %s)",
+                        "source" if is_source_chain else "destination", chain_id
+                    )
+                    result = client.settle_cross_chain_trade(
+                        order_id, party1_addr, party2_addr,
+                        party1_receive_wallet, party2_receive_wallet,
+                        base_token, quote_token, price, quantity,
+                        party1_side, party2_side,
+                        source_chain_id, dest_chain_id,
+                        timestamp, nonce1, nonce2,
+                        sig1, sig2, me_sig, is_source_chain=is_source_chain,
+                        quantity_decimals=quantity_decimals,
+                    )
+                    if result["success"] and settled_index is not None:
+                        settled_index.add(
+                            order_id, chain_id,
+                            tx_hash=result.get("transaction_hash"),
+                            block_number=result.get("block_number", 0),
+                            is_source_chain=is_source_chain,
+                        )
+                    results[is_source_chain] = result
+                result_source, result_dest = results[True], results[False]
 
                 settlement_results.append({
                     "trade": trade,
+                    "settlement_id": order_id,
                     "settlement_result": {
                         "success": result_source["success"] and result_dest["success"],
                         "source_chain": result_source,
@@ -321,7 +554,7 @@ class APIHelper:
             }
 
         except Exception as e:
-            logger.error(f"Error during trade settlement: {e}")
+            logger.error("Error during trade settlement: %s", e)
             return {"settled": False, "error": str(e)}
 
     @staticmethod
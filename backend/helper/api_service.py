@@ -1,35 +1,147 @@
+from collections import OrderedDict
 from decimal import Decimal
-import json
 import logging
+import os
+import time
 from fastapi import HTTPException, Request
-from fastapi.responses import JSONResponse
+from fastapi.responses import Response
 
 from helper.api_helper import APIHelper
+from helper.messages import (
+    AmendMessage,
+    CancelMessage,
+    FundsQuery,
+    MassCancelMessage,
+    OrderBookQuery,
+    OrderMessage,
+    OrderQuery,
+    decode_payload,
+    decode_request,
+)
+from helper.profiler import ProfilerBusy, collapse, flamegraph_svg
+from helper.responses import (
+    AMEND_ACK,
+    CANCEL_ACK,
+    ERROR,
+    MASS_CANCEL_ACK,
+    ORDER_ACK,
+    ORDER_FOUND,
+    ORDERBOOK,
+    FastJSONResponse,
+    order_fields,
+    orderbook_json,
+)
 from src.trade_settlement_client import SettlementClient
 from src import OrderBook
+from src import metrics
+from src.analytics import BookAnalytics
+from src.event_store import check_symbol
+from src.tokens import TokenRegistry
 
 # from src.trade_settlement_client import AllowanceChecker, TradeSettlementClient
 
-root = logging.getLogger()
-if root.handlers:
-    root.handlers.clear()
-
-LOG_FORMAT = (
-    "%(asctime)s %(levelname)s " "[%(filename)s:%(lineno)d %(funcName)s] " "%(message)s"
-)
-
-logging.basicConfig(level=logging.INFO, format=LOG_FORMAT, datefmt="%Y-%m-%d %H:%M:%S")
 logger = logging.getLogger(__name__)
 
 
 class APIService:
-    def __init__(self):
-        pass
+    def __init__(self, event_store=None, require_client_signatures=True, tape_spill_dir=None):
+        # Optional persistent store every order book records its trades and order events to
+        self.event_store = event_store
+        # Directory trades older than a book's tape capacity spill to, one subdirectory per symbol
+        self.tape_spill_dir = tape_spill_dir
+        # Refuse to settle with server-side demo signatures when clients did not sign
+        self.require_client_signatures = require_client_signatures
+        # Binary order-entry gateway (helper/gateway.py), when enabled
+        self.gateway = None
+        # BookAnalytics per symbol, attached to a book the first time its analytics are asked for
+        self.analytics = {}
+        # SigningService that signs settlements in a worker pool; None signs on the settlement clients
+        self.signer = None
+        # SettledTradeIndex of fills known to have settled, per chain
+        self.settled_index = None
+        # EventIndexStore of indexed settlement contract events (src/event_indexer.py), when enabled
+        self.chain_events = None
+        # Network name : whether its RPC answered the last background connection check
+        self.rpc_status = {}
+        # (account, salt) of every signed order accepted, oldest first, so a signature is used once
+        self.used_salts = OrderedDict()
+        self.max_used_salts = 1000000
+
+    def claim_salt(self, account, salt):
+        '''Record a signed order's (account, salt); False if it was already used.'''
+        key = (account.lower(), salt)
+        if key in self.used_salts:
+            return False
+        self.used_salts[key] = None
+        if len(self.used_salts) > self.max_used_salts:
+            self.used_salts.popitem(last=False)
+        return True
+
+    def get_or_create_order_book(self, order_books, symbol):
+        if symbol not in order_books:
+            spill_dir = None
+            if self.tape_spill_dir:
+                spill_dir = os.path.join(self.tape_spill_dir, check_symbol(symbol))
+            order_books[symbol] = OrderBook(
+                symbol=symbol, event_store=self.event_store, tape_spill_dir=spill_dir
+            )
+        return order_books[symbol]
+
+    @staticmethod
+    def convert_trades(trades):
+        """Engine trade records as the JSON-friendly dicts settlement and clients expect"""
+        converted_trades = []
+        for trade in trades:
+            party1 = [
+                trade["party1"][0],
+                trade["party1"][1],
+                int(trade["party1"][2]) if trade["party1"][2] is not None else None,
+                (
+                    float(trade["party1"][3])
+                    if trade["party1"][3] is not None
+                    else None
+                ),
+                trade["party1"][4],
+                # source network for party1
+                trade["party1"][5] if len(trade["party1"]) > 5 else None,
+                # destination network for party1
+                trade["party1"][6] if len(trade["party1"]) > 6 else None,
+                # receive wallet on destination chain for party1
+                trade["party1"][7] if len(trade["party1"]) > 7 else None,
+            ]
+            party2 = [
+                trade["party2"][0],
+                trade["party2"][1],
+                int(trade["party2"][2]) if trade["party2"][2] is not None else None,
+                (
+                    float(trade["party2"][3])
+                    if trade["party2"][3] is not None
+                    else None
+                ),
+                trade["party2"][4],
+                # source network for party2 (where their assets originate)
+                trade["party2"][5] if len(trade["party2"]) > 5 else None,
+                # destination network for party2
+                trade["party2"][6] if len(trade["party2"]) > 6 else None,
+                # receive wallet on destination chain for party2
+                trade["party2"][7] if len(trade["party2"]) > 7 else None,
+            ]
+
+            converted_trade = {
+                "timestamp": int(trade["timestamp"]),
+                "price": float(trade["price"]),
+                "quantity": float(trade["quantity"]),
+                "time": int(trade["time"]),
+                "party1": party1,
+                "party2": party2,
+            }
+            converted_trades.append(converted_trade)
+        return converted_trades
 
     def register_startup_event(
         self, WEB3_PROVIDER, TRADE_SETTLEMENT_CONTRACT_ADDRESS, PRIVATE_KEY
     ) -> SettlementClient:
-        """Initialize settlement client on startup"""
+        """Initialize settlement client on startup; this makes no RPC call, see check_connection()"""
         global settlement_client, allowance_checker, allowance_manager
 
         # CONTRACT_ABI = APIHelper.load_abi("orderbook/settlement_abi.json")
@@ -40,15 +152,49 @@ class APIService:
                 WEB3_PROVIDER,
                 TRADE_SETTLEMENT_CONTRACT_ADDRESS,
                 PRIVATE_KEY,
+                settled_index=self.settled_index,
             )
 
             # allowance_checker = AllowanceChecker(WEB3_PROVIDER)
             logger.info("Settlement client initialized successfully")
             return settlement_client
         except Exception as e:
-            logger.error(f"Failed to initialize settlement client: {e}")
+            logger.error("Failed to initialize settlement client: %s", e)
             # You might want to exit here if settlement is critical
 
+    async def check_order(self, message, order_book, settlement_client, WEB3PROVIDER, TOKEN_ADDRESSES):
+        """
+        register_order's checks before matching, for orders that do not come over HTTP
+        (the binary gateway): signature and salt, balance and allowance, then the escrow
+        of the counterparties it would fill against. order_book is None for a symbol
+        with no book yet. Returns (error text or None, order ids to skip when matching).
+        """
+        error = None
+        if message.signature is not None:
+            if not await APIHelper.verify_order_signature(message, self.signer):
+                error = "Invalid order signature"
+            elif not self.claim_salt(message.account, message.salt):
+                error = "Order signature already used"
+        order = message.quote()
+        if error is None:
+            validation_result = await APIHelper.validate_order_prerequisites(
+                order_data=order,
+                settlement_client=settlement_client,
+                WEB3_PROVIDER=WEB3PROVIDER,
+                TOKEN_ADDRESSES=TOKEN_ADDRESSES,
+            )
+            if not validation_result["valid"]:
+                error = "; ".join(validation_result.get("errors", [])) or "Order validation failed"
+        if error is not None:
+            metrics.ORDERS.labels(message.symbol, message.side, "invalid").inc()
+            return error, None
+        if order_book is None:
+            return None, None
+        unfunded = await APIHelper.check_counterparty_escrow(
+            order_book.plan_fills(order), order, settlement_client, TOKEN_ADDRESSES
+        )
+        return None, unfunded
+
     async def register_order(
         self,
         request: Request,
@@ -60,26 +206,57 @@ class APIService:
         TRADE_SETTLEMENT_CONTRACT_ADDRESS=None,
         CONTRACT_ABI=None,
         PRIVATE_KEY=None,
+        settlement_client_factory=SettlementClient,
     ):
-        logger.info("GOT HERE")
+        clock = time.perf_counter_ns
+        stage = metrics.STAGE_LATENCY
+        started = t0 = clock()
+        # Malformed messages are rejected with a 422 naming the bad field
+        message = await decode_request(request, OrderMessage)
         try:
-            payload_json = await APIHelper.handlePayloadJson(request)
-
-            # payload_json = json.loads(payload)
-            symbol = "%s_%s" % (payload_json["baseAsset"], payload_json["quoteAsset"])
+            symbol = message.symbol
+            _order = message.quote()
+            t1 = clock()
+            stage.labels("parse").observe_ns(t1 - t0)
+
+            # Step 0: Reject badly signed orders before any RPC or matching (local ecrecover, cached)
+            if message.signature is not None:
+                if not await APIHelper.verify_order_signature(message, self.signer):
+                    metrics.ORDERS.labels(symbol, message.side, "invalid").inc()
+                    return ERROR.response(400, message="Invalid order signature")
+                # Claimed only once verified, with no await in between: a replay of a signed order
+                # (or a concurrent copy of it) is refused, and a forged one burns no salt
+                if not self.claim_salt(message.account, message.salt):
+                    metrics.ORDERS.labels(symbol, message.side, "invalid").inc()
+                    return ERROR.response(400, message="Order signature already used")
+                t0, t1 = t1, clock()
+                stage.labels("signature").observe_ns(t1 - t0)
 
             # Step 1: Validate order prerequisites (balance and allowance)
-            logger.info(f"Validating prerequisites for order: {payload_json}")
+            # Never log the raw payload: it carries the client's private key and signatures
+            logger.debug(
+                "Validating prerequisites for order",
+                extra={
+                    "symbol": symbol,
+                    "account": message.account,
+                    "side": message.side,
+                    "price": message.price,
+                    "quantity": message.quantity,
+                },
+            )
             validation_result = await APIHelper.validate_order_prerequisites(
-                order_data=payload_json,
+                order_data=_order,
                 settlement_client=settlement_client,
                 WEB3_PROVIDER=WEB3PROVIDER,
                 TOKEN_ADDRESSES=TOKEN_ADDRESSES,
             )
+            t0 = clock()
+            stage.labels("validation").observe_ns(t0 - t1)
 
             if not validation_result["valid"]:
-                logger.warning(f"Order validation failed: {validation_result}")
-                return JSONResponse(
+                logger.warning("Order validation failed: %s", validation_result)
+                metrics.ORDERS.labels(symbol, message.side, "invalid").inc()
+                return FastJSONResponse(
                     content={
                         "message": "Order validation failed",
                         "errors": validation_result.get("errors", []),
@@ -89,208 +266,250 @@ class APIService:
                     status_code=400,
                 )
 
-            logger.info(f"Order validation passed: {validation_result['checks']}")
+            logger.debug("Order validation passed: %s", validation_result["checks"])
 
             # Step 2: Process the order in the order book
-            if symbol not in order_books:
-                order_books[symbol] = OrderBook()
-
-            order_book = order_books[symbol]
-
-            _order = {
-                "type": payload_json.get("type", "limit"),
-                "trade_id": payload_json["account"],
-                "from_network": payload_json["from_network"],
-                "to_network": payload_json["to_network"],
-                "receive_wallet": payload_json.get("receive_wallet")
-                or payload_json.get("receiveWallet"),
-                "account": payload_json["account"],
-                "price": Decimal(payload_json["price"]),
-                "quantity": Decimal(payload_json["quantity"]),
-                "side": payload_json["side"],
-                "baseAsset": payload_json["baseAsset"],
-                "quoteAsset": payload_json["quoteAsset"],
-                "private_key": payload_json["privateKey"],
-            }
+            order_book = self.get_or_create_order_book(order_books, symbol)
+
+            # Plan the whole fill set first and read every counterparty's escrow in one batch;
+            # makers who could not settle are skipped, the order sweeps on to the next ones
+            unfunded = await APIHelper.check_counterparty_escrow(
+                order_book.plan_fills(_order), _order, settlement_client, TOKEN_ADDRESSES
+            )
+            t1 = clock()
+            stage.labels("counterparty_escrow").observe_ns(t1 - t0)
 
-            process_result = order_book.process_order(_order, False, False)
+            t0 = clock()
+            process_result = order_book.process_order(_order, False, False, exclude=unfunded)
+            t1 = clock()
+            stage.labels("matching").observe_ns(t1 - t0)
 
             # This is the Failure case
             if not process_result["success"]:
-                return JSONResponse(
-                    content={"message": process_result["data"], "status_code": 0},
-                    status_code=400,
-                )
+                metrics.ORDERS.labels(symbol, _order["side"], "rejected").inc()
+                return ERROR.response(400, message=process_result["message"])
 
             trades, order, task_id, next_best_order = process_result["data"]
-
+            metrics.ORDERS.labels(symbol, _order["side"], "accepted").inc()
+            if trades:
+                metrics.FILLS.labels(symbol).inc(len(trades))
+                if self.gateway is not None:
+                    # Resting gateway orders hit by this order get their execution reports
+                    self.gateway.notify_trades(symbol, trades)
+
+            filled = sum((trade["quantity"] for trade in trades), Decimal(0))
             if order is None:
+                # Filled (or dropped) without resting: report the id the book assigned it
                 order = _order.copy()
-                order["order_id"] = 1
-
-            assert order is not None
+                order["order_id"] = order_book.next_order_id
+                resting = Decimal(0)
+            else:
+                resting = order["quantity"]
+            # IOC and market remainders are cancelled, an unfillable FOK order is killed whole
+            cancelled = message.quantity - filled - resting
+            if resting:
+                status = "partially_filled" if filled else "new"
+            elif not cancelled:
+                status = "filled"
+            else:
+                status = "killed" if message.timeInForce == "FOK" else "cancelled"
 
             # Convert trades to the expected format
-            converted_trades = []
-            for trade in trades:
-                party1 = [
-                    trade["party1"][0],
-                    trade["party1"][1],
-                    int(trade["party1"][2]) if trade["party1"][2] is not None else None,
-                    (
-                        float(trade["party1"][3])
-                        if trade["party1"][3] is not None
-                        else None
-                    ),
-                    trade["party1"][4],
-                    # source network for party1
-                    trade["party1"][5] if len(trade["party1"]) > 5 else None,
-                    # destination network for party1
-                    trade["party1"][6] if len(trade["party1"]) > 6 else None,
-                    # receive wallet on destination chain for party1
-                    trade["party1"][7] if len(trade["party1"]) > 7 else None,
-                ]
-                party2 = [
-                    trade["party2"][0],
-                    trade["party2"][1],
-                    int(trade["party2"][2]) if trade["party2"][2] is not None else None,
-                    (
-                        float(trade["party2"][3])
-                        if trade["party2"][3] is not None
-                        else None
-                    ),
-                    trade["party2"][4],
-                    # source network for party2 (where their assets originate)
-                    trade["party2"][5] if len(trade["party2"]) > 5 else None,
-                    # destination network for party2
-                    trade["party2"][6] if len(trade["party2"]) > 6 else None,
-                    # receive wallet on destination chain for party2
-                    trade["party2"][7] if len(trade["party2"]) > 7 else None,
-                ]
-
-                converted_trade = {
-                    "timestamp": int(trade["timestamp"]),
-                    "price": float(trade["price"]),
-                    "quantity": float(trade["quantity"]),
-                    "time": int(trade["time"]),
-                    "party1": party1,
-                    "party2": party2,
-                }
-                converted_trades.append(converted_trade)
+            converted_trades = self.convert_trades(trades)
 
             # Convert order to a serializable format
             order_dict = {
                 "orderId": int(order["order_id"]),
                 "account": order["account"],
                 "price": float(order["price"]),
-                "quantity": float(order["quantity"]),
+                # What rests in the book; the rest of the ordered quantity is filled or cancelled
+                "quantity": float(resting),
+                "status": status,
+                "filledQuantity": float(filled),
+                "cancelledQuantity": float(cancelled),
                 "side": order["side"],
                 "baseAsset": order["baseAsset"],
                 "quoteAsset": order["quoteAsset"],
                 "trade_id": order["trade_id"],
                 "trades": converted_trades,
-                "isValid": True if order["order_id"] != 0 else True,
+                "isValid": bool(filled or resting),
                 "timestamp": order["timestamp"],
             }
 
             next_best_order_dict = None
             if next_best_order is not None:
-                next_best_order_dict = {
-                    "orderId": int(next_best_order.order_id),
-                    "account": next_best_order.account,
-                    "price": float(next_best_order.price),
-                    "quantity": float(next_best_order.quantity),
-                    "side": next_best_order.side,
-                    "baseAsset": next_best_order.baseAsset,
-                    "quoteAsset": next_best_order.quoteAsset,
-                    "trade_id": next_best_order.trade_id,
-                    "trades": [],
-                    "isValid": True if next_best_order.order_id != 0 else True,
-                    "timestamp": next_best_order.timestamp,
-                }
+                next_best_order_dict = order_fields(next_best_order)
+
+            t0 = clock()
+            stage.labels("conversion").observe_ns(t0 - t1)
 
             # Step 3: Settle trades if any exist
             settlement_info = {"settled": False}
             if converted_trades:
-                logger.info(f"Attempting to settle {len(converted_trades)} trade(s)")
+                logger.info("Attempting to settle %d trade(s)", len(converted_trades))
                 # pass supported networks and settlement contract details into the helper
                 # Enforce client-signed signatures: require client-provided signatures and do not fall back to server demo signatures
-                settlement_info = await APIHelper.settle_trades_if_any(
-                    order_dict,
-                    SUPPORTED_NETWORKS,
-                    TRADE_SETTLEMENT_CONTRACT_ADDRESS,
-                    CONTRACT_ABI,
-                    PRIVATE_KEY,
-                    TOKEN_ADDRESSES,
-                    REQUIRE_CLIENT_SIGNATURES=True,
+                metrics.SETTLEMENT_IN_FLIGHT.inc(len(converted_trades))
+                try:
+                    settlement_info = await APIHelper.settle_trades_if_any(
+                        order_dict,
+                        SUPPORTED_NETWORKS,
+                        TRADE_SETTLEMENT_CONTRACT_ADDRESS,
+                        CONTRACT_ABI,
+                        PRIVATE_KEY,
+                        TOKEN_ADDRESSES,
+                        settlement_client=settlement_client,
+                        REQUIRE_CLIENT_SIGNATURES=self.require_client_signatures,
+                        client_factory=settlement_client_factory,
+                        signer=self.signer,
+                        settled_index=self.settled_index,
+                    )
+                finally:
+                    metrics.SETTLEMENT_IN_FLIGHT.dec(len(converted_trades))
+                if not settlement_info.get("settled"):
+                    metrics.ERRORS.labels("settlement").inc()
+                # The full result embeds the trade party arrays, private keys included; log a summary
+                logger.info(
+                    "Settlement result: settled=%s, %s/%s successful",
+                    settlement_info.get("settled"),
+                    settlement_info.get("successful_settlements"),
+                    settlement_info.get("total_trades"),
                 )
-                logger.info(f"Settlement result: {settlement_info}")
-
-            logger.info(
-                f"Order processed successfully with {len(converted_trades)} trades"
-            )
-
-            return JSONResponse(
-                content={
-                    "message": "Order registered successfully",
-                    "order": order_dict,
-                    "nextBest": next_best_order_dict,
-                    "taskId": task_id,
-                    "validation_details": validation_result.get("checks", {}),
-                    "settlement_info": settlement_info,
-                    "status_code": 1,
-                },
-                status_code=200,
+                t1 = clock()
+                stage.labels("settlement").observe_ns(t1 - t0)
+                t0 = t1
+
+            logger.info("Order processed successfully with %d trades", len(converted_trades))
+
+            response = ORDER_ACK.response(
+                order=order_dict,
+                nextBest=next_best_order_dict,
+                taskId=task_id,
+                validation_details=validation_result.get("checks", {}),
+                settlement_info=settlement_info,
             )
+            t1 = clock()
+            stage.labels("serialization").observe_ns(t1 - t0)
+            stage.labels("total").observe_ns(t1 - started)
+            return response
 
         except Exception as e:
-            logger.error(f"Error in register_order: {e}")
+            metrics.ERRORS.labels(type(e).__name__).inc()
+            logger.error("Error in register_order: %s", e)
             raise HTTPException(status_code=500, detail=str(e))
 
     async def cancel_order(self, request: Request, order_books):
+        message = await decode_request(request, CancelMessage)
         try:
-            payload_json = await APIHelper.handlePayloadJson(request)
-            order_id = payload_json["orderId"]
-            side = payload_json["side"]
-            symbol = "%s_%s" % (payload_json["baseAsset"], payload_json["quoteAsset"])
+            order_id = message.orderId
+            side = message.side
 
-            order_book = order_books[symbol]
+            order_book = order_books[message.symbol]
             order = (
                 order_book.bids.get_order(order_id)
                 if order_id in order_book.bids.order_map
                 else order_book.asks.get_order(order_id)
             )
             order_book.cancel_order(side, order_id)
+            if self.gateway is not None and order.side == side:
+                self.gateway.notify_cancelled(message.symbol, [order])
 
-            # Convert order to a serializable format
-            order_dict = {
-                "orderId": int(order_id),
-                "account": order.account,
-                "price": float(order.price),
-                "quantity": float(order.quantity),
-                "side": order.side,
-                "baseAsset": order.baseAsset,
-                "quoteAsset": order.quoteAsset,
-                "trade_id": order.trade_id,
-                "trades": [],
-                "isValid": False,
-                "timestamp": order.timestamp,
-            }
+            return CANCEL_ACK.response(order=order_fields(order, is_valid=False))
+        except Exception as e:
+            raise HTTPException(status_code=500, detail=str(e))
 
-            return JSONResponse(
-                content={
-                    "message": "Order cancelled successfully",
-                    "order": order_dict,
-                    "status_code": 1,
-                }
+    async def mass_cancel(self, request: Request, order_books):
+        message = await decode_request(request, MassCancelMessage)
+        try:
+            if message.symbol is None:
+                symbols = list(order_books)
+            else:
+                symbols = [message.symbol] if message.symbol in order_books else []
+
+            orders = []
+            for symbol in symbols:
+                cancelled = order_books[symbol].mass_cancel(
+                    message.account,
+                    side=message.side,
+                    from_network=message.from_network,
+                    to_network=message.to_network,
+                )
+                if cancelled and self.gateway is not None:
+                    self.gateway.notify_cancelled(symbol, cancelled)
+                orders.extend(cancelled)
+
+            logger.info(
+                "Mass cancel",
+                extra={"account": message.account, "symbol": message.symbol, "cancelled": len(orders)},
             )
+            return MASS_CANCEL_ACK.response(
+                cancelled=len(orders),
+                orders=[order_fields(order, is_valid=False) for order in orders],
+            )
+        except Exception as e:
+            raise HTTPException(status_code=500, detail=str(e))
+
+    def expire_orders(self, order_books, now=None):
+        """Remove GTT orders past their expire_time from every book; returns how many expired"""
+        count = 0
+        for symbol, order_book in list(order_books.items()):
+            expired = order_book.expire_orders(now)
+            if not expired:
+                continue
+            for order in expired:
+                metrics.ORDERS.labels(symbol, order.side, "expired").inc()
+            if self.gateway is not None:
+                self.gateway.notify_cancelled(symbol, expired)
+            count += len(expired)
+        if count:
+            logger.debug("Expired %d order(s)", count)
+        return count
+
+    async def modify_order(self, request: Request, order_books):
+        message = await decode_request(request, AmendMessage)
+        try:
+            if not await APIHelper.verify_amend_signature(message, self.signer):
+                return ERROR.response(400, message="Invalid amend signature")
+
+            order_book = order_books.get(message.symbol)
+            tree = None
+            if order_book is not None:
+                tree = order_book.bids if message.side == "bid" else order_book.asks
+            # Someone else's order is reported exactly like a missing one
+            if (
+                tree is None
+                or not tree.order_exists(message.orderId)
+                or str(tree.get_order(message.orderId).account).lower() != message.account.lower()
+            ):
+                return FastJSONResponse(
+                    content={"message": "Order not found", "order": None, "status_code": 0},
+                    status_code=404,
+                )
+
+            order = tree.get_order(message.orderId)
+            # An amend only moves a resting order, it never matches: a price that would trade
+            # must go through register_order (and its escrow checks and settlement) instead
+            if message.price is not None and order_book.crosses(message.side, message.price):
+                return ERROR.response(
+                    400, message="Amended price crosses the book; cancel and place a new order"
+                )
+            if not self.claim_salt(message.account, message.salt):
+                return ERROR.response(400, message="Amend signature already used")
+
+            order_update = {
+                "side": message.side,
+                "price": message.price if message.price is not None else order.price,
+                "quantity": message.quantity if message.quantity is not None else order.quantity,
+            }
+            order_book.modify_order(message.orderId, order_update)
+
+            return AMEND_ACK.response(order=order_fields(tree.get_order(message.orderId)))
         except Exception as e:
             raise HTTPException(status_code=500, detail=str(e))
 
     def get_order(self, payload: str, order_books):
+        order_id = decode_payload(payload, OrderQuery).orderId
         try:
-            payload_json = json.loads(payload)
-            order_id = payload_json["orderId"]
 
             order = None
             for symbol, order_book in order_books.items():
@@ -305,31 +524,11 @@ class APIService:
                     )
 
             if order is not None:
-                order_dict = {
-                    "orderId": (
-                        int(order.order_id) if order.order_id is not None else None
-                    ),
-                    "account": order.account,
-                    "price": float(order.price),
-                    "quantity": float(order.quantity),
-                    "side": order.side,
-                    "baseAsset": order.baseAsset,
-                    "quoteAsset": order.quoteAsset,
-                    "trade_id": order.trade_id,
-                    "trades": [],
-                    "isValid": True if order.order_id is not None else False,
-                    "timestamp": order.timestamp,
-                }
-
-                return JSONResponse(
-                    content={
-                        "message": "Order retrieved successfully",
-                        "order": order_dict,
-                        "status_code": 1,
-                    }
+                return ORDER_FOUND.response(
+                    order=order_fields(order, is_valid=order.order_id is not None)
                 )
             else:
-                return JSONResponse(
+                return FastJSONResponse(
                     content={
                         "message": "Order not found",
                         "order": None,
@@ -340,34 +539,157 @@ class APIService:
             raise HTTPException(status_code=500, detail=str(e))
 
     async def get_orderbook(self, request: Request, order_books):
+        symbol = (await decode_request(request, OrderBookQuery)).symbol
         try:
-            payload_json = await APIHelper.handlePayloadJson(request)
+            order_book = self.get_or_create_order_book(order_books, symbol)
 
-            symbol = payload_json["symbol"]
+            # Encoded once per book change and reused by every poll in between
+            return ORDERBOOK.response(orderbook=orderbook_json(order_book, symbol))
+        except Exception as e:
+            raise HTTPException(status_code=500, detail=str(e))
 
-            if symbol not in order_books:
-                order_book = OrderBook()
-                order_books[symbol] = order_book
-            else:
-                order_book = order_books[symbol]
+    def get_candles(self, symbol, resolution, order_books, limit=None, start=None, end=None):
+        # A read: it never creates a book for the symbol it is asked about
+        order_book = order_books.get(symbol)
+        if order_book is None:
+            return ERROR.response(404, message="Unknown symbol %s" % symbol)
+        try:
+            try:
+                candles = order_book.get_candles(resolution, limit, start, end)
+            except ValueError as e:
+                return ERROR.response(400, message=str(e))
+
+            return FastJSONResponse(
+                content={
+                    "message": "Candles retrieved successfully",
+                    "symbol": symbol,
+                    "resolution": resolution,
+                    "candles": candles,
+                    "status_code": 1,
+                }
+            )
+        except Exception as e:
+            raise HTTPException(status_code=500, detail=str(e))
+
+    def get_analytics(self, symbol, order_books, levels=20, size=None):
+        if levels < 1 or (size is not None and not size > 0):
+            return ERROR.response(400, message="levels must be at least 1 and size positive")
+        # A read: no book, and no BookAnalytics listener, for a symbol that is not traded
+        order_book = order_books.get(symbol)
+        if order_book is None:
+            return ERROR.response(404, message="Unknown symbol %s" % symbol)
+        try:
+            analytics = self.analytics.get(symbol)
+            if analytics is None:
+                analytics = self.analytics[symbol] = BookAnalytics.attach(order_book)
+
+            return FastJSONResponse(
+                content={
+                    "message": "Analytics retrieved successfully",
+                    "symbol": symbol,
+                    "analytics": analytics.summary(levels=levels, size=size),
+                    "status_code": 1,
+                }
+            )
+        except Exception as e:
+            raise HTTPException(status_code=500, detail=str(e))
 
-            result = order_book.get_orderbook(payload_json["symbol"])
+    def simulate_order(self, symbol, side, quantity, from_network, to_network, order_books, price=None):
+        # A read: it never creates a book for the symbol it is asked about
+        order_book = order_books.get(symbol)
+        if order_book is None:
+            return ERROR.response(404, message="Unknown symbol %s" % symbol)
+        try:
+            try:
+                simulation = order_book.simulate(side, quantity, (from_network, to_network), price=price)
+            except ValueError as e:
+                return ERROR.response(400, message=str(e))
 
-            return JSONResponse(
+            return FastJSONResponse(
                 content={
-                    "message": "Order book retrieved successfully",
-                    "orderbook": result,
+                    "message": "Simulation completed successfully",
+                    "symbol": symbol,
+                    "simulation": simulation,
                     "status_code": 1,
                 }
             )
         except Exception as e:
             raise HTTPException(status_code=500, detail=str(e))
 
+    def get_settlement_status(self, settlement_id):
+        """Where a settlement id (the settlement_id of a settlement result) has settled"""
+        if self.settled_index is None:
+            return ERROR.response(404, message="Settlement index is not enabled")
+        try:
+            settlements = self.settled_index.get(settlement_id)
+        except ValueError:
+            return ERROR.response(400, message="Invalid settlement id")
+        return FastJSONResponse(
+            content={
+                "message": "Settlement status retrieved successfully",
+                "settlementId": settlement_id,
+                "settled": bool(settlements),
+                "settlements": settlements,
+                "status_code": 1,
+            }
+        )
+
+    def get_escrow_activity(self, network, user, token, SUPPORTED_NETWORKS, TOKEN_ADDRESSES, limit=100):
+        """Escrow flows and recent history of user in token on network, from indexed events only"""
+        if self.chain_events is None:
+            return ERROR.response(404, message="Event indexing is not enabled")
+        network_cfg = SUPPORTED_NETWORKS.get(network)
+        if network_cfg is None:
+            return ERROR.response(400, message="Unknown network %s" % network)
+        # The token's deployment on this network when it has its own (cNGN_BSC for cNGN on bsc)
+        token_address = TokenRegistry.of(TOKEN_ADDRESSES).address(token, network)
+        chain_id = network_cfg["chain_id"]
+        try:
+            escrow = self.chain_events.escrow_summary(chain_id, user, token_address)
+            history = self.chain_events.history(chain_id, user, token_address, limit=max(1, min(limit, 1000)))
+        except ValueError as e:
+            return ERROR.response(400, message=str(e))  # user or token is not an address
+        checkpoint = self.chain_events.checkpoint(chain_id)
+
+        return FastJSONResponse(
+            content={
+                "message": "Escrow activity retrieved successfully",
+                "network": network,
+                "indexedBlock": checkpoint[0] if checkpoint else None,
+                # uint256 amounts go out as decimal strings, JSON numbers cannot hold them exactly
+                "escrow": {key: value if key == "settlements" else str(value) for key, value in escrow.items()},
+                "events": history,
+                "status_code": 1,
+            }
+        )
+
+    async def capture_profile(self, profiler, seconds=10, interval_ms=5, output="collapsed"):
+        if output not in ("collapsed", "svg"):
+            return FastJSONResponse(
+                content={"message": "format must be 'collapsed' or 'svg'", "status_code": 0},
+                status_code=400,
+            )
+        try:
+            stacks = await profiler.profile(seconds, interval_ms / 1000.0)
+        except ProfilerBusy as e:
+            return FastJSONResponse(content={"message": str(e), "status_code": 0}, status_code=409)
+        except Exception as e:
+            raise HTTPException(status_code=500, detail=str(e))
+
+        if output == "svg":
+            title = "GIVEX API, %ss at %sms, %d samples" % (seconds, interval_ms, sum(stacks.values()))
+            return Response(
+                content=flamegraph_svg(stacks, title=title),
+                media_type="image/svg+xml",
+                headers={"Content-Disposition": 'attachment; filename="flamegraph.svg"'},
+            )
+        return Response(content=collapse(stacks), media_type="text/plain; charset=utf-8")
+
     def get_settlement_address(self, TRADE_SETTLEMENT_CONTRACT_ADDRESS):
         try:
             if not TRADE_SETTLEMENT_CONTRACT_ADDRESS:
                 raise "Trade settlement address not set"
-            return JSONResponse(
+            return FastJSONResponse(
                 content={
                     "status_code": 200,
                     "message": "Settlement Address",
@@ -378,10 +700,10 @@ class APIService:
             raise HTTPException(status_code=500, detail=str(e))
 
     def check_available_funds(self, order_books, payload):
+        query = decode_payload(payload, FundsQuery)
         try:
-            payload_json = json.loads(payload)
-            account = payload_json["account"]
-            asset = payload_json["asset"]
+            account = query.account
+            asset = query.asset
 
             # Calculate total locked funds across all order books
             total_locked_amount = Decimal("0")
@@ -394,24 +716,24 @@ class APIService:
                 # Check bids (buying orders)
                 if quote_asset == asset:  # If quote asset matches, check bids
                     for order_id, order in order_book.bids.order_map.items():
-                        if order["account"].lower() == account.lower():
+                        if order.account.lower() == account.lower():
                             # For bids, the locked amount is price * quantity in quote asset
-                            locked_amount = order["price"] * order["quantity"]
+                            locked_amount = order.price * order.quantity
                             total_locked_amount += locked_amount
 
                 # Check asks (selling orders)
                 if base_asset == asset:  # If base asset matches, check asks
                     for order_id, order in order_book.asks.order_map.items():
-                        if order["account"].lower() == account.lower():
+                        if order.account.lower() == account.lower():
                             # For asks, the locked amount is just the quantity in base asset
-                            total_locked_amount += order["quantity"]
+                            total_locked_amount += order.quantity
 
-            return JSONResponse(
+            return FastJSONResponse(
                 content={
                     "message": "Available funds checked successfully",
                     "account": account,
                     "asset": asset,
-                    "lockedAmount": float(total_locked_amount),
+                    "lockedAmount": total_locked_amount,
                     "status_code": 1,
                 }
             )
@@ -425,7 +747,7 @@ class APIService:
         """Check if settlement system is operational"""
         try:
             if not settlement_client:
-                return JSONResponse(
+                return FastJSONResponse(
                     content={
                         "status": "unhealthy",
                         "message": "Settlement client not initialized",
@@ -434,10 +756,21 @@ class APIService:
                     status_code=503,
                 )
 
-            # Check if web3 is connected
-            web3_connected = settlement_client.web3.isConnected()
+            # Answered from the background connection check, never by a blocking RPC call here
+            web3_connected = settlement_client.connected
+            if web3_connected is None:
+                return FastJSONResponse(
+                    content={
+                        "status": "starting",
+                        "message": "Connection check pending",
+                        "web3_connected": None,
+                        "networks": self.rpc_status,
+                        "contract_address": TRADE_SETTLEMENT_CONTRACT_ADDRESS,
+                    },
+                    status_code=503,
+                )
 
-            return JSONResponse(
+            return FastJSONResponse(
                 content={
                     "status": "healthy" if web3_connected else "degraded",
                     "message": (
@@ -446,12 +779,13 @@ class APIService:
                         else "Web3 connection issues"
                     ),
                     "web3_connected": web3_connected,
+                    "networks": self.rpc_status,
                     "contract_address": TRADE_SETTLEMENT_CONTRACT_ADDRESS,
                 },
                 status_code=200 if web3_connected else 503,
             )
         except Exception as e:
-            return JSONResponse(
+            return FastJSONResponse(
                 content={
                     "status": "unhealthy",
                     "message": f"Settlement health check failed: {str(e)}",
@@ -474,7 +808,7 @@ class APIService:
                 token_decimals=payload_json.get("decimals", 18),
             )
 
-            return JSONResponse(
+            return FastJSONResponse(
                 content={
                     "message": "Balance retrieved successfully",
                     "balance": balance,
@@ -482,5 +816,5 @@ class APIService:
                 }
             )
         except Exception as e:
-            logger.error(f"Error checking escrow balance: {e}")
+            logger.error("Error checking escrow balance: %s", e)
             raise HTTPException(status_code=500, detail=str(e))
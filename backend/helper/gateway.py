@@ -0,0 +1,474 @@
+"""
+Binary order-entry gateway
+
+Fixed-layout little-endian frames over a persistent TCP connection or a
+binary WebSocket, routed straight into OrderBook without an HTTP request
+cycle per order. Intended for co-located market makers.
+
+Every frame starts with an 8-byte header:
+
+    u16 length      whole frame, header included
+    u16 msg_type
+    u32 seq         per-direction session sequence number, starting at 1
+
+Client -> gateway bodies:
+
+    LOGON        1   char[42] account, char[32] token
+    NEW_ORDER    2   u64 client_order_id, u8 side, u8 ord_type, i64 price, i64 quantity,
+                     char[32] symbol, char[12] from_network, char[12] to_network,
+                     u8 time_in_force, i64 expire_time, u64 salt, char[65] signature
+    CANCEL       3   u64 order_id, u8 side, char[32] symbol
+    AMEND        4   u64 order_id, u8 side, i64 price, i64 quantity, char[32] symbol
+    MASS_CANCEL  5   u8 side (SIDE_BOTH for both), char[32] symbol (empty for every book)
+    HEARTBEAT    6   -
+
+Gateway -> client bodies:
+
+    LOGON_ACK        101  u32 next expected inbound seq
+    EXECUTION_REPORT 102  u64 client_order_id, u64 order_id, u8 exec_type, u8 side, i64 price,
+                          i64 last_qty, i64 leaves_qty, char[32] symbol
+    REJECT           103  u32 ref_seq, u16 code, char[48] text
+    MASS_CANCEL_ACK  105  u32 cancelled, char[32] symbol
+    HEARTBEAT        6    -
+
+Prices and quantities are fixed point integers scaled by SCALE (1e8) and
+become Decimal in the engine; on AMEND zero keeps the current value. Side
+is 0 bid / 1 ask; ord_type 0 limit / 1 market; time_in_force 0 GTC / 1 IOC /
+2 FOK / 3 GTT, with expire_time in epoch milliseconds (GTT only, else 0).
+Order ids are per symbol.
+
+NEW_ORDER goes through the same checks as an HTTP order before it is
+matched (check_order, e.g. APIService.check_order): a signature, when the
+field is not all zeros, is the account's signature over
+signing.order_message_hash with the given salt; balance and allowance;
+and the escrow of every counterparty it would trade with. An AMEND whose
+price would cross the book is rejected with CROSSES_BOOK; it has to be
+entered as a new order.
+
+An inbound frame whose seq is not the expected one is rejected with
+SEQ_GAP and not applied. Sessions log on with an account and a
+pre-shared token, and may only cancel or amend that account's orders.
+Resting orders entered through the gateway get execution reports pushed
+to their session when they trade or are cancelled, including fills caused
+by HTTP orders and cancels made through the HTTP API.
+"""
+
+import hmac
+import struct
+import asyncio
+import logging
+import socket
+from decimal import Decimal
+
+from helper.messages import OrderMessage
+from src.event_store import SYMBOL
+
+logger = logging.getLogger(__name__)
+
+SCALE = 10**8
+_SCALE = Decimal(SCALE)
+
+HEADER = struct.Struct("<HHI")
+
+LOGON = 1
+NEW_ORDER = 2
+CANCEL = 3
+AMEND = 4
+MASS_CANCEL = 5
+HEARTBEAT = 6
+LOGON_ACK = 101
+EXECUTION_REPORT = 102
+REJECT = 103
+MASS_CANCEL_ACK = 105
+
+BODIES = {
+    LOGON: struct.Struct("<42s32s"),
+    NEW_ORDER: struct.Struct("<QBBqq32s12s12sBqQ65s"),
+    CANCEL: struct.Struct("<QB32s"),
+    AMEND: struct.Struct("<QBqq32s"),
+    MASS_CANCEL: struct.Struct("<B32s"),
+    HEARTBEAT: struct.Struct("<"),
+    LOGON_ACK: struct.Struct("<I"),
+    EXECUTION_REPORT: struct.Struct("<QQBBqqq32s"),
+    REJECT: struct.Struct("<IH48s"),
+    MASS_CANCEL_ACK: struct.Struct("<I32s"),
+}
+
+SIDES = ("bid", "ask")
+SIDE_BOTH = 2
+ORDER_TYPES = ("limit", "market")
+TIME_IN_FORCE = ("GTC", "IOC", "FOK", "GTT")
+
+# Execution report types
+EXEC_NEW = 0
+EXEC_PARTIAL_FILL = 1
+EXEC_FILL = 2
+EXEC_CANCELED = 3
+EXEC_REPLACED = 4
+EXEC_REJECTED = 5
+
+# Reject codes
+SEQ_GAP = 1
+NOT_LOGGED_IN = 2
+BAD_LOGON = 3
+UNKNOWN_TYPE = 4
+MALFORMED = 5
+UNKNOWN_ORDER = 6
+CROSSES_BOOK = 7
+
+
+def to_fixed(value):
+    return int(value * SCALE)
+
+
+def from_fixed(value):
+    return Decimal(value) / _SCALE
+
+
+def _text(raw):
+    return raw.rstrip(b"\0").decode("ascii", "replace")
+
+
+def encode(msg_type, seq, *fields):
+    body = BODIES[msg_type]
+    return HEADER.pack(HEADER.size + body.size, msg_type, seq) + body.pack(*fields)
+
+
+def decode(frame):
+    '''(msg_type, seq, fields tuple) of one frame; raises ValueError on a malformed frame.'''
+    if len(frame) < HEADER.size:
+        raise ValueError("short frame")
+    length, msg_type, seq = HEADER.unpack_from(frame)
+    body = BODIES.get(msg_type)
+    if body is None:
+        return msg_type, seq, None
+    if length != len(frame) or length != HEADER.size + body.size:
+        raise ValueError("bad length %d for message type %d" % (length, msg_type))
+    return msg_type, seq, body.unpack_from(frame, HEADER.size)
+
+
+class GatewaySession(object):
+    '''Protocol state of one connection; send(bytes) writes a frame to the client.'''
+
+    def __init__(self, gateway, send, peer=None):
+        self.gateway = gateway
+        self.send = send
+        self.peer = peer
+        self.account = None
+        self.expected_seq = 1
+        self.out_seq = 0
+        self.closed = False
+
+    def emit(self, msg_type, *fields):
+        self.out_seq += 1
+        self.send(encode(msg_type, self.out_seq, *fields))
+
+    def reject(self, ref_seq, code, text):
+        self.emit(REJECT, ref_seq, code, text.encode("ascii", "replace")[:48])
+
+    async def handle(self, frame):
+        try:
+            msg_type, seq, fields = decode(frame)
+        except (ValueError, struct.error) as e:
+            self.reject(0, MALFORMED, str(e))
+            return
+        if seq != self.expected_seq:
+            self.reject(seq, SEQ_GAP, "expected seq %d" % self.expected_seq)
+            return
+        self.expected_seq += 1
+        if fields is None:
+            self.reject(seq, UNKNOWN_TYPE, "unknown message type %d" % msg_type)
+        elif msg_type == LOGON:
+            self.gateway.logon(self, seq, *fields)
+        elif self.account is None:
+            self.reject(seq, NOT_LOGGED_IN, "log on first")
+        elif msg_type == NEW_ORDER:
+            # Awaited, so the session's later frames apply after the order is entered
+            await self.gateway.new_order(self, seq, *fields)
+        elif msg_type == CANCEL:
+            self.gateway.cancel(self, seq, *fields)
+        elif msg_type == AMEND:
+            self.gateway.amend(self, seq, *fields)
+        elif msg_type == MASS_CANCEL:
+            self.gateway.mass_cancel(self, seq, *fields)
+        elif msg_type == HEARTBEAT:
+            self.emit(HEARTBEAT)
+        else:
+            self.reject(seq, UNKNOWN_TYPE, "unexpected message type %d" % msg_type)
+
+
+class OrderGateway(object):
+    '''
+    Routes gateway sessions into the order books.
+
+    book_for(symbol) returns the OrderBook for a symbol, creating it if
+    needed (APIService.get_or_create_order_book). tokens maps lower-cased
+    account address to its pre-shared session token. on_trades(symbol,
+    order_id, trades) is called with the engine's trade records after
+    every order that traded, e.g. to start settlement. check_order(message,
+    book) is awaited before a new order is matched, and before its book is
+    created (book is None then), and returns (error text or None, order ids
+    to skip when matching).
+    '''
+
+    def __init__(self, order_books, book_for, tokens, on_trades=None, check_order=None):
+        self.order_books = order_books
+        self.book_for = book_for
+        self.tokens = dict((account.lower(), token) for account, token in tokens.items())
+        self.on_trades = on_trades
+        self.check_order = check_order
+        self.owners = {}  # (symbol, order_id): (session, client_order_id)
+        self.sessions = set()
+
+    # ==================== MESSAGES ====================
+
+    def logon(self, session, seq, account, token):
+        account = _text(account)
+        expected = self.tokens.get(account.lower())
+        if session.account is not None or expected is None or not hmac.compare_digest(
+            _text(token).encode(), expected.encode()
+        ):
+            session.reject(seq, BAD_LOGON, "logon refused")
+            return
+        session.account = account
+        session.emit(LOGON_ACK, session.expected_seq)
+        logger.info("Gateway session logged on", extra={"account": account, "peer": session.peer})
+
+    async def new_order(
+        self, session, seq, client_order_id, side, ord_type, price, quantity, symbol, from_network, to_network,
+        time_in_force, expire_time, salt, signature,
+    ):
+        symbol = _text(symbol)
+        message = None
+        if side <= 1 and ord_type <= 1 and time_in_force < len(TIME_IN_FORCE) and SYMBOL.match(symbol):
+            base_asset, quote_asset = symbol.split("_", 1)
+            try:
+                message = OrderMessage(
+                    account=session.account,
+                    baseAsset=base_asset,
+                    quoteAsset=quote_asset,
+                    side=SIDES[side],
+                    quantity=from_fixed(quantity),
+                    from_network=_text(from_network),
+                    to_network=_text(to_network),
+                    # Market orders are entered (and signed) without a price
+                    price=from_fixed(price) if ord_type == 0 else None,
+                    type=ORDER_TYPES[ord_type],
+                    timeInForce=TIME_IN_FORCE[time_in_force],
+                    expireTime=expire_time or None,
+                    signature="0x" + signature.hex() if any(signature) else None,
+                    salt=salt,
+                )
+            except ValueError:
+                message = None  # non-positive amounts, or an expiry on a non-GTT order
+        if message is None:
+            session.emit(EXECUTION_REPORT, client_order_id, 0, EXEC_REJECTED, min(side, 1), price, 0, 0, symbol.encode()[:32])
+            return
+        quote = message.quote()
+        symbol_field = symbol.encode()
+        exclude = None
+        if self.check_order is not None:
+            # Checked against the book as it stands (None for a new symbol): a refused order,
+            # e.g. one naming an unknown token, must not leave an empty book behind
+            error, exclude = await self.check_order(message, self.order_books.get(symbol))
+            if error is not None:
+                logger.info("Gateway order refused: %s", error, extra={"account": session.account, "symbol": symbol})
+                session.emit(EXECUTION_REPORT, client_order_id, 0, EXEC_REJECTED, side, price, 0, quantity, symbol_field)
+                return
+        book = self.book_for(symbol)
+        result = book.process_order(quote, False, False, exclude=exclude)
+        order_id = book.next_order_id
+        if not result["success"]:
+            session.emit(EXECUTION_REPORT, client_order_id, order_id, EXEC_REJECTED, side, price, 0, quantity, symbol_field)
+            return
+        trades, order_in_book = result["data"][0], result["data"][1]
+
+        leaves = quantity
+        for trade in trades:
+            traded = to_fixed(trade["quantity"])
+            leaves -= traded
+            self._maker_filled(symbol, symbol_field, trade)
+            session.emit(
+                EXECUTION_REPORT, client_order_id, order_id,
+                EXEC_FILL if leaves <= 0 else EXEC_PARTIAL_FILL,
+                side, to_fixed(trade["price"]), traded, max(leaves, 0), symbol_field,
+            )
+        if order_in_book is not None:
+            self.owners[(symbol, order_id)] = (session, client_order_id)
+            if not trades:
+                session.emit(EXECUTION_REPORT, client_order_id, order_id, EXEC_NEW, side, price, 0, leaves, symbol_field)
+        elif leaves > 0:
+            # Market order remainder, or nothing compatible to trade against: not rested
+            session.emit(EXECUTION_REPORT, client_order_id, order_id, EXEC_CANCELED, side, price, 0, 0, symbol_field)
+        if trades and self.on_trades is not None:
+            self.on_trades(symbol, order_id, trades)
+
+    def _maker_filled(self, symbol, symbol_field, trade):
+        maker = trade["party1"]
+        key = (symbol, maker[2])
+        owner = self.owners.get(key)
+        if owner is None:
+            return
+        session, client_order_id = owner
+        remaining = maker[3]
+        if remaining is None:
+            del self.owners[key]
+        if session.closed:
+            return
+        session.emit(
+            EXECUTION_REPORT, client_order_id, maker[2],
+            EXEC_FILL if remaining is None else EXEC_PARTIAL_FILL,
+            SIDES.index(maker[1]), to_fixed(trade["price"]), to_fixed(trade["quantity"]),
+            to_fixed(remaining) if remaining is not None else 0, symbol_field,
+        )
+
+    def notify_trades(self, symbol, trades):
+        '''Push maker fills for trades that did not come through the gateway (e.g. HTTP orders).'''
+        symbol_field = symbol.encode()
+        for trade in trades:
+            self._maker_filled(symbol, symbol_field, trade)
+
+    def notify_cancelled(self, symbol, orders):
+        '''Report cancelled Orders to the sessions that entered them and forget them.'''
+        symbol_field = symbol.encode()
+        for order in orders:
+            owner = self.owners.pop((symbol, order.order_id), None)
+            if owner is None or owner[0].closed:
+                continue
+            owner[0].emit(
+                EXECUTION_REPORT, owner[1], order.order_id, EXEC_CANCELED, SIDES.index(order.side),
+                to_fixed(order.price), 0, to_fixed(order.quantity), symbol_field,
+            )
+
+    def _owned_order(self, session, seq, symbol, side, order_id):
+        book = self.order_books.get(symbol)
+        if book is None or side > 1:
+            session.reject(seq, UNKNOWN_ORDER, "unknown order %d" % order_id)
+            return None, None
+        tree = book.bids if side == 0 else book.asks
+        if not tree.order_exists(order_id) or tree.get_order(order_id).account != session.account:
+            session.reject(seq, UNKNOWN_ORDER, "unknown order %d" % order_id)
+            return None, None
+        return book, tree.get_order(order_id)
+
+    def cancel(self, session, seq, order_id, side, symbol):
+        symbol = _text(symbol)
+        book, order = self._owned_order(session, seq, symbol, side, order_id)
+        if book is None:
+            return
+        price, leaves = to_fixed(order.price), to_fixed(order.quantity)
+        book.cancel_order(SIDES[side], order_id)
+        owner = self.owners.pop((symbol, order_id), None)
+        client_order_id = owner[1] if owner else 0
+        session.emit(EXECUTION_REPORT, client_order_id, order_id, EXEC_CANCELED, side, price, 0, leaves, symbol.encode())
+
+    def amend(self, session, seq, order_id, side, price, quantity, symbol):
+        symbol = _text(symbol)
+        if price < 0 or quantity < 0:
+            session.reject(seq, MALFORMED, "negative price or quantity")
+            return
+        book, order = self._owned_order(session, seq, symbol, side, order_id)
+        if book is None:
+            return
+        if price and book.crosses(SIDES[side], from_fixed(price)):
+            session.reject(seq, CROSSES_BOOK, "price crosses the book")
+            return
+        update = {
+            "side": SIDES[side],
+            "price": from_fixed(price) if price else order.price,
+            "quantity": from_fixed(quantity) if quantity else order.quantity,
+        }
+        book.modify_order(order_id, update)
+        order = (book.bids if side == 0 else book.asks).get_order(order_id)
+        owner = self.owners.get((symbol, order_id))
+        session.emit(
+            EXECUTION_REPORT, owner[1] if owner else 0, order_id, EXEC_REPLACED, side,
+            to_fixed(order.price), 0, to_fixed(order.quantity), symbol.encode(),
+        )
+
+    def mass_cancel(self, session, seq, side, symbol):
+        symbol = _text(symbol)
+        if side > SIDE_BOTH:
+            session.reject(seq, MALFORMED, "bad side %d" % side)
+            return
+        symbols = [symbol] if symbol else list(self.order_books)
+        cancelled = 0
+        for name in symbols:
+            book = self.order_books.get(name)
+            if book is None:
+                continue
+            orders = book.mass_cancel(session.account, side=None if side == SIDE_BOTH else SIDES[side])
+            for order in orders:
+                owner = self.owners.pop((name, order.order_id), None)
+                session.emit(
+                    EXECUTION_REPORT, owner[1] if owner else 0, order.order_id, EXEC_CANCELED,
+                    SIDES.index(order.side), to_fixed(order.price), 0, to_fixed(order.quantity), name.encode(),
+                )
+            cancelled += len(orders)
+        session.emit(MASS_CANCEL_ACK, cancelled, symbol.encode())
+
+    # ==================== TRANSPORTS ====================
+
+    async def serve_tcp(self, host="0.0.0.0", port=9001):
+        server = await asyncio.start_server(self._handle_stream, host, port)
+        logger.info("Order-entry gateway listening on %s:%d", host, port)
+        return server
+
+    async def _handle_stream(self, reader, writer):
+        sock = writer.get_extra_info("socket")
+        if sock is not None:
+            sock.setsockopt(socket.IPPROTO_TCP, socket.TCP_NODELAY, 1)
+        session = GatewaySession(self, writer.write, writer.get_extra_info("peername"))
+        self.sessions.add(session)
+        try:
+            while True:
+                header = await reader.readexactly(HEADER.size)
+                length = HEADER.unpack(header)[0]
+                if length < HEADER.size:
+                    session.reject(0, MALFORMED, "bad length %d" % length)
+                    break
+                body = await reader.readexactly(length - HEADER.size) if length > HEADER.size else b""
+                await session.handle(header + body)
+                # Frames are small; only wait on the socket when the client stops reading
+                if writer.transport.get_write_buffer_size() > 1 << 20:
+                    await writer.drain()
+        except (asyncio.IncompleteReadError, ConnectionError):
+            pass
+        finally:
+            self._close(session)
+            writer.close()
+
+    async def handle_websocket(self, websocket):
+        '''Serve one binary-frame session over an accepted Starlette/FastAPI WebSocket.'''
+        # Frames are queued and written by one task, so fills pushed while another
+        # session is being handled reach this client without waiting for its next message
+        outbox = asyncio.Queue()
+        session = GatewaySession(self, outbox.put_nowait, websocket.client)
+        self.sessions.add(session)
+
+        async def writer():
+            while True:
+                await websocket.send_bytes(await outbox.get())
+
+        sender = asyncio.ensure_future(writer())
+        try:
+            while True:
+                message = await websocket.receive()
+                if message["type"] == "websocket.disconnect":
+                    break
+                data = message.get("bytes")
+                if data is None:
+                    session.reject(0, MALFORMED, "binary frames only")
+                else:
+                    await session.handle(data)
+        finally:
+            self._close(session)
+            sender.cancel()
+
+    def _close(self, session):
+        session.closed = True
+        self.sessions.discard(session)
+        for key in [key for key, owner in self.owners.items() if owner[0] is session]:
+            del self.owners[key]
+        if session.account:
+            logger.info("Gateway session closed", extra={"account": session.account, "peer": session.peer})
@@ -0,0 +1,230 @@
+"""
+Structured, asynchronous logging
+
+configure_logging() routes every logger through a QueueHandler, so the
+calling thread only pays for a level check, a rate-limit lookup and a
+queue put. Message formatting, redaction, JSON encoding and the write
+syscall all happen on the QueueListener's background thread.
+
+Log with %-style arguments (never f-strings) so formatting stays lazy,
+and attach structured fields with extra=:
+
+    logger.info("Order accepted", extra={"symbol": symbol, "order_id": order_id})
+    logger.info("Settlement result: %s", settlement_info)
+
+Each message template is rate limited (token bucket per logger and
+template); templates can also be sampled, keeping every Nth record.
+Suppressed records are counted and reported on the next record that gets
+through. Fields whose name looks secret (private keys, signatures) are
+redacted in extra fields and dict arguments, and values registered with
+add_secret() (the matching engine key) are masked in the message text.
+
+Environment:
+    LOG_LEVEL       INFO
+    LOG_FORMAT      text | json
+    LOG_RATE        records per second allowed per message template (20)
+    LOG_BURST       bucket size per message template (100)
+"""
+
+import os
+import re
+import sys
+import json
+import time
+import queue
+import atexit
+import logging
+import threading
+from logging.handlers import QueueHandler, QueueListener
+
+TEXT_FORMAT = "%(asctime)s %(levelname)s [%(filename)s:%(lineno)d %(funcName)s] %(message)s"
+DATE_FORMAT = "%Y-%m-%d %H:%M:%S"
+
+REDACTED = "[REDACTED]"
+SECRET_FIELDS = re.compile(r"private_?key|secret|password|mnemonic|signature|api_?key", re.I)
+
+# LogRecord attributes; anything else on a record came from extra=
+_RECORD_FIELDS = frozenset(
+    vars(logging.LogRecord("", 0, "", 0, "", (), None)).keys()
+) | {"message", "asctime", "suppressed"}
+
+_listener = None
+_lock = threading.Lock()
+_secrets = set()
+
+
+def add_secret(value):
+    '''Mask this exact value (and its 0x-less form) anywhere in formatted log text.'''
+    if value and len(value) >= 8:
+        _secrets.add(value)
+        if value.startswith("0x"):
+            _secrets.add(value[2:])
+
+
+def redact(value, depth=0):
+    '''Copy of value with secret-looking dict keys masked, recursively.'''
+    if depth > 4:
+        return value
+    if isinstance(value, dict):
+        return {
+            key: REDACTED if isinstance(key, str) and SECRET_FIELDS.search(key) else redact(item, depth + 1)
+            for key, item in value.items()
+        }
+    if isinstance(value, list):
+        return [redact(item, depth + 1) for item in value]
+    if type(value) is tuple:  # namedtuples (e.g. socket addresses) pass through as-is
+        return tuple(redact(item, depth + 1) for item in value)
+    return value
+
+
+def redact_text(text):
+    for secret in _secrets:
+        if secret in text:
+            text = text.replace(secret, REDACTED)
+    return text
+
+
+class RateLimitFilter(logging.Filter):
+    '''
+    Token bucket per (logger, message template), plus optional sampling.
+
+    sample maps a message template (record.msg) to N: only every Nth record
+    with that template is kept. WARNING and above are never sampled, only
+    rate limited.
+    '''
+
+    def __init__(self, rate=20.0, burst=100, sample=None):
+        super(RateLimitFilter, self).__init__()
+        self.rate = float(rate)
+        self.burst = float(burst)
+        self.sample = dict(sample or {})
+        self.buckets = {}  # key: [tokens, last refill, suppressed, seen]
+        self.lock = threading.Lock()
+
+    def filter(self, record):
+        key = (record.name, record.msg)
+        now = time.monotonic()
+        with self.lock:
+            bucket = self.buckets.get(key)
+            if bucket is None:
+                bucket = self.buckets[key] = [self.burst, now, 0, 0]
+            bucket[3] += 1
+            every = self.sample.get(record.msg)
+            if every and record.levelno < logging.WARNING and bucket[3] % every:
+                bucket[2] += 1
+                return False
+            tokens = min(self.burst, bucket[0] + (now - bucket[1]) * self.rate)
+            bucket[1] = now
+            if tokens < 1.0:
+                bucket[0] = tokens
+                bucket[2] += 1
+                return False
+            bucket[0] = tokens - 1.0
+            if bucket[2]:
+                record.suppressed = bucket[2]
+                bucket[2] = 0
+        return True
+
+
+class _DeferredQueueHandler(QueueHandler):
+    '''QueueHandler that leaves formatting to the listener thread.'''
+
+    def prepare(self, record):
+        # The stock prepare() formats the message here, on the caller's thread.
+        # Snapshot dict arguments instead so later mutation can't change the log.
+        args = record.args
+        if isinstance(args, dict):
+            record.args = dict(args)
+        elif args and any(isinstance(arg, dict) for arg in args):
+            record.args = tuple(dict(arg) if isinstance(arg, dict) else arg for arg in args)
+        return record
+
+
+class StructuredFormatter(logging.Formatter):
+    '''Text or JSON lines with extra= fields attached and secrets redacted.'''
+
+    def __init__(self, json_lines=False):
+        super(StructuredFormatter, self).__init__(TEXT_FORMAT, DATE_FORMAT)
+        self.json_lines = json_lines
+
+    def format(self, record):
+        if record.args:
+            record.args = redact(record.args)
+        message = redact_text(record.getMessage())
+        fields = redact(
+            {key: value for key, value in vars(record).items() if key not in _RECORD_FIELDS}
+        )
+        suppressed = getattr(record, "suppressed", 0)
+        if suppressed:
+            fields["suppressed"] = suppressed
+
+        if self.json_lines:
+            entry = {
+                "ts": self.formatTime(record, DATE_FORMAT),
+                "level": record.levelname,
+                "logger": record.name,
+                "where": "%s:%d" % (record.filename, record.lineno),
+                "msg": message,
+            }
+            entry.update(fields)
+            if record.exc_info:
+                entry["exc"] = redact_text(self.formatException(record.exc_info))
+            return json.dumps(entry, default=str)
+
+        record.message = message
+        record.asctime = self.formatTime(record, DATE_FORMAT)
+        text = self.formatMessage(record)
+        if fields:
+            text += " " + " ".join("%s=%s" % (key, value) for key, value in fields.items())
+        if record.exc_info:
+            text += "\n" + redact_text(self.formatException(record.exc_info))
+        return text
+
+
+def configure_logging(level=None, json_lines=None, rate=None, burst=None, sample=None, stream=None):
+    '''
+    Install the queue-backed pipeline on the root logger (idempotent).
+
+    Returns the QueueListener; it is stopped, flushing pending records, at exit.
+    '''
+    global _listener
+    with _lock:
+        if _listener is not None:
+            return _listener
+        level = level or os.getenv("LOG_LEVEL", "INFO")
+        if json_lines is None:
+            json_lines = os.getenv("LOG_FORMAT", "text").lower() == "json"
+        rate = float(rate if rate is not None else os.getenv("LOG_RATE", 20))
+        burst = float(burst if burst is not None else os.getenv("LOG_BURST", 100))
+
+        writer = logging.StreamHandler(stream or sys.stderr)
+        writer.setFormatter(StructuredFormatter(json_lines))
+
+        records = queue.SimpleQueue()
+        handler = _DeferredQueueHandler(records)
+        handler.addFilter(RateLimitFilter(rate, burst, sample))
+
+        # Neither format uses process or multiprocessing fields; skip collecting them per record
+        logging.logProcesses = False
+        logging.logMultiprocessing = False
+
+        root = logging.getLogger()
+        for existing in list(root.handlers):
+            root.removeHandler(existing)
+        root.addHandler(handler)
+        root.setLevel(level)
+
+        _listener = QueueListener(records, writer, respect_handler_level=True)
+        _listener.start()
+        atexit.register(stop_logging)
+        return _listener
+
+
+def stop_logging():
+    '''Drain the queue and stop the writer thread.'''
+    global _listener
+    with _lock:
+        if _listener is None:
+            return
+        _listener.stop()
+        _listener = None
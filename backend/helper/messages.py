@@ -0,0 +1,200 @@
+"""
+Typed order-entry messages
+
+Request bodies are decoded straight into msgspec Structs by a decoder
+compiled once per message type. Decoding validates field types, converts
+price and quantity to Decimal (the engine's native representation,
+accepting JSON strings or numbers without a float round trip) and checks
+value ranges in a single pass. Failures raise HTTPException(422) naming
+the offending field, e.g. "Invalid enum value 'buy' - at `$.side`".
+
+Both JSON bodies and the legacy form posts carrying a JSON string in the
+`payload` field are accepted.
+
+Usage:
+    message = await decode_request(request, OrderMessage)
+    message = decode_payload(payload, OrderQuery)
+"""
+
+from decimal import Decimal
+from typing import Annotated, Literal, Optional
+
+import msgspec
+from fastapi import HTTPException, Request
+
+Side = Literal["bid", "ask"]
+TimeInForce = Literal["GTC", "IOC", "FOK", "GTT"]
+# Assets and symbols name order books, event store directories and metric labels: letters and
+# digits, with underscores only between them (e.g. cNGN_BSC), never a path or markup
+Asset = Annotated[str, msgspec.Meta(pattern=r"^[A-Za-z0-9]+(_[A-Za-z0-9]+)*$", max_length=64)]
+Symbol = Annotated[str, msgspec.Meta(pattern=r"^[A-Za-z0-9]+(_[A-Za-z0-9]+)+$", max_length=129)]
+
+
+def _check_amount(name, value, required=True):
+    if value is None:
+        if required:
+            raise ValueError("%s is required" % name)
+        return
+    if not value.is_finite() or value <= 0:
+        raise ValueError("%s must be a positive number, got %s" % (name, value))
+
+
+class OrderMessage(msgspec.Struct):
+    account: str
+    baseAsset: Asset
+    quoteAsset: Asset
+    side: Side
+    quantity: Decimal
+    from_network: str
+    to_network: str
+    price: Optional[Decimal] = None
+    type: Literal["limit", "market"] = "limit"
+    privateKey: Optional[str] = None
+    receive_wallet: Optional[str] = None
+    receiveWallet: Optional[str] = None
+    timeInForce: TimeInForce = "GTC"
+    expireTime: Optional[int] = None  # milliseconds since the epoch, GTT orders only
+    # Client's signature over signing.order_message_hash, checked before the order is matched
+    signature: Optional[str] = None
+    salt: int = 0
+
+    def __post_init__(self):
+        _check_amount("quantity", self.quantity)
+        _check_amount("price", self.price, required=self.type == "limit")
+        if self.type == "market" and self.price is not None:
+            raise ValueError("market orders take no price")
+        if (self.timeInForce == "GTT") != (self.expireTime is not None):
+            raise ValueError("expireTime is required for GTT orders and only allowed for them")
+
+    @property
+    def symbol(self):
+        return "%s_%s" % (self.baseAsset, self.quoteAsset)
+
+    def quote(self):
+        '''The quote dict OrderBook.process_order expects.'''
+        return {
+            "type": self.type,
+            "trade_id": self.account,
+            "from_network": self.from_network,
+            "to_network": self.to_network,
+            "receive_wallet": self.receive_wallet or self.receiveWallet,
+            "account": self.account,
+            "price": self.price if self.price is not None else Decimal(0),
+            "quantity": self.quantity,
+            "side": self.side,
+            "baseAsset": self.baseAsset,
+            "quoteAsset": self.quoteAsset,
+            "private_key": self.privateKey,
+            "time_in_force": self.timeInForce,
+            "expire_time": self.expireTime,
+        }
+
+
+class CancelMessage(msgspec.Struct):
+    orderId: int
+    side: Side
+    baseAsset: Asset
+    quoteAsset: Asset
+
+    @property
+    def symbol(self):
+        return "%s_%s" % (self.baseAsset, self.quoteAsset)
+
+
+class AmendMessage(msgspec.Struct):
+    '''
+    Change price and/or quantity of a resting order; omitted fields keep their value.
+
+    Only the order's owner may amend it: signature is the account's
+    signature over signing.amend_message_hash, and like an order's, a
+    signed (account, salt) is accepted once.
+    '''
+
+    orderId: int
+    side: Side
+    baseAsset: Asset
+    quoteAsset: Asset
+    account: str
+    signature: str
+    price: Optional[Decimal] = None
+    quantity: Optional[Decimal] = None
+    salt: int = 0
+
+    def __post_init__(self):
+        if self.price is None and self.quantity is None:
+            raise ValueError("amend needs a new price or quantity")
+        _check_amount("price", self.price, required=False)
+        _check_amount("quantity", self.quantity, required=False)
+
+    @property
+    def symbol(self):
+        return "%s_%s" % (self.baseAsset, self.quoteAsset)
+
+
+class MassCancelMessage(msgspec.Struct):
+    '''Cancel all of account's resting orders; every other field narrows the selection.'''
+
+    account: str
+    baseAsset: Optional[Asset] = None
+    quoteAsset: Optional[Asset] = None
+    side: Optional[Side] = None
+    from_network: Optional[str] = None
+    to_network: Optional[str] = None
+
+    def __post_init__(self):
+        if (self.baseAsset is None) != (self.quoteAsset is None):
+            raise ValueError("baseAsset and quoteAsset must be given together")
+
+    @property
+    def symbol(self):
+        if self.baseAsset is None:
+            return None
+        return "%s_%s" % (self.baseAsset, self.quoteAsset)
+
+
+class OrderQuery(msgspec.Struct):
+    orderId: int
+
+
+class OrderBookQuery(msgspec.Struct):
+    symbol: Symbol
+
+
+class FundsQuery(msgspec.Struct):
+    account: str
+    asset: Asset
+
+
+_decoders = {}
+
+
+def _decoder(message_type):
+    decoder = _decoders.get(message_type)
+    if decoder is None:
+        decoder = _decoders[message_type] = msgspec.json.Decoder(message_type)
+    return decoder
+
+
+def decode_payload(payload, message_type):
+    '''Decode a JSON string or bytes into message_type, raising HTTPException(422) on bad input.'''
+    if isinstance(payload, str):
+        payload = payload.encode("utf-8")
+    try:
+        return _decoder(message_type).decode(payload)
+    except (msgspec.ValidationError, msgspec.DecodeError) as e:
+        raise HTTPException(status_code=422, detail=str(e))
+
+
+async def decode_request(request: Request, message_type):
+    '''Decode a JSON body, or a form post's `payload` field, into message_type.'''
+    content_type = request.headers.get("content-type", "")
+    if (
+        "application/x-www-form-urlencoded" in content_type
+        or "multipart/form-data" in content_type
+    ):
+        form = await request.form()
+        payload = form.get("payload")
+        if not payload:
+            raise HTTPException(status_code=422, detail="Missing 'payload' form field")
+        return decode_payload(payload, message_type)
+    return decode_payload(await request.body(), message_type)
@@ -0,0 +1,148 @@
+"""
+Price proxy
+
+Serves Gate.io spot tickers to the frontend (the browser cannot call
+Gate.io directly because of CORS) without one upstream request per tab
+per refresh:
+
+- one httpx.AsyncClient with a keep-alive connection pool for every call
+- a per-pair cache: a ticker younger than ttl is served as is
+- single flight: concurrent requests for a pair that is being fetched
+  wait for that one upstream request instead of sending their own
+- stale-while-revalidate: a ticker older than ttl but younger than
+  stale_ttl is served at once while a refresh runs in the background;
+  past stale_ttl the request waits for a fresh one
+- optionally, run() keeps the pairs requested in the last hot_window
+  seconds refreshed, so their requests never wait on Gate.io at all
+
+Upstream failures are not cached. A failed background refresh leaves the
+stale ticker in place until stale_ttl; a failed fetch that a request waits
+on raises httpx.HTTPError to it.
+
+Pass an httpx transport (httpx.MockTransport in tests) to replace Gate.io.
+
+Usage:
+    prices = PriceService(ttl=2.0, stale_ttl=60.0)
+    tickers = await prices.get("HBAR_USDT")
+"""
+
+import asyncio
+import logging
+import time
+from collections import OrderedDict
+
+import httpx
+
+from src import metrics
+
+logger = logging.getLogger(__name__)
+
+GATEIO_TICKERS_URL = "https://api.gateio.ws/api/v4/spot/tickers"
+
+
+class PriceService(object):
+    def __init__(
+        self,
+        url=GATEIO_TICKERS_URL,
+        ttl=2.0,
+        stale_ttl=60.0,
+        timeout=10.0,
+        max_pairs=1024,
+        max_connections=20,
+        hot_window=30.0,
+        transport=None,
+    ):
+        self.url = url
+        self.ttl = ttl
+        self.stale_ttl = stale_ttl
+        self.timeout = timeout
+        self.max_pairs = max_pairs
+        self.max_connections = max_connections
+        self.hot_window = hot_window
+        self.transport = transport
+        self.client = None  # created on first use, inside the event loop
+        self.cache = OrderedDict()  # pair : (monotonic fetch time, payload), least recently asked first
+        self.requested = {}  # pair : monotonic time it was last asked for
+        self.inflight = {}  # pair : task fetching it
+
+    def _client(self):
+        if self.client is None:
+            self.client = httpx.AsyncClient(
+                timeout=self.timeout,
+                transport=self.transport,
+                headers={"Accept": "application/json"},
+                limits=httpx.Limits(
+                    max_connections=self.max_connections,
+                    max_keepalive_connections=self.max_connections,
+                ),
+            )
+        return self.client
+
+    async def get(self, pair):
+        """Gate.io tickers for pair, from the cache when it is fresh enough."""
+        now = time.monotonic()
+        self.requested[pair] = now
+        entry = self.cache.get(pair)
+        if entry is not None:
+            self.cache.move_to_end(pair)
+            age = now - entry[0]
+            if age < self.ttl:
+                metrics.PRICE_REQUESTS.labels("hit").inc()
+                return entry[1]
+            if age < self.stale_ttl:
+                metrics.PRICE_REQUESTS.labels("stale").inc()
+                self.refresh(pair)
+                return entry[1]
+        metrics.PRICE_REQUESTS.labels("coalesced" if pair in self.inflight else "miss").inc()
+        # Shielded: a caller that goes away must not cancel the fetch the others wait on
+        return await asyncio.shield(self.refresh(pair))
+
+    def refresh(self, pair):
+        """Task fetching pair, the one already running if there is one."""
+        task = self.inflight.get(pair)
+        if task is None:
+            task = asyncio.ensure_future(self._fetch(pair))
+            self.inflight[pair] = task
+            task.add_done_callback(lambda done: self._fetched(pair, done))
+        return task
+
+    def _fetched(self, pair, task):
+        self.inflight.pop(pair, None)
+        if not task.cancelled() and task.exception() is not None:
+            # Retrieved here so background refresh failures are logged once, not as unretrieved
+            metrics.ERRORS.labels("price_" + type(task.exception()).__name__).inc()
+            logger.warning("Price fetch failed for %s: %s", pair, task.exception())
+            if pair not in self.cache:
+                self.requested.pop(pair, None)  # nothing to keep warm, e.g. an unknown pair
+
+    async def _fetch(self, pair):
+        response = await self._client().get(self.url, params={"currency_pair": pair})
+        response.raise_for_status()
+        payload = response.json()
+        self.cache[pair] = (time.monotonic(), payload)
+        self.cache.move_to_end(pair)
+        while len(self.cache) > self.max_pairs:
+            evicted, _ = self.cache.popitem(last=False)
+            self.requested.pop(evicted, None)
+        return payload
+
+    async def run(self, interval=1.0):
+        """Refresh recently requested pairs before they go stale; cancel to stop."""
+        while True:
+            await asyncio.sleep(interval)
+            now = time.monotonic()
+            for pair, requested in list(self.requested.items()):
+                if now - requested > self.hot_window:
+                    del self.requested[pair]  # gone cold: served on demand again
+                    continue
+                entry = self.cache.get(pair)
+                # Refreshed one interval early, so a hot pair is never served past ttl
+                if entry is None or now - entry[0] >= self.ttl - interval:
+                    self.refresh(pair)
+
+    async def close(self):
+        for task in list(self.inflight.values()):
+            task.cancel()
+        if self.client is not None:
+            await self.client.aclose()
+            self.client = None
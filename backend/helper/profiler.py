@@ -0,0 +1,191 @@
+"""
+On-demand sampling profiler
+
+Captures stack samples of every thread in the process (the event loop
+thread, executor workers, web3 calls blocking in threads) for a fixed
+window and aggregates them into collapsed stacks, the input format of
+flamegraph.pl and speedscope, or renders a self-contained SVG flamegraph.
+
+Nothing runs while idle: a sampler thread exists only for the duration of
+a capture, and only one capture runs at a time.
+
+Usage:
+    profiler = SamplingProfiler()
+    stacks = await profiler.profile(seconds=10)
+    text = collapse(stacks)
+    svg = flamegraph_svg(stacks, title="GIVEX API")
+"""
+
+import os
+import sys
+import time
+import asyncio
+import threading
+from concurrent.futures import Future
+from xml.sax.saxutils import escape
+
+MAX_SECONDS = 60.0
+MIN_INTERVAL = 0.001
+
+
+class ProfilerBusy(Exception):
+    pass
+
+
+class SamplingProfiler(object):
+    def __init__(self, interval=0.005, max_depth=128):
+        self.interval = interval
+        self.max_depth = max_depth
+        self._lock = threading.Lock()
+        self._running = False
+
+    @property
+    def running(self):
+        return self._running
+
+    def start(self, seconds, interval=None):
+        '''Start a capture in a new thread; returns a Future of {stack tuple: sample count}.'''
+        seconds = min(max(float(seconds), 0.0), MAX_SECONDS)
+        interval = max(float(interval or self.interval), MIN_INTERVAL)
+        with self._lock:
+            if self._running:
+                raise ProfilerBusy("A profile is already being captured")
+            self._running = True
+        future = Future()
+        thread = threading.Thread(
+            target=self._run, args=(seconds, interval, future), name="sampling-profiler", daemon=True
+        )
+        thread.start()
+        return future
+
+    async def profile(self, seconds, interval=None):
+        return await asyncio.wrap_future(self.start(seconds, interval))
+
+    def _run(self, seconds, interval, future):
+        try:
+            future.set_result(self._sample(seconds, interval))
+        except BaseException as e:
+            future.set_exception(e)
+        finally:
+            with self._lock:
+                self._running = False
+
+    def _sample(self, seconds, interval):
+        me = threading.get_ident()
+        stacks = {}
+        names = {}
+        deadline = time.monotonic() + seconds
+        next_tick = time.monotonic()
+        while True:
+            frames = sys._current_frames()
+            for ident, frame in frames.items():
+                if ident == me:
+                    continue
+                name = names.get(ident)
+                if name is None:
+                    name = names[ident] = _thread_name(ident)
+                key = (name,) + _stack(frame, self.max_depth)
+                stacks[key] = stacks.get(key, 0) + 1
+            # Don't keep other threads' frames (and their locals) alive between samples
+            frames = frame = None
+            next_tick += interval
+            now = time.monotonic()
+            if now >= deadline:
+                return stacks
+            if next_tick > now:
+                time.sleep(min(next_tick - now, deadline - now))
+            else:
+                # Sampling fell behind (GIL contention); don't try to catch up in a burst
+                next_tick = now
+
+
+def _thread_name(ident):
+    for thread in threading.enumerate():
+        if thread.ident == ident:
+            return "thread:%s" % thread.name
+    return "thread:%d" % ident
+
+
+def _stack(frame, max_depth):
+    '''Frames from outermost to innermost as "function (file:line)" labels.'''
+    labels = []
+    while frame is not None and len(labels) < max_depth:
+        code = frame.f_code
+        labels.append("%s (%s:%d)" % (code.co_name, os.path.basename(code.co_filename), code.co_firstlineno))
+        frame = frame.f_back
+    labels.reverse()
+    return tuple(labels)
+
+
+# ==================== OUTPUT ====================
+
+
+def collapse(stacks):
+    '''Collapsed stack text: "root;caller;callee count" per line, heaviest first.'''
+    lines = []
+    for stack, count in sorted(stacks.items(), key=lambda item: -item[1]):
+        lines.append("%s %d" % (";".join(frame.replace(";", ":") for frame in stack), count))
+    return "\n".join(lines) + "\n"
+
+
+def _tree(stacks):
+    root = {"name": "all", "count": 0, "children": {}}
+    for stack, count in stacks.items():
+        root["count"] += count
+        node = root
+        for frame in stack:
+            child = node["children"].get(frame)
+            if child is None:
+                child = node["children"][frame] = {"name": frame, "count": 0, "children": {}}
+            child["count"] += count
+            node = child
+    return root
+
+
+def flamegraph_svg(stacks, title="Flame Graph", width=1200, row_height=16, min_width=0.5):
+    '''Render stacks as a standalone SVG flamegraph (root at the bottom, hover for details).'''
+    root = _tree(stacks)
+    total = root["count"] or 1
+    scale = float(width - 20) / total
+    rects = []
+    max_level = [0]
+
+    def layout(node, x, level):
+        node_width = node["count"] * scale
+        if node_width < min_width:
+            return
+        max_level[0] = max(max_level[0], level)
+        rects.append((node, x, level, node_width))
+        for child in sorted(node["children"].values(), key=lambda child: child["name"]):
+            layout(child, x, level + 1)
+            x += child["count"] * scale
+
+    layout(root, 10.0, 0)
+    height = (max_level[0] + 1) * row_height + 50
+    out = [
+        '<?xml version="1.0" standalone="no"?>',
+        '<svg version="1.1" width="%d" height="%d" xmlns="http://www.w3.org/2000/svg" '
+        'font-family="Verdana" font-size="12">' % (width, height),
+        '<rect x="0" y="0" width="100%%" height="100%%" fill="#f8f8f8"/>',
+        '<text x="%d" y="24" text-anchor="middle" font-size="17">%s</text>' % (width // 2, escape(title)),
+    ]
+    for node, x, level, node_width in rects:
+        y = height - (level + 1) * row_height - 10
+        name = node["name"]
+        # Stable warm colour per function name
+        seed = sum(ord(c) for c in name)
+        fill = "rgb(%d,%d,%d)" % (205 + seed % 50, 80 + (seed * 7) % 130, 40 + (seed * 13) % 50)
+        label = name if node_width > 7 * len(name) else name[: max(0, int(node_width / 7) - 2)] + ".."
+        out.append(
+            '<g><title>%s (%d samples, %.2f%%)</title>'
+            '<rect x="%.1f" y="%d" width="%.1f" height="%d" fill="%s" rx="2" ry="2"/>'
+            '%s</g>'
+            % (
+                escape(name), node["count"], 100.0 * node["count"] / total,
+                x, y, node_width, row_height - 1, fill,
+                '<text x="%.1f" y="%d">%s</text>' % (x + 3, y + row_height - 4, escape(label))
+                if node_width > 21 else "",
+            )
+        )
+    out.append("</svg>")
+    return "\n".join(out) + "\n"
@@ -0,0 +1,180 @@
+"""
+Fast JSON response layer
+
+FastJSONResponse is a drop-in replacement for JSONResponse that encodes
+with orjson (stdlib json when orjson is not installed) and understands
+engine types: Decimal prices/quantities, Order objects, bytes and sets.
+
+Template holds a fixed-shape message (order acks, the order book
+envelope) as prebuilt byte fragments, so only the variable parts are
+encoded per response. Slots are filled with encoded values, or with Raw
+bytes that are already JSON, such as the cached depth snapshot from
+orderbook_json().
+
+Usage:
+    return FastJSONResponse({"message": "...", "order": order_fields(order)})
+    return CANCEL_ACK.response(order=order_fields(order, is_valid=False))
+    return ORDERBOOK.response(orderbook=orderbook_json(order_book, symbol))
+"""
+
+import json
+import re
+import weakref
+from decimal import Decimal
+
+from starlette.responses import Response
+
+from src.order import Order
+
+try:
+    import orjson
+except ImportError:  # pragma: no cover - orjson is in requirements.txt
+    orjson = None
+
+
+class Raw(bytes):
+    '''Bytes that are already valid JSON; spliced into templates as-is.'''
+
+
+def _default(value):
+    if isinstance(value, Decimal):
+        return float(value)
+    if isinstance(value, Order):
+        return order_fields(value)
+    if isinstance(value, (bytes, bytearray)):
+        return "0x" + bytes(value).hex()
+    if isinstance(value, (set, frozenset)):
+        return list(value)
+    raise TypeError("Object of type %s is not JSON serializable" % type(value).__name__)
+
+
+if orjson is not None:
+    _OPTIONS = orjson.OPT_NON_STR_KEYS
+
+    def dumps(value):
+        '''Encode value to compact JSON bytes.'''
+        return orjson.dumps(value, default=_default, option=_OPTIONS)
+
+else:
+
+    def dumps(value):
+        '''Encode value to compact JSON bytes.'''
+        return json.dumps(
+            value, default=_default, ensure_ascii=False, allow_nan=False, separators=(",", ":")
+        ).encode("utf-8")
+
+
+def _encode(value):
+    return value if isinstance(value, Raw) else dumps(value)
+
+
+class FastJSONResponse(Response):
+    media_type = "application/json"
+
+    def render(self, content):
+        if type(content) is _Filled:
+            return content.template.render(**content.values)
+        return _encode(content)
+
+
+class _Filled(object):
+    __slots__ = ("template", "values")
+
+    def __init__(self, template, values):
+        self.template = template
+        self.values = values
+
+
+class Template(object):
+    '''
+    A JSON message with named holes, e.g. '{"status_code":1,"order":{order}}'.
+
+    The text between holes is encoded once, when the template is built.
+    '''
+
+    SLOT = re.compile(r"\{(\w+)\}(?=[,}\]])")
+
+    def __init__(self, text):
+        self.pieces = []
+        self.slots = []
+        position = 0
+        for match in self.SLOT.finditer(text):
+            self.pieces.append(text[position:match.start()].encode("utf-8"))
+            self.slots.append(match.group(1))
+            position = match.end()
+        self.pieces.append(text[position:].encode("utf-8"))
+
+    def render(self, **values):
+        pieces = self.pieces
+        parts = [pieces[0]]
+        for index, slot in enumerate(self.slots):
+            parts.append(_encode(values[slot]))
+            parts.append(pieces[index + 1])
+        return Raw(b"".join(parts))
+
+    def response(self, status_code=200, **values):
+        # Encoded inside FastJSONResponse.render, so every response is encoded in one place
+        return FastJSONResponse(_Filled(self, values), status_code=status_code)
+
+
+# ==================== MESSAGE TEMPLATES ====================
+
+ORDER_ACK = Template(
+    '{"message":"Order registered successfully","order":{order},"nextBest":{nextBest},'
+    '"taskId":{taskId},"validation_details":{validation_details},'
+    '"settlement_info":{settlement_info},"status_code":1}'
+)
+CANCEL_ACK = Template('{"message":"Order cancelled successfully","order":{order},"status_code":1}')
+MASS_CANCEL_ACK = Template(
+    '{"message":"Orders cancelled successfully","cancelled":{cancelled},"orders":{orders},"status_code":1}'
+)
+AMEND_ACK = Template('{"message":"Order modified successfully","order":{order},"status_code":1}')
+ORDER_FOUND = Template('{"message":"Order retrieved successfully","order":{order},"status_code":1}')
+ORDERBOOK = Template('{"message":"Order book retrieved successfully","orderbook":{orderbook},"status_code":1}')
+ERROR = Template('{"message":{message},"status_code":0}')
+
+
+def order_fields(order, trades=(), is_valid=True):
+    '''Wire representation of a resting Order (or an order quote dict).'''
+    if isinstance(order, dict):
+        order_id = order.get("order_id")
+        return {
+            "orderId": int(order_id) if order_id is not None else None,
+            "account": order["account"],
+            "price": order["price"],
+            "quantity": order["quantity"],
+            "side": order["side"],
+            "baseAsset": order["baseAsset"],
+            "quoteAsset": order["quoteAsset"],
+            "trade_id": order["trade_id"],
+            "trades": list(trades),
+            "isValid": is_valid,
+            "timestamp": order.get("timestamp"),
+        }
+    return {
+        "orderId": int(order.order_id) if order.order_id is not None else None,
+        "account": order.account,
+        "price": order.price,
+        "quantity": order.quantity,
+        "side": order.side,
+        "baseAsset": order.baseAsset,
+        "quoteAsset": order.quoteAsset,
+        "trade_id": order.trade_id,
+        "trades": list(trades),
+        "isValid": is_valid,
+        "timestamp": order.timestamp,
+    }
+
+
+# Encoded depth snapshot per book, reused until the book's version changes
+_snapshots = weakref.WeakKeyDictionary()
+
+
+def orderbook_json(order_book, symbol):
+    '''OrderBook.get_orderbook(symbol) encoded to Raw JSON, cached per book version.'''
+    cached = _snapshots.get(order_book)
+    if cached is not None and cached[0] == order_book.version and cached[1] == symbol:
+        return cached[2]
+    body = Raw(dumps(order_book.get_orderbook(symbol)))
+    _snapshots[order_book] = (order_book.version, symbol, body)
+    return body
@@ -6,5 +6,12 @@ __all__ = [
     "ordertree",
     "orderlist",
     "order",
+    "tape",
+    "candles",
+    "event_store",
+    "replay",
+    "metrics",
+    "timer_wheel",
+    "analytics",
     "trade_settlement_client",
 ]
\ No newline at end of file
@@ -3,6 +3,8 @@ from eth_account import Account
 import os
 from dotenv import load_dotenv
 
+from .tokens import TokenRegistry
+
 load_dotenv()
 
 # ERC20 ABI for approve and allowance functions
@@ -38,9 +40,11 @@ ERC20_ABI = [
 
 
 class AllowanceManager:
-    def __init__(self, web3_provider: str, private_key: str):
+    def __init__(self, web3_provider: str, private_key: str, tokens: TokenRegistry = None):
         self.web3 = Web3(Web3.HTTPProvider(web3_provider))
         self.account = Account.from_key(private_key)
+        # Token decimals, read from each token the first time it is used
+        self.tokens = tokens or TokenRegistry()
         print(f"Connected: {self.web3.is_connected()}")
         print(f"Account: {self.account.address}")
     
@@ -72,9 +76,9 @@ class AllowanceManager:
                 "spender": spender_address,
                 "owner": self.account.address,
                 "allowance": allowance,
-                "allowance_formatted": allowance / (10**18),
+                "allowance_formatted": float(self.tokens.from_wei(token_address, allowance, self.web3)),
                 "balance": balance,
-                "balance_formatted": balance / (10**18)
+                "balance_formatted": float(self.tokens.from_wei(token_address, balance, self.web3))
             }
             
         except Exception as e:
@@ -107,8 +111,8 @@ class AllowanceManager:
                 abi=ERC20_ABI
             )
             
-            # Convert amount to wei (18 decimals)
-            amount_wei = int(float(amount) * (10 ** 18))
+            # Convert amount to base units in the token's decimals
+            amount_wei = self.tokens.to_wei(token_address, amount, self.web3)
             
             # Build transaction
             transaction = token_contract.functions.approve(
@@ -196,7 +200,9 @@ class AllowanceManager:
                 "gas_used": receipt.gasUsed,
                 "block_number": receipt.blockNumber,
                 "approved_amount": amount,
-                "approved_amount_formatted": amount / (10**18) if amount < 2**256 - 1 else "MAX"
+                "approved_amount_formatted": (
+                    float(self.tokens.from_wei(token_address, amount, self.web3)) if amount < 2**256 - 1 else "MAX"
+                )
             }
             
         except Exception as e:
@@ -208,7 +214,7 @@ class AllowanceManager:
     def approve_with_specific_amount(self, token_address: str, spender_address: str, 
                                      amount_in_tokens: float) -> dict:
         """Approve a specific amount in token units (e.g., 100 USDT)"""
-        amount_wei = int(amount_in_tokens * (10**18))
+        amount_wei = self.tokens.to_wei(token_address, amount_in_tokens, self.web3)
         return self.approve_token(token_address, spender_address, amount_wei)
 
 
@@ -0,0 +1,176 @@
+'''
+Order book analytics
+
+BookAnalytics keeps each side of an OrderBook as two numpy arrays, level
+prices and level volumes, best price first. It is attached to the book as
+a depth listener, so every order, cancel, amend or expiry updates only the
+levels it touched (a searchsorted plus an in-place write, or an insert or
+delete for a new or emptied level) instead of rebuilding from the trees.
+
+Mid, microprice, imbalance, cumulative depth curves and the impact cost of
+a given size are then computed with vector operations over those arrays.
+Levels aggregate every network pair: they describe the whole book, not
+what one particular taker could trade against.
+
+Usage:
+    analytics = BookAnalytics.attach(order_book)
+    analytics.summary(levels=20, size=100)
+'''
+
+import math
+
+import numpy as np
+
+SIDES = ("bid", "ask")
+
+
+class BookAnalytics(object):
+    def __init__(self):
+        # Bids are stored by negated price so both sides sort ascending, best first
+        self.keys = {side: np.empty(0) for side in SIDES}
+        self.volumes = {side: np.empty(0) for side in SIDES}
+        # Engine prices are Decimal; distinct Decimals that round to one float share a level
+        self.members = {side: {} for side in SIDES}
+
+    @classmethod
+    def attach(cls, order_book):
+        '''Analytics for order_book, built once from its trees and kept current from then on.'''
+        analytics = cls()
+        analytics.rebuild(order_book)
+        order_book.add_depth_listener(analytics.on_depth)
+        return analytics
+
+    def rebuild(self, order_book):
+        for side, tree in (("bid", order_book.bids), ("ask", order_book.asks)):
+            members = self.members[side] = {}
+            for price, price_list in tree.price_map.items():
+                key = -float(price) if side == "bid" else float(price)
+                members.setdefault(key, {})[price] = float(price_list.volume)
+            keys = sorted(members)
+            self.keys[side] = np.array(keys, dtype=float)
+            self.volumes[side] = np.array([sum(members[key].values()) for key in keys], dtype=float)
+
+    def on_depth(self, order_book, levels):
+        '''Depth listener: apply (side, price, volume) level changes.'''
+        for side, price, volume in levels:
+            key = -float(price) if side == "bid" else float(price)
+            members = self.members[side].setdefault(key, {})
+            if volume > 0:
+                members[price] = float(volume)
+            else:
+                members.pop(price, None)
+            total = sum(members.values())
+            if not members:
+                del self.members[side][key]
+
+            keys = self.keys[side]
+            index = np.searchsorted(keys, key)
+            exists = index < len(keys) and keys[index] == key
+            if total > 0:
+                if exists:
+                    self.volumes[side][index] = total
+                else:
+                    self.keys[side] = np.insert(keys, index, key)
+                    self.volumes[side] = np.insert(self.volumes[side], index, total)
+            elif exists:
+                self.keys[side] = np.delete(keys, index)
+                self.volumes[side] = np.delete(self.volumes[side], index)
+
+    # ==================== METRICS ====================
+
+    def prices(self, side):
+        '''Level prices of side, best first.'''
+        return -self.keys[side] if side == "bid" else self.keys[side]
+
+    def best(self, side):
+        keys = self.keys[side]
+        if not len(keys):
+            return None, 0.0
+        return float(-keys[0] if side == "bid" else keys[0]), float(self.volumes[side][0])
+
+    def mid(self):
+        (bid, _), (ask, _) = self.best("bid"), self.best("ask")
+        if bid is None or ask is None:
+            return None
+        return (bid + ask) / 2
+
+    def microprice(self):
+        '''Mid weighted by the opposite side's top size: leans toward the side likely to trade through.'''
+        (bid, bid_volume), (ask, ask_volume) = self.best("bid"), self.best("ask")
+        if bid is None or ask is None:
+            return None
+        return (bid * ask_volume + ask * bid_volume) / (bid_volume + ask_volume)
+
+    def imbalance(self, levels=1):
+        '''(bid volume - ask volume) / total over the top levels, in [-1, 1].'''
+        bid_volume = self.volumes["bid"][:levels].sum()
+        ask_volume = self.volumes["ask"][:levels].sum()
+        total = bid_volume + ask_volume
+        return float((bid_volume - ask_volume) / total) if total else None
+
+    def depth_curve(self, side, levels=None):
+        '''(prices, cumulative volumes) from the best level outwards.'''
+        prices = self.prices(side)[:levels]
+        return prices, np.cumsum(self.volumes[side][:levels])
+
+    def impact(self, side, size):
+        '''
+        Cost of a market order of size taking side ("bid" buys from the asks).
+
+        Returns the average fill price, how far it is from mid and from the
+        touch in basis points, and any size the book cannot absorb.
+        '''
+        book_side = "ask" if side == "bid" else "bid"
+        prices = self.prices(book_side)
+        volumes = self.volumes[book_side]
+        cumulative = np.cumsum(volumes)
+        # Each level gives its full volume until the remaining size runs out
+        fills = np.clip(size - (cumulative - volumes), 0, volumes)
+        filled = float(fills.sum())
+        if not filled:
+            return {"size": size, "filled": 0.0, "unfilled": size, "average_price": None,
+                    "levels": 0, "slippage_bps": None, "impact_bps": None}
+        average = float(np.dot(fills, prices)) / filled
+        touch = float(prices[0])
+        mid = self.mid()
+        direction = 1 if side == "bid" else -1
+        return {
+            "size": size,
+            "filled": filled,
+            "unfilled": max(size - filled, 0.0),
+            "average_price": average,
+            "levels": int(np.count_nonzero(fills)),
+            "slippage_bps": direction * (average - touch) / touch * 1e4,
+            "impact_bps": direction * (average - mid) / mid * 1e4 if mid else None,
+        }
+
+    def summary(self, levels=20, size=None):
+        (bid, bid_volume), (ask, ask_volume) = self.best("bid"), self.best("ask")
+        mid = self.mid()
+        spread = ask - bid if bid is not None and ask is not None else None
+        result = {
+            "bestBid": _number(bid),
+            "bestAsk": _number(ask),
+            "bestBidSize": float(bid_volume),
+            "bestAskSize": float(ask_volume),
+            "mid": _number(mid),
+            "microprice": _number(self.microprice()),
+            "spread": _number(spread),
+            "spreadBps": _number(spread / mid * 1e4) if spread is not None and mid else None,
+            "imbalance": self.imbalance(1),
+            "imbalanceDepth": self.imbalance(levels),
+            "levels": {side: int(len(self.keys[side])) for side in SIDES},
+            "depth": {},
+        }
+        for side in SIDES:
+            prices, cumulative = self.depth_curve(side, levels)
+            result["depth"][side + "s"] = {"prices": prices.tolist(), "cumulative": cumulative.tolist()}
+        if size is not None:
+            result["impact"] = {"buy": self.impact("bid", size), "sell": self.impact("ask", size)}
+        return result
+
+
+def _number(value):
+    if value is None or math.isnan(value):
+        return None
+    return float(value)
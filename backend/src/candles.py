@@ -0,0 +1,93 @@
+from collections import deque
+
+# Bar width in milliseconds for each supported resolution
+RESOLUTIONS = {
+    "1s": 1000,
+    "1m": 60 * 1000,
+    "5m": 5 * 60 * 1000,
+    "1h": 60 * 60 * 1000,
+}
+
+# Field positions inside a bar list
+START, OPEN, HIGH, LOW, CLOSE, VOLUME, TRADES = range(7)
+
+
+class CandleAggregator(object):
+    '''
+    Incrementally maintained OHLCV bars for a single order book.
+
+    Every trade updates the current bar of each resolution in O(1). Bars are
+    kept in bounded deques (max_bars per resolution), so serving a chart
+    costs O(bars) regardless of how many trades went into them.
+    '''
+
+    def __init__(self, resolutions=None, max_bars=1000):
+        self.resolutions = dict(resolutions or RESOLUTIONS)
+        self.max_bars = max_bars
+        self.bars = {name: deque(maxlen=max_bars) for name in self.resolutions}
+
+    def update(self, timestamp, price, quantity):
+        price = float(price)
+        quantity = float(quantity)
+        for name, width in self.resolutions.items():
+            series = self.bars[name]
+            start = timestamp - timestamp % width
+            late = False
+            if series and series[-1][START] == start:
+                bar = series[-1]
+            elif not series or series[-1][START] < start:
+                series.append([start, price, price, price, price, 0.0, 0])
+                bar = series[-1]
+            else:
+                late = True
+                # Late trade (replayed data): fold it into its bar if still held
+                bar = self._find_bar(series, start)
+                if bar is None:
+                    continue
+            if price > bar[HIGH]:
+                bar[HIGH] = price
+            if price < bar[LOW]:
+                bar[LOW] = price
+            if not late:
+                bar[CLOSE] = price
+            bar[VOLUME] += quantity
+            bar[TRADES] += 1
+
+    def get_candles(self, resolution, limit=None, start=None, end=None):
+        if resolution not in self.bars:
+            raise ValueError(
+                "Unsupported resolution %s, expected one of %s"
+                % (resolution, ", ".join(self.resolutions))
+            )
+        series = self.bars[resolution]
+        selected = []
+        # Walk back from the newest bar so only the requested bars are touched
+        for bar in reversed(series):
+            if end is not None and bar[START] > end:
+                continue
+            if start is not None and bar[START] < start:
+                break
+            selected.append(bar)
+            if limit is not None and len(selected) >= limit:
+                break
+        selected.reverse()
+        return [
+            {
+                "time": bar[START],
+                "open": bar[OPEN],
+                "high": bar[HIGH],
+                "low": bar[LOW],
+                "close": bar[CLOSE],
+                "volume": bar[VOLUME],
+                "trades": bar[TRADES],
+            }
+            for bar in selected
+        ]
+
+    def _find_bar(self, series, start):
+        for bar in reversed(series):
+            if bar[START] == start:
+                return bar
+            if bar[START] < start:
+                return None
+        return None
@@ -0,0 +1,498 @@
+'''
+Settlement contract event indexer
+
+Follows the settlement contract's logs on one network and stores them in
+a local SQLite database (WAL mode, and every reading thread has its own
+connection, so API reads never wait on the indexer's writes). Escrow
+activity, settlements and per-account history are then answered from
+indexed tables in milliseconds instead of with a contract call per
+question.
+
+One ContractEventIndexer runs per network. Each poll():
+
+- checks that the checkpoint block is still canonical; if its hash
+  changed (a reorg), it walks back through the recorded block hashes to
+  the newest block that still matches, deletes everything indexed above
+  it and resumes from there
+- reads logs for every indexed event type in one eth_getLogs call over a
+  large block range, halving the range when the node refuses it (too
+  many results, range limit) and growing it back after successes
+- decodes the logs with eth_abi and writes rows, block hashes and the new
+  checkpoint in one transaction, so a crash never leaves a gap
+
+Blocks within `confirmations` of the head are not indexed yet. Indexed
+settlements are passed to on_settled (which feeds the persistent
+SettledTradeIndex, where nothing is ever retracted) only once they are
+reorg_depth blocks deep, past what a rewind can remove.
+
+The indexer needs only web3.eth.block_number, get_block and get_logs, so
+it runs against any node, including a local dev chain:
+
+    python -m src.event_indexer --rpc http://127.0.0.1:8545 \\
+        --contract 0x... --db chain_events.db --from-block 0
+
+src/test_event_indexer.py runs it against a scripted chain (range
+halving, reorg rewinds, settlements held back until final, restart from
+the checkpoint).
+'''
+
+import argparse
+import asyncio
+import logging
+import sqlite3
+import threading
+import time
+
+from eth_abi import decode
+from eth_utils import keccak, to_checksum_address
+
+from . import metrics
+
+logger = logging.getLogger(__name__)
+
+SCHEMA = """
+CREATE TABLE IF NOT EXISTS events (
+    chain_id INTEGER NOT NULL,
+    block_number INTEGER NOT NULL,
+    tx_hash BLOB NOT NULL,
+    log_index INTEGER NOT NULL,
+    event TEXT NOT NULL,
+    order_id BLOB,
+    user TEXT,
+    counterparty TEXT,
+    token TEXT,
+    amount TEXT,  -- uint256 as a decimal string, beyond SQLite's 64-bit integers
+    is_source_chain INTEGER,
+    timestamp INTEGER,
+    PRIMARY KEY (chain_id, tx_hash, log_index)
+);
+CREATE INDEX IF NOT EXISTS events_account ON events (chain_id, user, token, block_number);
+CREATE INDEX IF NOT EXISTS events_counterparty ON events (chain_id, counterparty, token);
+CREATE INDEX IF NOT EXISTS events_order ON events (order_id);
+CREATE INDEX IF NOT EXISTS events_block ON events (chain_id, block_number);
+CREATE TABLE IF NOT EXISTS blocks (
+    chain_id INTEGER NOT NULL,
+    block_number INTEGER NOT NULL,
+    block_hash BLOB NOT NULL,
+    PRIMARY KEY (chain_id, block_number)
+);
+CREATE TABLE IF NOT EXISTS checkpoints (
+    chain_id INTEGER PRIMARY KEY,
+    block_number INTEGER NOT NULL,
+    block_hash BLOB NOT NULL
+);
+"""
+
+COLUMNS = (
+    "chain_id", "block_number", "tx_hash", "log_index", "event", "order_id",
+    "user", "counterparty", "token", "amount", "is_source_chain", "timestamp",
+)
+
+
+class EventIndexStore(object):
+    '''
+    SQLite store shared by the indexers of every network.
+
+    Writes go through one connection, used from the indexers' worker threads
+    and serialized by a lock. Reads use a connection per thread and take no
+    lock: under WAL they see the last committed state and never wait on a
+    write.
+    '''
+
+    def __init__(self, path):
+        self.path = path
+        self.lock = threading.Lock()
+        self.db = sqlite3.connect(path, check_same_thread=False, isolation_level=None)
+        self.db.row_factory = sqlite3.Row
+        self.db.execute("PRAGMA journal_mode=WAL")
+        self.db.execute("PRAGMA synchronous=NORMAL")
+        self.db.executescript(SCHEMA)
+        self.local = threading.local()
+        self.readers = []  # every thread's read connection, closed with the store
+
+    def _reader(self):
+        db = getattr(self.local, "db", None)
+        if db is None:
+            db = sqlite3.connect(self.path, check_same_thread=False, isolation_level=None)
+            db.row_factory = sqlite3.Row
+            self.local.db = db
+            with self.lock:
+                self.readers.append(db)
+        return db
+
+    def close(self):
+        with self.lock:
+            for db in self.readers:
+                db.close()
+            self.readers = []
+            self.db.close()
+
+    # ==================== WRITING ====================
+
+    def checkpoint(self, chain_id):
+        '''(block number, block hash) indexed up to, or None.'''
+        row = self._reader().execute(
+            "SELECT block_number, block_hash FROM checkpoints WHERE chain_id = ?", (chain_id,)
+        ).fetchone()
+        return (row["block_number"], bytes(row["block_hash"])) if row else None
+
+    def recorded_blocks(self, chain_id, below):
+        '''Recorded (number, hash) pairs at or below block `below`, newest first.'''
+        rows = self._reader().execute(
+            "SELECT block_number, block_hash FROM blocks WHERE chain_id = ? AND block_number <= ? "
+            "ORDER BY block_number DESC",
+            (chain_id, below),
+        ).fetchall()
+        return [(row["block_number"], bytes(row["block_hash"])) for row in rows]
+
+    def commit(self, chain_id, rows, blocks, checkpoint, keep_blocks):
+        '''Write decoded rows, block hashes and the new checkpoint in one transaction.'''
+        number, block_hash = checkpoint
+        with self.lock:
+            self.db.execute("BEGIN")
+            try:
+                self.db.executemany(
+                    "INSERT OR IGNORE INTO events (%s) VALUES (%s)" % (", ".join(COLUMNS), ", ".join("?" * len(COLUMNS))),
+                    rows,
+                )
+                self.db.executemany(
+                    "INSERT OR REPLACE INTO blocks VALUES (?, ?, ?)",
+                    [(chain_id, block_number, hash_) for block_number, hash_ in blocks],
+                )
+                self.db.execute(
+                    "INSERT OR REPLACE INTO checkpoints VALUES (?, ?, ?)", (chain_id, number, block_hash)
+                )
+                # Hashes are only needed as deep as a reorg can reach
+                self.db.execute(
+                    "DELETE FROM blocks WHERE chain_id = ? AND block_number < ?", (chain_id, number - keep_blocks)
+                )
+                self.db.execute("COMMIT")
+            except Exception:
+                self.db.execute("ROLLBACK")
+                raise
+
+    def rewind(self, chain_id, checkpoint):
+        '''Forget everything above checkpoint (number, hash) after a reorg.'''
+        number, block_hash = checkpoint
+        with self.lock:
+            self.db.execute("BEGIN")
+            try:
+                removed = self.db.execute(
+                    "DELETE FROM events WHERE chain_id = ? AND block_number > ?", (chain_id, number)
+                ).rowcount
+                self.db.execute("DELETE FROM blocks WHERE chain_id = ? AND block_number > ?", (chain_id, number))
+                self.db.execute(
+                    "INSERT OR REPLACE INTO checkpoints VALUES (?, ?, ?)", (chain_id, number, block_hash)
+                )
+                self.db.execute("COMMIT")
+            except Exception:
+                self.db.execute("ROLLBACK")
+                raise
+        return removed
+
+    # ==================== READING ====================
+
+    def escrow_summary(self, chain_id, user, token):
+        '''
+        Escrow flows of user in token from indexed events, in token base units.
+
+        balance is deposits - withdrawals - amounts the user's escrow paid out
+        in settlements; it is exact for everything indexed so far, i.e. up
+        to the checkpoint.
+        '''
+        user, token = to_checksum_address(user), to_checksum_address(token)
+        rows = self._reader().execute(
+            "SELECT event, amount FROM events WHERE chain_id = ? AND user = ? AND token = ?",
+            (chain_id, user, token),
+        ).fetchall()
+        totals = {"EscrowDepositEvent": 0, "EscrowWithdraw": 0, "CrossChainTradeSettled": 0, "EscrowLocked": 0}
+        for row in rows:
+            totals[row["event"]] += int(row["amount"])
+        return {
+            "deposited": totals["EscrowDepositEvent"],
+            "withdrawn": totals["EscrowWithdraw"],
+            "settled_out": totals["CrossChainTradeSettled"],
+            "locked": totals["EscrowLocked"],
+            "balance": totals["EscrowDepositEvent"] - totals["EscrowWithdraw"] - totals["CrossChainTradeSettled"],
+            "settlements": sum(1 for row in rows if row["event"] == "CrossChainTradeSettled"),
+        }
+
+    def history(self, chain_id, user, token=None, limit=100):
+        '''Newest first events where user is either side, optionally for one token; amounts as decimal strings.'''
+        user = to_checksum_address(user)
+        query = "SELECT * FROM events WHERE chain_id = ? AND (user = ? OR counterparty = ?)"
+        params = [chain_id, user, user]
+        if token is not None:
+            query += " AND token = ?"
+            params.append(to_checksum_address(token))
+        query += " ORDER BY block_number DESC, log_index DESC LIMIT ?"
+        params.append(limit)
+        rows = self._reader().execute(query, params).fetchall()
+        return [_row_dict(row) for row in rows]
+
+    def settlements(self, order_id):
+        '''Indexed CrossChainTradeSettled events for a bytes32 order id, on every chain.'''
+        rows = self._reader().execute(
+            "SELECT * FROM events WHERE order_id = ? AND event = 'CrossChainTradeSettled' ORDER BY chain_id",
+            (order_id,),
+        ).fetchall()
+        return [_row_dict(row) for row in rows]
+
+    def settled_between(self, chain_id, after, through):
+        '''CrossChainTradeSettled events of chain_id in blocks after < number <= through, as SettledTradeIndex entries.'''
+        rows = self._reader().execute(
+            "SELECT order_id, tx_hash, block_number, is_source_chain, timestamp FROM events "
+            "WHERE chain_id = ? AND event = 'CrossChainTradeSettled' AND block_number > ? AND block_number <= ? "
+            "ORDER BY block_number, log_index",
+            (chain_id, after, through),
+        ).fetchall()
+        return [
+            {
+                "order_id": bytes(row["order_id"]),
+                "chain_id": chain_id,
+                "is_source_chain": bool(row["is_source_chain"]),
+                "transaction_hash": bytes(row["tx_hash"]),
+                "block_number": row["block_number"],
+                "timestamp": row["timestamp"] * 1000,
+            }
+            for row in rows
+        ]
+
+
+def _row_dict(row):
+    entry = dict(row)
+    entry["tx_hash"] = "0x" + bytes(entry["tx_hash"]).hex()
+    entry["order_id"] = "0x" + bytes(entry["order_id"]).hex() if entry["order_id"] is not None else None
+    if entry["is_source_chain"] is not None:
+        entry["is_source_chain"] = bool(entry["is_source_chain"])
+    return entry
+
+
+# ==================== DECODING ====================
+
+INDEXED_EVENTS = ("CrossChainTradeSettled", "EscrowDepositEvent", "EscrowLocked", "EscrowWithdraw")
+
+
+class _EventDecoder(object):
+    def __init__(self, abi):
+        self.events = {}  # topic0 : (name, indexed inputs, data inputs)
+        for entry in abi:
+            if entry.get("type") != "event" or entry["name"] not in INDEXED_EVENTS:
+                continue
+            signature = "%s(%s)" % (entry["name"], ",".join(item["type"] for item in entry["inputs"]))
+            indexed = [item for item in entry["inputs"] if item.get("indexed")]
+            data = [item for item in entry["inputs"] if not item.get("indexed")]
+            self.events[keccak(text=signature)] = (entry["name"], indexed, data)
+        self.topics = ["0x" + topic.hex() for topic in self.events]
+
+    def decode(self, log):
+        '''(event name, {argument: value}) of a raw log, or None for other events.'''
+        topics = [bytes(topic) for topic in log["topics"]]
+        event = self.events.get(topics[0]) if topics else None
+        if event is None:
+            return None
+        name, indexed, data = event
+        args = {}
+        for item, topic in zip(indexed, topics[1:]):
+            args[item["name"]] = decode([item["type"]], topic)[0]
+        values = decode([item["type"] for item in data], bytes(log["data"]))
+        for item, value in zip(data, values):
+            args[item["name"]] = value
+        return name, args
+
+
+def _event_row(chain_id, log, name, args):
+    base = [chain_id, log["blockNumber"], bytes(log["transactionHash"]), log["logIndex"], name]
+    if name == "CrossChainTradeSettled":
+        rest = [
+            args["orderId"], to_checksum_address(args["sender"]), to_checksum_address(args["receiver"]),
+            to_checksum_address(args["assetSent"]), str(args["amountSent"]), int(args["isSourceChain"]),
+            args["timestamp"],
+        ]
+    elif name == "EscrowLocked":
+        rest = [args["orderId"], to_checksum_address(args["user"]), None, to_checksum_address(args["token"]),
+                str(args["amount"]), None, None]
+    else:  # deposits and withdrawals
+        rest = [None, to_checksum_address(args["user"]), None, to_checksum_address(args["token"]),
+                str(args["amount"]), None, args["timestamp"]]
+    return base + rest
+
+
+# ==================== INDEXER ====================
+
+
+class ContractEventIndexer(object):
+    def __init__(
+        self,
+        web3,
+        contract_address,
+        chain_id,
+        store,
+        abi,
+        start_block=None,
+        batch_blocks=5000,
+        confirmations=2,
+        reorg_depth=256,
+        on_settled=None,
+        network=None,
+    ):
+        self.web3 = web3
+        self.contract_address = to_checksum_address(contract_address)
+        self.chain_id = chain_id
+        self.store = store
+        self.decoder = _EventDecoder(abi)
+        self.start_block = start_block  # None: from the head at first start, history is not backfilled
+        self.max_batch = batch_blocks
+        self.batch = batch_blocks
+        self.confirmations = confirmations
+        self.reorg_depth = reorg_depth
+        # Called with CrossChainTradeSettled event dicts once they are reorg_depth blocks deep
+        self.on_settled = on_settled
+        self.settled_through = None  # block up to which settlements were passed to on_settled
+        self.network = network or str(chain_id)
+
+    def _block_hash(self, number):
+        return bytes(self.web3.eth.get_block(number)["hash"])
+
+    def _resume_point(self):
+        checkpoint = self.store.checkpoint(self.chain_id)
+        if checkpoint is None:
+            start = self.start_block
+            if start is None:
+                start = max(self.web3.eth.block_number - self.confirmations, 0)
+            return start - 1
+        number, block_hash = checkpoint
+        if number < 0 or self._block_hash(number) == block_hash:
+            return number
+        return self._handle_reorg(number)
+
+    def _handle_reorg(self, number):
+        fork = None
+        for recorded, block_hash in self.store.recorded_blocks(self.chain_id, number):
+            if self._block_hash(recorded) == block_hash:
+                fork = (recorded, block_hash)
+                break
+        if fork is None:
+            # Deeper than the recorded hashes reach: re-index the whole window
+            recorded = max(number - self.reorg_depth, 0)
+            fork = (recorded, self._block_hash(recorded))
+        removed = self.store.rewind(self.chain_id, fork)
+        metrics.ERRORS.labels("chain_reorg").inc()
+        logger.warning(
+            "Chain reorganisation: rewound indexed events",
+            extra={"network": self.network, "from_block": number, "to_block": fork[0], "removed": removed},
+        )
+        return fork[0]
+
+    def _get_logs(self, first, last):
+        t0 = time.perf_counter_ns()
+        try:
+            return self.web3.eth.get_logs({
+                "address": self.contract_address,
+                "fromBlock": first,
+                "toBlock": last,
+                "topics": [self.decoder.topics],
+            })
+        finally:
+            metrics.RPC_LATENCY.labels(self.network, "getLogs").observe_ns(time.perf_counter_ns() - t0)
+
+    def poll(self):
+        '''Index the next block range; returns how many blocks are left to reach the head.'''
+        last_indexed = self._resume_point()
+        if self.settled_through is None:
+            # What a previous run may not have passed on yet; on_settled entries are idempotent
+            self.settled_through = last_indexed - self.reorg_depth
+        chain_head = self.web3.eth.block_number
+        head = chain_head - self.confirmations
+        if head > last_indexed:
+            last_indexed = self._index(last_indexed + 1, head)
+        self._pass_settled(min(last_indexed, chain_head - self.reorg_depth))
+        return max(head - last_indexed, 0)
+
+    def _index(self, first, head):
+        '''Index blocks first.. up to head, as many as one getLogs call allows; returns the last indexed.'''
+        while True:
+            last = min(first + self.batch - 1, head)
+            try:
+                logs = self._get_logs(first, last)
+                break
+            except Exception as e:
+                if self.batch == 1:
+                    raise
+                # Nodes cap eth_getLogs by range or result count: retry with half the range
+                self.batch = max(self.batch // 2, 1)
+                logger.info("getLogs refused, retrying with %d blocks: %s", self.batch, e)
+        if self.batch < self.max_batch:
+            self.batch = min(self.batch * 2, self.max_batch)
+
+        rows, blocks = [], {}
+        for log in logs:
+            decoded = self.decoder.decode(log)
+            if decoded is None:
+                continue
+            name, args = decoded
+            rows.append(_event_row(self.chain_id, log, name, args))
+            blocks[log["blockNumber"]] = bytes(log["blockHash"])
+        last_hash = blocks.get(last) or self._block_hash(last)
+        blocks[last] = last_hash
+        self.store.commit(self.chain_id, rows, sorted(blocks.items()), (last, last_hash), self.reorg_depth)
+        return last
+
+    def _pass_settled(self, final):
+        '''Hand settlements in blocks no reorg can undo any more (up to final) to on_settled.'''
+        if self.on_settled is None or final <= self.settled_through:
+            return
+        settled = self.store.settled_between(self.chain_id, self.settled_through, final)
+        self.settled_through = final
+        if settled:
+            self.on_settled(settled)
+
+    async def run(self, interval=2.0):
+        '''Poll forever in a worker thread: back to back while behind, every interval once caught up.'''
+        while True:
+            try:
+                behind = await asyncio.to_thread(self.poll)
+            except asyncio.CancelledError:
+                raise
+            except Exception:
+                metrics.ERRORS.labels("event_indexer").inc()
+                logger.exception("Event indexer poll failed", extra={"network": self.network})
+                behind = 0
+            if not behind:
+                await asyncio.sleep(interval)
+
+
+def main():
+    from web3 import Web3
+    from .rpc_pool import provider_for
+    from .trade_settlement_client import load_abi
+
+    parser = argparse.ArgumentParser(description="Index settlement contract events into SQLite")
+    parser.add_argument("--rpc", required=True, help="RPC URL, or several comma separated")
+    parser.add_argument("--contract", required=True)
+    parser.add_argument("--db", default="chain_events.db")
+    parser.add_argument("--from-block", type=int, default=None)
+    parser.add_argument("--batch-blocks", type=int, default=5000)
+    parser.add_argument("--confirmations", type=int, default=0)
+    parser.add_argument("--once", action="store_true", help="catch up to the head and exit")
+    args = parser.parse_args()
+
+    logging.basicConfig(level=logging.INFO)
+    web3 = Web3(provider_for(args.rpc))
+    store = EventIndexStore(args.db)
+    indexer = ContractEventIndexer(
+        web3, args.contract, web3.eth.chain_id, store, load_abi("settlement_abi"),
+        start_block=args.from_block, batch_blocks=args.batch_blocks, confirmations=args.confirmations,
+    )
+    try:
+        if args.once:
+            while indexer.poll():
+                pass
+        else:
+            asyncio.run(indexer.run())
+    finally:
+        store.close()
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,304 @@
+import os
+import re
+import mmap
+import time
+import struct
+import hashlib
+import datetime
+from bisect import bisect_left
+from collections import namedtuple
+
+# Event types
+TRADE = 1
+NEW_ORDER = 2
+CANCEL = 3
+MODIFY = 4
+
+SIDES = {"bid": 0, "ask": 1}
+SIDE_NAMES = {0: "bid", 1: "ask"}
+
+# timestamp, seq, type, side, reserved, order_id, counter_order_id, price, quantity,
+# account, counter_account
+RECORD = struct.Struct("<qqBBHIqqdd20s20s")
+# running max timestamp, record number
+INDEX = struct.Struct("<qq")
+INDEX_STRIDE = 256  # one index entry every INDEX_STRIDE records
+# Symbols become directory names: BASE_QUOTE of letters and digits only (token names may hold a
+# network suffix, e.g. cNGN_BSC_USDT), so nothing can point outside the store root
+SYMBOL = re.compile(r"^[A-Za-z0-9]+(_[A-Za-z0-9]+)+$")
+
+Event = namedtuple(
+    "Event",
+    [
+        "timestamp",
+        "seq",
+        "type",
+        "side",
+        "order_id",
+        "counter_order_id",
+        "price",
+        "quantity",
+        "account",
+        "counter_account",
+    ],
+)
+
+
+def encode_account(account):
+    '''Pack an account into 20 bytes. EVM addresses are stored raw, anything else hashed.'''
+    if not account:
+        return bytes(20)
+    if isinstance(account, str) and account.startswith("0x") and len(account) == 42:
+        try:
+            return bytes.fromhex(account[2:])
+        except ValueError:
+            pass
+    return hashlib.blake2b(str(account).encode("utf-8"), digest_size=20).digest()
+
+
+def decode_account(raw):
+    return "0x" + raw.hex() if any(raw) else None
+
+
+def check_symbol(symbol):
+    if not isinstance(symbol, str) or not SYMBOL.match(symbol):
+        raise ValueError("Invalid symbol %r" % (symbol,))
+    return symbol
+
+
+def _day(timestamp):
+    return datetime.datetime.fromtimestamp(
+        timestamp / 1000.0, datetime.timezone.utc
+    ).strftime("%Y-%m-%d")
+
+
+class _Partition(object):
+    '''Append handle for one symbol/day data file and its time-index sidecar.'''
+
+    def __init__(self, path):
+        self.path = path
+        self.index_path = path[: -len(".evt")] + ".idx"
+        self.records, self.max_timestamp = _repair(path, self.index_path)
+        self.data = open(path, "ab", buffering=1 << 20)
+        self.index = open(self.index_path, "ab")
+
+    def append(self, packed, timestamp):
+        if timestamp > self.max_timestamp:
+            self.max_timestamp = timestamp
+        if self.records % INDEX_STRIDE == 0:
+            self.index.write(INDEX.pack(self.max_timestamp, self.records))
+        self.data.write(packed)
+        self.records += 1
+
+    def flush(self):
+        self.data.flush()
+        self.index.flush()
+
+    def close(self):
+        self.data.close()
+        self.index.close()
+
+
+class EventStore(object):
+    '''
+    Append-only, fixed-width binary store of trades and order events.
+
+    Files are partitioned as <root>/<symbol>/<YYYY-MM-DD>.evt, one RECORD per
+    event. Every INDEX_STRIDE records a (running max timestamp, record number)
+    entry is written to a .idx sidecar, so a time range is located with a
+    binary search over the index. Reads memory-map the data file and decode
+    records lazily, so scans never load a whole partition into memory.
+
+    Events are expected in time order within a partition (engine time only
+    moves forward: OrderBook.update_time does not follow the wall clock
+    back); a scan stops at the first record past end_time.
+    '''
+
+    def __init__(self, root, flush_interval=1.0):
+        self.root = root
+        self.partitions = {}  # (symbol, day) : _Partition
+        # Appends are buffered; at most flush_interval seconds of events are lost in a crash
+        # when appends keep coming, and callers flush() on a timer for the idle tail
+        self.flush_interval = flush_interval
+        self.last_flush = time.monotonic()
+        os.makedirs(root, exist_ok=True)
+
+    # ==================== WRITING ====================
+
+    def append(
+        self,
+        symbol,
+        event_type,
+        timestamp,
+        side=None,
+        order_id=0,
+        counter_order_id=0,
+        price=0,
+        quantity=0,
+        account=None,
+        counter_account=None,
+        seq=0,
+    ):
+        timestamp = int(timestamp)
+        packed = RECORD.pack(
+            timestamp,
+            seq,
+            event_type,
+            SIDES.get(side, 255),
+            0,
+            0,
+            int(order_id or 0),
+            int(counter_order_id or 0),
+            float(price),
+            float(quantity),
+            encode_account(account),
+            encode_account(counter_account),
+        )
+        self._partition(symbol, _day(timestamp)).append(packed, timestamp)
+        if time.monotonic() - self.last_flush >= self.flush_interval:
+            self.flush()
+
+    def flush(self):
+        for partition in self.partitions.values():
+            partition.flush()
+        self.last_flush = time.monotonic()
+
+    def close(self):
+        for partition in self.partitions.values():
+            partition.close()
+        self.partitions = {}
+
+    def _partition(self, symbol, day):
+        key = (symbol, day)
+        partition = self.partitions.get(key)
+        if partition is None:
+            check_symbol(symbol)
+            # A new day for the symbol: its earlier days are done, release their handles
+            for old in [other for other in self.partitions if other[0] == symbol and other[1] < day]:
+                self.partitions.pop(old).close()
+            directory = os.path.join(self.root, symbol)
+            os.makedirs(directory, exist_ok=True)
+            partition = _Partition(os.path.join(directory, day + ".evt"))
+            self.partitions[key] = partition
+        return partition
+
+    # ==================== READING ====================
+
+    def symbols(self):
+        return sorted(
+            name for name in os.listdir(self.root)
+            if SYMBOL.match(name) and os.path.isdir(os.path.join(self.root, name))
+        )
+
+    def days(self, symbol):
+        directory = os.path.join(self.root, check_symbol(symbol))
+        if not os.path.isdir(directory):
+            return []
+        return sorted(name[:-4] for name in os.listdir(directory) if name.endswith(".evt"))
+
+    def scan(self, symbol, start_time=None, end_time=None, event_types=None):
+        '''Stream Events for symbol with start_time <= timestamp <= end_time.'''
+        for block in self.scan_blocks(symbol, start_time, end_time):
+            for record in RECORD.iter_unpack(block):
+                timestamp = record[0]
+                if start_time is not None and timestamp < start_time:
+                    continue
+                if end_time is not None and timestamp > end_time:
+                    return
+                if event_types is not None and record[2] not in event_types:
+                    continue
+                yield Event(
+                    timestamp,
+                    record[1],
+                    record[2],
+                    SIDE_NAMES.get(record[3]),
+                    record[6],
+                    record[7],
+                    record[8],
+                    record[9],
+                    decode_account(record[10]),
+                    decode_account(record[11]),
+                )
+
+    def scan_blocks(self, symbol, start_time=None, end_time=None, block_records=65536):
+        '''
+        Stream raw memoryview blocks of whole RECORDs covering the time range.
+
+        Blocks start at the indexed position for start_time and may contain
+        records on either side of the range; callers that decode in bulk (e.g.
+        numpy.frombuffer) filter on the timestamp column themselves.
+        '''
+        self.flush()
+        first_day = _day(start_time) if start_time is not None else None
+        last_day = _day(end_time) if end_time is not None else None
+        for day in self.days(symbol):
+            if first_day is not None and day < first_day:
+                continue
+            if last_day is not None and day > last_day:
+                break
+            path = os.path.join(self.root, symbol, day + ".evt")
+            size = os.path.getsize(path) // RECORD.size * RECORD.size
+            if size == 0:
+                continue
+            first = 0
+            if start_time is not None:
+                first = _seek_index(path[: -len(".evt")] + ".idx", start_time)
+            with open(path, "rb") as data:
+                mapped = mmap.mmap(data.fileno(), size, access=mmap.ACCESS_READ)
+                view = memoryview(mapped)
+                try:
+                    step = block_records * RECORD.size
+                    offset = first * RECORD.size
+                    while offset < size:
+                        block = view[offset:min(offset + step, size)]
+                        try:
+                            yield block
+                        finally:
+                            block.release()
+                        offset += step
+                finally:
+                    view.release()
+                    mapped.close()
+
+
+def _read_index(index_path):
+    if not os.path.exists(index_path):
+        return []
+    with open(index_path, "rb") as index:
+        raw = index.read()
+    return list(INDEX.iter_unpack(raw[: len(raw) // INDEX.size * INDEX.size]))
+
+
+def _repair(path, index_path):
+    '''
+    Cut a torn last record (and index entries past it) left by a crash, so
+    appends stay aligned. Returns (record count, running max timestamp).
+    '''
+    if not os.path.exists(path):
+        open(path, "ab").close()
+    size = os.path.getsize(path)
+    records = size // RECORD.size
+    if size != records * RECORD.size:
+        os.truncate(path, records * RECORD.size)
+    entries = _read_index(index_path)
+    kept = [entry for entry in entries if entry[1] < records]
+    if os.path.exists(index_path) and os.path.getsize(index_path) != len(kept) * INDEX.size:
+        os.truncate(index_path, len(kept) * INDEX.size)
+    max_timestamp = kept[-1][0] if kept else 0
+    if records:
+        with open(path, "rb") as data:
+            data.seek((records - 1) * RECORD.size)
+            max_timestamp = max(max_timestamp, RECORD.unpack(data.read(RECORD.size))[0])
+    return records, max_timestamp
+
+
+def _seek_index(index_path, start_time):
+    '''First record that can hold a timestamp >= start_time.'''
+    entries = _read_index(index_path)
+    if not entries:
+        return 0
+    # Index timestamps are running maxima, so they are sorted even if records are not
+    position = bisect_left([entry[0] for entry in entries], start_time)
+    if position == 0:
+        return 0
+    return entries[position - 1][1]
@@ -0,0 +1,265 @@
+"""
+Low-overhead metrics with Prometheus text exposition
+
+Counters, gauges and log-linear (HDR-style) latency histograms. Recording
+is a dict lookup plus integer arithmetic, so metrics can sit on the
+matching path; formatting only happens when /metrics is scraped.
+
+Usage:
+    t0 = time.perf_counter_ns()
+    ...
+    STAGE_LATENCY.labels("matching").observe_ns(time.perf_counter_ns() - t0)
+    ORDERS.labels(symbol, side, "accepted").inc()
+"""
+
+import math
+import threading
+
+# Histogram resolution: 2**SUB_BUCKET_BITS buckets per power of two
+SUB_BUCKET_BITS = 2
+SUB_BUCKETS = 1 << SUB_BUCKET_BITS
+MIN_EXPONENT = 10  # 2**10 ns ~ 1us, everything below lands in the first bucket
+MAX_EXPONENT = 37  # 2**37 ns ~ 137s, everything above lands in +Inf
+
+
+def _bucket_bounds():
+    '''Upper bounds in nanoseconds of every finite histogram bucket.'''
+    bounds = [1 << MIN_EXPONENT]
+    for exponent in range(MIN_EXPONENT, MAX_EXPONENT):
+        base = 1 << exponent
+        step = base >> SUB_BUCKET_BITS
+        for sub in range(1, SUB_BUCKETS + 1):
+            bounds.append(base + sub * step)
+    return bounds
+
+
+BUCKET_BOUNDS_NS = _bucket_bounds()
+BUCKET_BOUNDS_S = ["%.9g" % (bound / 1e9) for bound in BUCKET_BOUNDS_NS]
+
+
+def bucket_index(value_ns):
+    '''Index into BUCKET_BOUNDS_NS for a nanosecond value, len(BUCKET_BOUNDS_NS) for +Inf.'''
+    if value_ns <= 1 << MIN_EXPONENT:
+        return 0
+    exponent = (value_ns - 1).bit_length() - 1
+    if exponent >= MAX_EXPONENT:
+        return len(BUCKET_BOUNDS_NS)
+    # Top SUB_BUCKET_BITS bits below the leading one pick the sub-bucket
+    sub = ((value_ns - 1) >> (exponent - SUB_BUCKET_BITS)) & (SUB_BUCKETS - 1)
+    return 1 + (exponent - MIN_EXPONENT) * SUB_BUCKETS + sub
+
+
+class _Metric(object):
+    kind = None
+
+    def __init__(self, name, documentation, labelnames=(), registry=None):
+        self.name = name
+        self.documentation = documentation
+        self.labelnames = tuple(labelnames)
+        self.children = {}
+        self.lock = threading.Lock()
+        if registry is None:
+            registry = REGISTRY
+        registry.register(self)
+
+    def labels(self, *values):
+        child = self.children.get(values)
+        if child is None:
+            with self.lock:
+                child = self.children.get(values)
+                if child is None:
+                    child = self.children[values] = self._new_child()
+        return child
+
+    def _label_text(self, values, extra=None):
+        pairs = list(zip(self.labelnames, values))
+        if extra:
+            pairs.append(extra)
+        if not pairs:
+            return ""
+        return "{%s}" % ",".join(
+            '%s="%s"' % (name, str(value).replace("\\", "\\\\").replace('"', '\\"').replace("\n", "\\n"))
+            for name, value in pairs
+        )
+
+    def render(self):
+        lines = [
+            "# HELP %s %s" % (self.name, self.documentation),
+            "# TYPE %s %s" % (self.name, self.kind),
+        ]
+        self._render_samples(lines)
+        return lines
+
+
+class _Value(object):
+    __slots__ = ("value",)
+
+    def __init__(self):
+        self.value = 0
+
+    def inc(self, amount=1):
+        self.value += amount
+
+    def dec(self, amount=1):
+        self.value -= amount
+
+    def set(self, value):
+        self.value = value
+
+
+class Counter(_Metric):
+    kind = "counter"
+
+    def _new_child(self):
+        return _Value()
+
+    def inc(self, amount=1):
+        self.labels().inc(amount)
+
+    def _render_samples(self, lines):
+        for values, child in sorted(self.children.items()):
+            lines.append("%s_total%s %s" % (self.name, self._label_text(values), _number(child.value)))
+
+
+class Gauge(_Metric):
+    '''A gauge set directly, or computed at scrape time by set_function.'''
+
+    kind = "gauge"
+
+    def __init__(self, name, documentation, labelnames=(), registry=None):
+        super(Gauge, self).__init__(name, documentation, labelnames, registry)
+        self.function = None
+
+    def _new_child(self):
+        return _Value()
+
+    def set(self, value):
+        self.labels().set(value)
+
+    def inc(self, amount=1):
+        self.labels().inc(amount)
+
+    def dec(self, amount=1):
+        self.labels().dec(amount)
+
+    def set_function(self, function):
+        '''function() returns {label values tuple: value}; evaluated only when scraped.'''
+        self.function = function
+
+    def _render_samples(self, lines):
+        samples = dict((values, child.value) for values, child in self.children.items())
+        if self.function is not None:
+            samples.update(self.function())
+        for values, value in sorted(samples.items()):
+            lines.append("%s%s %s" % (self.name, self._label_text(values), _number(value)))
+
+
+class _HistogramValue(object):
+    __slots__ = ("counts", "sum_ns", "count")
+
+    def __init__(self):
+        self.counts = [0] * (len(BUCKET_BOUNDS_NS) + 1)
+        self.sum_ns = 0
+        self.count = 0
+
+    def observe_ns(self, value_ns):
+        self.counts[bucket_index(value_ns)] += 1
+        self.sum_ns += value_ns
+        self.count += 1
+
+    def observe(self, seconds):
+        self.observe_ns(int(seconds * 1e9))
+
+    def percentile(self, q):
+        '''Approximate q-th percentile in seconds (upper bound of its bucket).'''
+        if not self.count:
+            return None
+        rank = math.ceil(q / 100.0 * self.count)
+        seen = 0
+        for index, count in enumerate(self.counts):
+            seen += count
+            if seen >= rank:
+                if index >= len(BUCKET_BOUNDS_NS):
+                    return float("inf")
+                return BUCKET_BOUNDS_NS[index] / 1e9
+        return None
+
+
+class Histogram(_Metric):
+    '''Latency histogram with log-linear buckets, recorded in integer nanoseconds.'''
+
+    kind = "histogram"
+
+    def _new_child(self):
+        return _HistogramValue()
+
+    def observe_ns(self, value_ns):
+        self.labels().observe_ns(value_ns)
+
+    def _render_samples(self, lines):
+        for values, child in sorted(self.children.items()):
+            counts = list(child.counts)
+            cumulative = 0
+            for index, bound in enumerate(BUCKET_BOUNDS_S):
+                cumulative += counts[index]
+                lines.append(
+                    "%s_bucket%s %d" % (self.name, self._label_text(values, ("le", bound)), cumulative)
+                )
+            cumulative += counts[-1]
+            lines.append("%s_bucket%s %d" % (self.name, self._label_text(values, ("le", "+Inf")), cumulative))
+            lines.append("%s_sum%s %s" % (self.name, self._label_text(values), _number(child.sum_ns / 1e9)))
+            lines.append("%s_count%s %d" % (self.name, self._label_text(values), cumulative))
+
+
+class Registry(object):
+    def __init__(self):
+        self.metrics = []
+
+    def register(self, metric):
+        self.metrics.append(metric)
+
+    def render(self):
+        lines = []
+        for metric in self.metrics:
+            lines.extend(metric.render())
+        return "\n".join(lines) + "\n"
+
+
+def _number(value):
+    if isinstance(value, float):
+        if math.isinf(value):
+            return "+Inf" if value > 0 else "-Inf"
+        return repr(value)
+    return str(value)
+
+
+REGISTRY = Registry()
+CONTENT_TYPE = "text/plain; version=0.0.4; charset=utf-8"
+
+# ==================== ENGINE / API METRICS ====================
+
+ORDERS = Counter("givex_orders", "Orders received, by outcome", ("symbol", "side", "outcome"))
+FILLS = Counter("givex_fills", "Fills produced by the matching engine", ("symbol",))
+ERRORS = Counter("givex_errors", "Errors, by type", ("type",))
+STAGE_LATENCY = Histogram(
+    "givex_stage_latency_seconds",
+    "Time spent in each stage of order handling",
+    ("stage",),
+)
+RPC_LATENCY = Histogram(
+    "givex_rpc_latency_seconds",
+    "Latency of settlement contract RPC calls, by endpoint and method",
+    ("endpoint", "method"),
+)
+RPC_POOL_EVENTS = Counter(
+    "givex_rpc_pool_events",
+    "RPC pool routing events (hedge, failover, circuit_open), by endpoint",
+    ("endpoint", "event"),
+)
+RPC_UP = Gauge("givex_rpc_up", "1 if the network's RPC answered the last connection check", ("network",))
+PRICE_REQUESTS = Counter("givex_price_requests", "Price proxy requests, by cache result", ("result",))
+BOOK_DEPTH = Gauge("givex_book_depth", "Price levels in the book", ("symbol", "side"))
+BOOK_ORDERS = Gauge("givex_book_orders", "Resting orders in the book", ("symbol", "side"))
+SETTLEMENT_IN_FLIGHT = Gauge(
+    "givex_settlement_in_flight", "Trades currently waiting on on-chain settlement"
+)
@@ -29,6 +29,9 @@ class Order(object):
         self.to_network = quote.get('to_network') if isinstance(quote, dict) else None
         # Optional receive wallet on the destination chain (where this party wants to receive tokens)
         self.receive_wallet = quote.get('receive_wallet') if isinstance(quote, dict) else None
+        # GTC (default) orders rest until filled or cancelled, GTT orders until expire_time (ms)
+        self.time_in_force = quote.get('time_in_force') or 'GTC'
+        self.expire_time = quote.get('expire_time')
 
     # helper functions to get Orders in linked list
     def next_order(self):
@@ -1,16 +1,35 @@
 import sys
 import math
-from collections import deque  # a faster insert/pop queue
 from six.moves import cStringIO as StringIO
 from decimal import Decimal
 import json
 from .ordertree import OrderTree
+from .tape import Tape, from_fixed
+from .candles import CandleAggregator
+from .timer_wheel import TimerWheel
+from . import event_store as events
 import time
+import logging
+
+logger = logging.getLogger(__name__)
+
+# Time in force: good till cancelled, immediate or cancel, fill or kill, good till time
+TIME_IN_FORCE = ("GTC", "IOC", "FOK", "GTT")
+RESTING_TIME_IN_FORCE = ("GTC", "GTT")
 
 
 class OrderBook(object):
-    def __init__(self, tick_size=0.0001):
-        self.tape = deque(maxlen=None)  # Index[0] is most recent trade
+    def __init__(
+        self,
+        tick_size=0.0001,
+        tape_capacity=100000,
+        tape_spill_dir=None,
+        symbol=None,
+        event_store=None,
+    ):
+        # Bounded columnar ring buffer of recent trades, oldest chunks spill to disk
+        self.tape = Tape(tape_capacity, tape_spill_dir)
+        self.candles = CandleAggregator()  # OHLCV bars updated as trades hit the tape
         self.bids = OrderTree()
         self.asks = OrderTree()
         self.last_tick = None
@@ -18,16 +37,23 @@ class OrderBook(object):
         self.tick_size = tick_size
         self.time = 0
         self.next_order_id = 0
+        self.symbol = symbol
+        self.event_store = event_store  # optional persistent history of trades and order events
+        self.version = 0  # bumped whenever resting orders may have changed, lets readers cache snapshots
+        self.depth_listeners = []  # listener(book, levels) called with changed (side, price, volume) levels
+        self.expiries = None  # TimerWheel of resting GTT orders, created with the first one
 
     def update_time(self):
         # self.time += 1
-        self.time = int(time.time() * 1000)  # convert to milliseconds
+        # Milliseconds; never steps back with the wall clock, so the journal stays in time order
+        self.time = max(self.time, int(time.time() * 1000))
 
-    def process_order(self, quote, from_data, verbose):
+    def process_order(self, quote, from_data, verbose, exclude=None):
         order_type = quote["type"]
         order_in_book = None
         task_id = 0
         next_best_order = None
+        self.version += 1
         if from_data:
             self.time = quote["timestamp"]
         else:
@@ -38,25 +64,31 @@ class OrderBook(object):
         if not from_data:
             self.next_order_id += 1
         if order_type == "market":
-            trades = self.process_market_order(quote, verbose)
+            trades = self.process_market_order(quote, verbose, exclude)
         elif order_type == "limit":
             quote["price"] = Decimal(quote["price"])
             try:
                 trades, order_in_book, task_id, next_best_order = (
-                    self.process_limit_order(quote, from_data, verbose)
+                    self.process_limit_order(quote, from_data, verbose, exclude)
                 )
             except Exception as e:
                 return {"success": False, "message": str(e)}
         else:
             sys.exit("order_type for process_order() is neither 'market' or 'limit'")
 
+        if self.depth_listeners:
+            touched = set((trade["party1"][1], trade["price"]) for trade in trades)
+            if order_in_book is not None:
+                touched.add((quote["side"], quote["price"]))
+            self._publish_depth(touched)
+
         return {
             "success": True,
             "data": [trades, order_in_book, task_id, next_best_order],
         }
 
     def process_order_list(
-        self, side, order_list, quantity_still_to_trade, quote, verbose
+        self, side, order_list, quantity_still_to_trade, quote, verbose, exclude=None
     ):
         """
         Takes an OrderList (stack of orders at one price) and an incoming order and matches
@@ -85,248 +117,411 @@ class OrderBook(object):
                 current_order = next_order
                 continue
 
-            traded_price = head_order.price
-            counter_party = head_order.trade_id
-            new_book_quantity = None
-
-            if quantity_to_trade < head_order.quantity:
-                traded_quantity = quantity_to_trade
-                # Do the transaction (partial fill)
-                new_book_quantity = head_order.quantity - quantity_to_trade
-                head_order.update_quantity(new_book_quantity, head_order.timestamp)
-                quantity_to_trade = 0
-            elif quantity_to_trade == head_order.quantity:
-                traded_quantity = quantity_to_trade
-                # full fill - remove the order
-                if side == "bid":
-                    self.bids.remove_order_by_id(head_order.order_id)
-                else:
-                    self.asks.remove_order_by_id(head_order.order_id)
-                quantity_to_trade = 0
-            else:
-                traded_quantity = head_order.quantity
-                if side == "bid":
-                    self.bids.remove_order_by_id(head_order.order_id)
-                else:
-                    self.asks.remove_order_by_id(head_order.order_id)
-                quantity_to_trade -= traded_quantity
-
-            if verbose:
-                print(
-                    (
-                        "TRADE: Time - {}, Price - {}, Quantity - {}, TradeID - {}, Matching TradeID - {}".format(
-                            self.time,
-                            traded_price,
-                            traded_quantity,
-                            counter_party,
-                            quote["trade_id"],
-                        )
-                    )
-                )
-
-            transaction_record = {
-                "timestamp": self.time,
-                "price": traded_price,
-                "quantity": traded_quantity,
-                "time": self.time,
-            }
+            if head_order.expire_time is not None and head_order.expire_time <= self.time:
+                # Expired GTT order the next expire_orders() sweep will remove
+                current_order = next_order
+                continue
 
-            # Build party arrays including network and receive wallet
-            head_receive = getattr(head_order, "receive_wallet", None)
-            quote_receive = quote.get("receive_wallet") if isinstance(quote, dict) else None
+            if exclude and head_order.order_id in exclude:
+                # The caller ruled this counterparty out, e.g. for insufficient escrow
+                current_order = next_order
+                continue
 
-            if side == "bid":
-                transaction_record["party1"] = [
-                    counter_party,
-                    "bid",
-                    head_order.order_id,
-                    new_book_quantity,
-                    head_order.private_key,
-                    getattr(head_order, "from_network", None),
-                    getattr(head_order, "to_network", None),
-                    head_receive,
-                ]
-                transaction_record["party2"] = [
-                    quote["trade_id"],
-                    "ask",
-                    None,
-                    None,
-                    quote["private_key"],
-                    quote.get("from_network") if isinstance(quote, dict) else None,
-                    quote.get("to_network") if isinstance(quote, dict) else None,
-                    quote_receive,
-                ]
-            else:
-                transaction_record["party1"] = [
-                    counter_party,
-                    "ask",
-                    head_order.order_id,
-                    new_book_quantity,
-                    head_order.private_key,
-                    getattr(head_order, "from_network", None),
-                    getattr(head_order, "to_network", None),
-                    head_receive,
-                ]
-                transaction_record["party2"] = [
-                    quote["trade_id"],
-                    "bid",
-                    None,
-                    None,
-                    quote["private_key"],
-                    quote.get("from_network") if isinstance(quote, dict) else None,
-                    quote.get("to_network") if isinstance(quote, dict) else None,
-                    quote_receive,
-                ]
-
-            self.tape.append(transaction_record)
+            traded_quantity, transaction_record = self._fill(side, head_order, quantity_to_trade, quote, verbose)
+            quantity_to_trade -= traded_quantity
             trades.append(transaction_record)
 
             # Continue from next order
             current_order = next_order
         return quantity_to_trade, trades
 
-    def process_market_order(self, quote, verbose):
+    def _fill(self, side, head_order, quantity_to_trade, quote, verbose):
+        '''Trade quote against resting head_order (on side); returns (traded quantity, trade record)'''
+        traded_price = head_order.price
+        counter_party = head_order.trade_id
+        new_book_quantity = None
+
+        if quantity_to_trade < head_order.quantity:
+            traded_quantity = quantity_to_trade
+            # Do the transaction (partial fill)
+            new_book_quantity = head_order.quantity - quantity_to_trade
+            head_order.update_quantity(new_book_quantity, head_order.timestamp)
+        else:
+            traded_quantity = head_order.quantity
+            # full fill - remove the order
+            if side == "bid":
+                self.bids.remove_order_by_id(head_order.order_id)
+            else:
+                self.asks.remove_order_by_id(head_order.order_id)
+
+        if verbose:
+            logger.info(
+                "TRADE: Time - %s, Price - %s, Quantity - %s, TradeID - %s, Matching TradeID - %s",
+                self.time,
+                traded_price,
+                traded_quantity,
+                counter_party,
+                quote["trade_id"],
+            )
+
+        transaction_record = {
+            "timestamp": self.time,
+            "price": traded_price,
+            "quantity": traded_quantity,
+            "time": self.time,
+        }
+
+        # Build party arrays including network and receive wallet
+        head_receive = getattr(head_order, "receive_wallet", None)
+        quote_receive = quote.get("receive_wallet") if isinstance(quote, dict) else None
+
+        if side == "bid":
+            transaction_record["party1"] = [
+                counter_party,
+                "bid",
+                head_order.order_id,
+                new_book_quantity,
+                head_order.private_key,
+                getattr(head_order, "from_network", None),
+                getattr(head_order, "to_network", None),
+                head_receive,
+            ]
+            transaction_record["party2"] = [
+                quote["trade_id"],
+                "ask",
+                None,
+                None,
+                quote["private_key"],
+                quote.get("from_network") if isinstance(quote, dict) else None,
+                quote.get("to_network") if isinstance(quote, dict) else None,
+                quote_receive,
+            ]
+        else:
+            transaction_record["party1"] = [
+                counter_party,
+                "ask",
+                head_order.order_id,
+                new_book_quantity,
+                head_order.private_key,
+                getattr(head_order, "from_network", None),
+                getattr(head_order, "to_network", None),
+                head_receive,
+            ]
+            transaction_record["party2"] = [
+                quote["trade_id"],
+                "bid",
+                None,
+                None,
+                quote["private_key"],
+                quote.get("from_network") if isinstance(quote, dict) else None,
+                quote.get("to_network") if isinstance(quote, dict) else None,
+                quote_receive,
+            ]
+
+        seq = self.tape.append(
+            self.time, traded_price, traded_quantity, counter_party, quote["trade_id"]
+        )
+        self.candles.update(self.time, traded_price, traded_quantity)
+        if self.event_store is not None:
+            self.event_store.append(
+                self.symbol,
+                events.TRADE,
+                self.time,
+                side=side,
+                order_id=head_order.order_id,
+                counter_order_id=quote.get("order_id") or self.next_order_id,
+                price=traded_price,
+                quantity=traded_quantity,
+                account=head_order.account,
+                counter_account=quote.get("account"),
+                seq=seq,
+            )
+        return traded_quantity, transaction_record
+
+    def process_market_order(self, quote, verbose, exclude=None):
         trades = []
         quantity_to_trade = quote["quantity"]
         side = quote["side"]
         if side == "bid":
-            while quantity_to_trade > 0 and self.asks:
-                best_price_asks = self.asks.min_price_list()
+            # Walk levels upwards: a level may hold only network-incompatible orders
+            price_level = self.asks.min_price()
+            while quantity_to_trade > 0 and price_level is not None:
                 quantity_to_trade, new_trades = self.process_order_list(
-                    "ask", best_price_asks, quantity_to_trade, quote, verbose
+                    "ask", self.asks.get_price_list(price_level), quantity_to_trade, quote, verbose, exclude
                 )
                 trades += new_trades
+                price_level = self.asks.price_above(price_level)
         elif side == "ask":
-            while quantity_to_trade > 0 and self.bids:
-                best_price_bids = self.bids.max_price_list()
+            price_level = self.bids.max_price()
+            while quantity_to_trade > 0 and price_level is not None:
                 quantity_to_trade, new_trades = self.process_order_list(
-                    "bid", best_price_bids, quantity_to_trade, quote, verbose
+                    "bid", self.bids.get_price_list(price_level), quantity_to_trade, quote, verbose, exclude
                 )
                 trades += new_trades
+                price_level = self.bids.price_below(price_level)
         else:
             sys.exit('process_market_order() recieved neither "bid" nor "ask"')
         return trades
 
-    def process_limit_order(self, quote, from_data, verbose):
-        # Note: modified so that only one trade can happen
-        # If the quote quantity is less than the best opposing side order quantity, partial fill
-        # If the quote quantity is the same as the best opposing side order quantity, complete fill
-        # If the quote quatity is larger than the best opposing side order quantity, reject this quote
-
+    def process_limit_order(self, quote, from_data, verbose, exclude=None):
+        # A crossing order trades against every compatible resting order it reaches, across as
+        # many price levels as it needs, in this one call: plan_fills() picks the fills, then
+        # they are applied. Callers can plan first to check every counterparty's escrow and
+        # pass the order ids that failed as exclude.
         order_in_book = None
         trades = []
         quantity_to_trade = quote["quantity"]
         side = quote["side"]
         price = quote["price"]
 
-        task_id = 0  # only set for partial or complete fills
+        task_id = 0
         next_best_order = None
 
         if quantity_to_trade <= 0:
             raise Exception("No orders of size 0 or less")
-
         if side == "bid":
-            # If we have asks, and we cross the spread, and we're covering more than one order, reject
-            if self.asks and price >= self.asks.min_price():
-                min_price_orders = self.asks.min_price_list()
-                if quantity_to_trade < min_price_orders.head_order.quantity:
-                    # Partial fill
-                    task_id = 3
-                elif quantity_to_trade == min_price_orders.head_order.quantity:
-                    # Complete fill
-                    task_id = 4
-                    if len(min_price_orders) > 1:
-                        next_best_order = min_price_orders[1]
-                else:
-                    # More than one order covered, reject this for now
-                    # This is disabled for now as we only track and lock funds for the best order on-chain
-                    raise Exception(
-                        "Not currently accepting orders larger than best order"
-                    )
+            own, opposite_side = self.bids, "ask"
+        elif side == "ask":
+            own, opposite_side = self.asks, "bid"
+        else:
+            sys.exit('process_limit_order() given neither "bid" nor "ask"')
+
+        time_in_force = quote.get("time_in_force") or "GTC"
+        if time_in_force not in TIME_IN_FORCE:
+            raise Exception("Unknown time in force %s" % time_in_force)
+        if time_in_force == "GTT" and (quote.get("expire_time") or 0) <= self.time:
+            raise Exception("GTT order needs an expire_time in the future")
+        fills = self.plan_fills(quote, exclude)
+        if time_in_force == "FOK" and sum(quantity for _, quantity in fills) < quantity_to_trade:
+            # Fill or kill: nothing trades unless the whole quantity can
+            return trades, order_in_book, task_id, next_best_order
+        # IOC and FOK remainders are dropped instead of resting
+        rests = time_in_force in RESTING_TIME_IN_FORCE
+
+        # Task ids: 1 rests behind the best price, 2 improves it, 3 partially fills the first
+        # resting order, 4 fills it exactly, 5 sweeps through it into further orders
+        if fills:
+            first_order = fills[0][0]
+            if quantity_to_trade < first_order.quantity:
+                task_id = 3
+            elif quantity_to_trade == first_order.quantity:
+                task_id = 4
+                next_best_order = first_order.next_order
             else:
+                task_id = 5
+        else:
+            best = own.max_price() if side == "bid" else own.min_price()
+            improves = best is None or (price > best if side == "bid" else price < best)
+            task_id = 2 if improves else 1
 
-                if (self.bids.max_price() is None) or (price > self.bids.max_price()):
-                    task_id = 2
-                else:
-                    task_id = 1
+        for order, quantity in fills:
+            traded_quantity, transaction_record = self._fill(opposite_side, order, quantity, quote, verbose)
+            quantity_to_trade -= traded_quantity
+            trades.append(transaction_record)
+        # If volume remains, need to update the book with new quantity
+        if quantity_to_trade > 0 and rests:
+            if not from_data:
+                quote["order_id"] = self.next_order_id
+            quote["quantity"] = quantity_to_trade
+            own.insert_order(quote)
+            order_in_book = quote
+            self._record_order_event(events.NEW_ORDER, quote)
+            if time_in_force == "GTT":
+                self._schedule_expiry(quote)
 
-            # Some of this is redundant now but should still work
-            while (
-                self.asks and price >= self.asks.min_price() and quantity_to_trade > 0
-            ):
-                best_price_asks = self.asks.min_price_list()
-                quantity_to_trade, new_trades = self.process_order_list(
-                    "ask", best_price_asks, quantity_to_trade, quote, verbose
-                )
-                trades += new_trades
-            # If volume remains, need to update the book with new quantity
-            if quantity_to_trade > 0:
-                if not from_data:
-                    quote["order_id"] = self.next_order_id
-                quote["quantity"] = quantity_to_trade
-                self.bids.insert_order(quote)
-                order_in_book = quote
-        elif side == "ask":
-            # If we have bids, and we cross the spread, and we're covering more than one order, reject
-            if self.bids and price <= self.bids.max_price():
-                max_price_orders = self.bids.max_price_list()
-                if quantity_to_trade < max_price_orders.head_order.quantity:
-                    # Partial fill
-                    task_id = 3
-                elif quantity_to_trade == max_price_orders.head_order.quantity:
-                    # Complete fill
-                    task_id = 4
-                    if len(max_price_orders) > 1:
-                        next_best_order = max_price_orders.head_order.next_order
-                else:
-                    # More than one order covered, reject this for now
-                    # This is disabled for now as we only track and lock funds for the best order on-chain
-                    raise Exception(
-                        "Not currently accepting orders larger than best order"
-                    )
-            else:
-                if (self.asks.min_price() is None) or (price < self.asks.min_price()):
-                    task_id = 2
-                else:
-                    task_id = 1
+        return trades, order_in_book, task_id, next_best_order
 
-            # Partly redundant but should still work
-            while (
-                self.bids and price <= self.bids.max_price() and quantity_to_trade > 0
-            ):
-                best_price_bids = self.bids.max_price_list()
-                quantity_to_trade, new_trades = self.process_order_list(
-                    "bid", best_price_bids, quantity_to_trade, quote, verbose
-                )
-                trades += new_trades
-            # If volume remains, need to update the book with new quantity
-            if quantity_to_trade > 0:
-                if not from_data:
-                    quote["order_id"] = self.next_order_id
-                quote["quantity"] = quantity_to_trade
-                self.asks.insert_order(quote)
-                order_in_book = quote
+    def plan_fills(self, quote, exclude=None):
+        '''
+        The (Order, quantity) fills quote would get right now, best price first.
+
+        Nothing is changed. Follows the matching rules exactly: compatible
+        network pair, not expired, not in exclude, within the limit price
+        (any price for market orders), up to the quote's quantity.
+        '''
+        side, wanted = quote["side"], quote["quantity"]
+        price = quote["price"] if quote.get("type", "limit") == "limit" else None
+        if side == "bid":
+            tree, price_level, next_level = self.asks, self.asks.min_price(), self.asks.price_above
         else:
-            sys.exit('process_limit_order() given neither "bid" nor "ask"')
+            tree, price_level, next_level = self.bids, self.bids.max_price(), self.bids.price_below
+        quote_from, quote_to = quote.get("from_network"), quote.get("to_network")
+        fills = []
+        while price_level is not None and wanted > 0:
+            if price is not None and (price < price_level if side == "bid" else price > price_level):
+                break
+            order = tree.get_price_list(price_level).head_order
+            while order is not None and wanted > 0:
+                if (
+                    order.from_network == quote_to
+                    and order.to_network == quote_from
+                    and (order.expire_time is None or order.expire_time > self.time)
+                    and not (exclude and order.order_id in exclude)
+                ):
+                    quantity = min(wanted, order.quantity)
+                    fills.append((order, quantity))
+                    wanted -= quantity
+                order = order.next_order
+            price_level = next_level(price_level)
+        return fills
+
+    def simulate(self, side, quantity, network_pair, price=None):
+        '''
+        What a taker on side would get for quantity right now, without trading.
+
+        network_pair is the taker's (from_network, to_network); price, if
+        given, caps the walk like a limit order. Uses plan_fills(), so only
+        the levels and orders actually reached are visited and nothing in
+        the book changes. Returns the fill schedule per price level, the
+        VWAP and its slippage from the first fill and from mid.
+        '''
+        if side not in ("bid", "ask"):
+            raise ValueError('side must be "bid" or "ask"')
+        quantity = Decimal(str(quantity))
+        if quantity <= 0:
+            raise ValueError("quantity must be positive")
+        from_network, to_network = network_pair
+        quote = {
+            "side": side,
+            "quantity": quantity,
+            "type": "market" if price is None else "limit",
+            "price": None if price is None else Decimal(str(price)),
+            "from_network": from_network,
+            "to_network": to_network,
+        }
+        levels = []
+        filled = notional = Decimal(0)
+        for order, fill_quantity in self.plan_fills(quote):
+            if levels and levels[-1]["price"] == order.price:
+                level = levels[-1]
+            else:
+                level = {"price": order.price, "quantity": Decimal(0), "orders": 0}
+                levels.append(level)
+            level["quantity"] += fill_quantity
+            level["orders"] += 1
+            filled += fill_quantity
+            notional += fill_quantity * order.price
+
+        best_bid, best_ask = self.get_best_bid(), self.get_best_ask()
+        mid = (best_bid + best_ask) / 2 if best_bid is not None and best_ask is not None else None
+        vwap = notional / filled if filled else None
+        first_price = levels[0]["price"] if levels else None
+
+        def bps(reference):
+            # Positive is always worse for the taker: paying up or selling down
+            if not filled or not reference:
+                return None
+            gap = vwap - reference if side == "bid" else reference - vwap
+            return gap / reference * 10000
 
-        assert len(trades) == 1 or len(trades) == 0
-        return trades, order_in_book, task_id, next_best_order
+        return {
+            "side": side,
+            "quantity": quantity,
+            "filled": filled,
+            "unfilled": quantity - filled,
+            "notional": notional,
+            "vwap": vwap,
+            "worst_price": levels[-1]["price"] if levels else None,
+            "levels": levels,
+            "slippage_bps": bps(first_price),
+            "mid": mid,
+            "impact_bps": bps(mid),
+        }
+
+    def _schedule_expiry(self, quote):
+        if self.expiries is None:
+            self.expiries = TimerWheel(start=self.time)
+        elif not self.expiries:
+            self.expiries.advance(self.time)  # idle wheel: jump its clock forward for free
+        self.expiries.schedule(quote["expire_time"], (quote["side"], quote["order_id"]))
+
+    def expire_orders(self, now=None):
+        '''
+        Remove resting GTT orders whose expire_time has passed and return them.
+
+        Only orders that actually expire are touched (see timer_wheel.py);
+        depth listeners get one update for all of them.
+        '''
+        if self.expiries is None:
+            return []
+        if now is None:
+            now = int(time.time() * 1000)
+        if now > self.time:
+            self.time = now
+        expired = []
+        touched = set()
+        for deadline, (side, order_id) in self.expiries.advance(now):
+            tree = self.bids if side == "bid" else self.asks
+            order = tree.order_map.get(order_id)
+            # Filled, cancelled or amended to a new expiry since it was scheduled
+            if order is None or order.expire_time != deadline:
+                continue
+            self._record_order_event(events.CANCEL, order)
+            tree.remove_order_by_id(order_id)
+            touched.add((side, order.price))
+            expired.append(order)
+        if expired:
+            self.version += 1
+            if self.depth_listeners:
+                self._publish_depth(touched)
+        return expired
 
     def cancel_order(self, side, order_id, time=None):
+        self.version += 1
         if time:
             self.time = time
         else:
             self.update_time()
         if side == "bid":
-            if self.bids.order_exists(order_id):
-                self.bids.remove_order_by_id(order_id)
+            tree = self.bids
         elif side == "ask":
-            if self.asks.order_exists(order_id):
-                self.asks.remove_order_by_id(order_id)
+            tree = self.asks
         else:
             sys.exit('cancel_order() given neither "bid" nor "ask"')
+        if tree.order_exists(order_id):
+            order = tree.get_order(order_id)
+            self._record_order_event(events.CANCEL, order)
+            tree.remove_order_by_id(order_id)
+            if self.depth_listeners:
+                self._publish_depth([(side, order.price)])
+
+    def mass_cancel(self, account, side=None, from_network=None, to_network=None, time=None):
+        '''
+        Cancel every resting order of account, optionally only on one side
+        and/or for one network pair, and return the cancelled Orders.
+
+        Uses the trees' per-account index, so the cost is proportional to the
+        number of orders cancelled. Depth listeners get a single update
+        covering every price level touched.
+        '''
+        if side not in (None, "bid", "ask"):
+            sys.exit('mass_cancel() given neither "bid" nor "ask"')
+        if time:
+            self.time = time
+        else:
+            self.update_time()
+        cancelled = []
+        touched = set()
+        for tree_side, tree in (("bid", self.bids), ("ask", self.asks)):
+            if side is not None and side != tree_side:
+                continue
+            for order in tree.get_account_orders(account):
+                if from_network is not None and order.from_network != from_network:
+                    continue
+                if to_network is not None and order.to_network != to_network:
+                    continue
+                self._record_order_event(events.CANCEL, order)
+                tree.remove_order_by_id(order.order_id)
+                touched.add((tree_side, order.price))
+                cancelled.append(order)
+        if cancelled:
+            self.version += 1
+            if self.depth_listeners:
+                self._publish_depth(touched)
+        return cancelled
 
     def modify_order(self, order_id, order_update, time=None):
+        self.version += 1
         if time:
             self.time = time
         else:
@@ -335,13 +530,67 @@ class OrderBook(object):
         order_update["order_id"] = order_id
         order_update["timestamp"] = self.time
         if side == "bid":
-            if self.bids.order_exists(order_update["order_id"]):
-                self.bids.update_order(order_update)
+            tree = self.bids
         elif side == "ask":
-            if self.asks.order_exists(order_update["order_id"]):
-                self.asks.update_order(order_update)
+            tree = self.asks
         else:
             sys.exit('modify_order() given neither "bid" nor "ask"')
+        if tree.order_exists(order_id):
+            old_price = tree.get_order(order_id).price
+            tree.update_order(order_update)
+            order = tree.get_order(order_id)
+            self._record_order_event(events.MODIFY, order)
+            if self.depth_listeners:
+                self._publish_depth([(side, old_price), (side, order.price)])
+
+    def add_depth_listener(self, listener):
+        '''Call listener(book, levels) after every change to resting depth.
+
+        levels is a list of (side, price, volume) for each touched price level,
+        volume 0 when the level is gone. One operation produces one call.
+        '''
+        self.depth_listeners.append(listener)
+
+    def remove_depth_listener(self, listener):
+        self.depth_listeners.remove(listener)
+
+    def _publish_depth(self, touched):
+        levels = []
+        for side, price in set(touched):
+            price_map = (self.bids if side == "bid" else self.asks).price_map
+            price_list = price_map.get(price)
+            levels.append((side, price, price_list.volume if price_list is not None else 0))
+        for listener in self.depth_listeners:
+            try:
+                listener(self, levels)
+            except Exception:
+                logger.exception("Depth listener failed")
+
+    def _record_order_event(self, event_type, order):
+        if self.event_store is None:
+            return
+        if isinstance(order, dict):
+            self.event_store.append(
+                self.symbol,
+                event_type,
+                self.time,
+                side=order["side"],
+                order_id=order["order_id"],
+                price=order["price"],
+                quantity=order["quantity"],
+                account=order.get("account"),
+            )
+        else:
+            self.event_store.append(
+                self.symbol,
+                event_type,
+                self.time,
+                side=order.side,
+                order_id=order.order_id,
+                price=order.price,
+                quantity=order.quantity,
+                account=order.account,
+            )
 
     def get_volume_at_price(self, side, price):
         price = Decimal(price)
@@ -370,16 +619,42 @@ class OrderBook(object):
     def get_worst_ask(self):
         return self.asks.max_price()
 
+    def crosses(self, side, price):
+        '''True if a side order resting at price would trade against the opposite best price.'''
+        if side == "bid":
+            best_ask = self.get_best_ask()
+            return best_ask is not None and price >= best_ask
+        best_bid = self.get_best_bid()
+        return best_bid is not None and price <= best_bid
+
     def tape_dump(self, filename, filemode, tapemode):
-        dumpfile = open(filename, filemode)
-        for tapeitem in self.tape:
+        cols = self.tape.recent(len(self.tape))
+        with open(filename, filemode) as dumpfile:
             dumpfile.write(
-                "Time: %s, Price: %s, Quantity: %s\n"
-                % (tapeitem["time"], tapeitem["price"], tapeitem["quantity"])
+                "".join(
+                    "Time: %s, Price: %s, Quantity: %s\n" % row
+                    for row in zip(
+                        cols["timestamp"], map(from_fixed, cols["price"]), map(from_fixed, cols["quantity"])
+                    )
+                )
             )
-        dumpfile.close()
         if tapemode == "wipe":
-            self.tape = []
+            self.tape.clear()
+
+    def get_trades_between(self, start_time, end_time, include_spilled=False):
+        return self.tape.trades_between(start_time, end_time, include_spilled)
+
+    def get_trades_since(self, seq, include_spilled=False):
+        return self.tape.trades_since(seq, include_spilled)
+
+    def get_vwap(self, start_time, end_time, include_spilled=False):
+        return self.tape.vwap(start_time, end_time, include_spilled)
+
+    def get_ohlcv(self, start_time, end_time, include_spilled=False):
+        return self.tape.ohlcv(start_time, end_time, include_spilled)
+
+    def get_candles(self, resolution, limit=None, start=None, end=None):
+        return self.candles.get_candles(resolution, limit, start, end)
 
     def __str__(self):
         tempfile = StringIO()
@@ -403,9 +678,9 @@ class OrderBook(object):
                         + " ("
                         + str(entry["timestamp"])
                         + ") "
-                        + str(entry["party1"][0])
+                        + str(entry["party1"])
                         + "/"
-                        + str(entry["party2"][0])
+                        + str(entry["party2"])
                         + "\n"
                     )
                     num += 1
@@ -417,7 +692,6 @@ class OrderBook(object):
     def get_orderbook(self, symbol):
         base_asset = symbol.split("_")[0]
         quote_asset = symbol.split("_")[1]
-        print(base_asset, quote_asset)
 
         orderbook = {
             "baseAsset": base_asset,
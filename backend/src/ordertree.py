@@ -13,6 +13,7 @@ class OrderTree(object):
         self.price_map = SortedDict() # Dictionary containing price : OrderList object
         self.prices = self.price_map.keys()
         self.order_map = {} # Dictionary containing order_id : Order object
+        self.account_map = {} # Dictionary containing account : {order_id : Order object}
         self.volume = 0 # Contains total quantity from all Orders in tree
         self.num_orders = 0 # Contains count of Orders in tree
         self.depth = 0 # Number of different prices in tree (http://en.wikipedia.org/wiki/Order_book_(trading)#Book_depth)
@@ -41,6 +42,11 @@ class OrderTree(object):
     def order_exists(self, order):
         return order in self.order_map
 
+    def get_account_orders(self, account):
+        '''Resting orders of account, oldest first (a copy, safe to cancel while iterating)'''
+        orders = self.account_map.get(account)
+        return list(orders.values()) if orders else []
+
     def insert_order(self, quote):
         if self.order_exists(quote['order_id']):
             self.remove_order_by_id(quote['order_id'])
@@ -50,18 +56,30 @@ class OrderTree(object):
         order = Order(quote, self.price_map[quote['price']]) # Create an order
         self.price_map[order.price].append_order(order) # Add the order to the OrderList in Price Map
         self.order_map[order.order_id] = order
+        self.account_map.setdefault(order.account, {})[order.order_id] = order
         self.volume += order.quantity
 
     def update_order(self, order_update):
         order = self.order_map[order_update['order_id']]
         original_quantity = order.quantity
         if order_update['price'] != order.price:
-            # Price changed. Remove order and update tree.
-            order_list = self.price_map[order.price]
-            order_list.remove_order(order)
-            if len(order_list) == 0: # If there is nothing else in the OrderList, remove the price from RBtree
-                self.remove_price(order.price)
-            self.insert_order(order_update)
+            # Price changed. Remove order and re-insert it at the new price, keeping its other fields.
+            quote = {
+                'trade_id': order.trade_id,
+                'private_key': order.private_key,
+                'account': order.account,
+                'side': order.side,
+                'baseAsset': order.baseAsset,
+                'quoteAsset': order.quoteAsset,
+                'from_network': order.from_network,
+                'to_network': order.to_network,
+                'receive_wallet': order.receive_wallet,
+                'time_in_force': order.time_in_force,
+                'expire_time': order.expire_time,
+            }
+            quote.update(order_update)
+            self.remove_order_by_id(order.order_id)
+            self.insert_order(quote)
         else:
             # Quantity changed. Price is the same.
             order.update_quantity(order_update['quantity'], order_update['timestamp'])
@@ -75,6 +93,10 @@ class OrderTree(object):
         if len(order.order_list) == 0:
             self.remove_price(order.price)
         del self.order_map[order_id]
+        account_orders = self.account_map[order.account]
+        del account_orders[order_id]
+        if not account_orders:
+            del self.account_map[order.account]
 
     def max_price(self):
         if self.depth > 0:
@@ -88,6 +110,20 @@ class OrderTree(object):
         else:
             return None
 
+    def price_above(self, price):
+        '''Next price level strictly above price, or None'''
+        index = self.price_map.bisect_right(price)
+        if index < len(self.prices):
+            return self.prices[index]
+        return None
+
+    def price_below(self, price):
+        '''Next price level strictly below price, or None'''
+        index = self.price_map.bisect_left(price)
+        if index > 0:
+            return self.prices[index - 1]
+        return None
+
     def max_price_list(self):
         if self.depth > 0:
             return self.get_price_list(self.max_price())
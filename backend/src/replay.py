@@ -0,0 +1,448 @@
+"""
+Deterministic replay and market simulation over OrderBook
+
+Streams a command file (one JSON object per line) or a synthetic command
+stream through one OrderBook per symbol using the externally timestamped
+path (process_order(quote, from_data=True, ...)). Reports throughput,
+per-command latency percentiles and hashes of the final books and trade
+tapes, so two runs over the same input can be checked for determinism and
+strategies can be backtested offline.
+
+Command format:
+    {"action": "limit" | "market" | "cancel" | "modify", "symbol": "HBAR_USDT",
+     "timestamp": 1700000000000, "order_id": 1, "side": "bid", "price": "0.05",
+     "quantity": "100", "account": "0x...", "from_network": "polygon",
+     "to_network": "hedera"}
+
+Usage:
+    python -m src.replay commands.jsonl [--check-determinism] [--strategy spread]
+    python -m src.replay --generate 1000000 --symbols 4 --write commands.jsonl
+"""
+
+import sys
+import json
+import time
+import random
+import hashlib
+import argparse
+from array import array
+from decimal import Decimal
+
+from .orderbook import OrderBook
+
+DEFAULT_NETWORKS = {"bid": ("polygon", "hedera"), "ask": ("hedera", "polygon")}
+
+
+# ==================== COMMAND SOURCES ====================
+
+
+def read_commands(path):
+    '''Stream commands from a JSON lines file without loading it into memory.'''
+    with open(path, "r", encoding="utf-8") as f:
+        for line in f:
+            line = line.strip()
+            if line:
+                yield json.loads(line)
+
+
+def write_commands(path, commands):
+    with open(path, "w", encoding="utf-8") as f:
+        for command in commands:
+            f.write(json.dumps(command, separators=(",", ":")))
+            f.write("\n")
+
+
+def generate_commands(
+    count,
+    symbols=("HBAR_USDT",),
+    seed=1,
+    start_time=1700000000000,
+    mid_price=0.05,
+    tick=0.0001,
+    accounts=50,
+):
+    '''
+    Generate a reproducible synthetic order flow.
+
+    Mostly passive limit orders around a mean-reverting mid, plus small
+    marketable limits, cancels and modifies of live orders.
+    '''
+    rng = random.Random(seed)
+    mids = {symbol: mid_price for symbol in symbols}
+    live = {symbol: [] for symbol in symbols}  # (order_id, side) that may still rest
+    owners = ["0x%040x" % (i + 1) for i in range(accounts)]
+    order_id = 0
+    timestamp = start_time
+    for _ in range(count):
+        timestamp += rng.randint(0, 3)
+        symbol = rng.choice(symbols)
+        # Mean-reverting walk keeps the flow around mid_price over long runs
+        mid = mids[symbol] = max(
+            tick * 10, mids[symbol] + rng.gauss(0, tick) - 0.01 * (mids[symbol] - mid_price)
+        )
+        roll = rng.random()
+        side = "bid" if rng.random() < 0.5 else "ask"
+        from_network, to_network = DEFAULT_NETWORKS[side]
+        if roll < 0.2 and live[symbol]:
+            victim, victim_side = live[symbol].pop(rng.randrange(len(live[symbol])))
+            yield {
+                "action": "cancel",
+                "symbol": symbol,
+                "timestamp": timestamp,
+                "order_id": victim,
+                "side": victim_side,
+            }
+            continue
+        if roll < 0.25 and live[symbol]:
+            victim, victim_side = live[symbol][rng.randrange(len(live[symbol]))]
+            offset = rng.randint(1, 20) * tick
+            price = mid - offset if victim_side == "bid" else mid + offset
+            yield {
+                "action": "modify",
+                "symbol": symbol,
+                "timestamp": timestamp,
+                "order_id": victim,
+                "side": victim_side,
+                "price": "%.4f" % price,
+                "quantity": str(rng.randint(1, 100)),
+            }
+            continue
+        order_id += 1
+        if roll < 0.35:
+            # Marketable: cross the mid by a few ticks with a small size
+            offset = -rng.randint(1, 5) * tick
+            quantity = rng.randint(1, 5)
+        else:
+            offset = rng.randint(1, 20) * tick
+            quantity = rng.randint(1, 100)
+            live[symbol].append((order_id, side))
+        price = mid - offset if side == "bid" else mid + offset
+        yield {
+            "action": "limit",
+            "symbol": symbol,
+            "timestamp": timestamp,
+            "order_id": order_id,
+            "side": side,
+            "price": "%.4f" % price,
+            "quantity": str(quantity),
+            "account": rng.choice(owners),
+            "from_network": from_network,
+            "to_network": to_network,
+        }
+
+
+# ==================== STRATEGIES ====================
+
+
+class SpreadQuoter(object):
+    '''
+    Backtest of the bot's symmetric market-making strategy.
+
+    Keeps one bid and one ask per symbol at mid * (1 -/+ spread_percentage / 200)
+    and re-quotes whenever one of its quotes trades or the mid drifts by more
+    than requote_ticks. Tracks inventory, cash and marked-to-market PnL.
+    '''
+
+    def __init__(
+        self,
+        account="0x" + "ab" * 20,
+        spread_percentage=0.5,
+        quantity=10,
+        requote_ticks=5,
+        tick=Decimal("0.0001"),
+    ):
+        self.account = account
+        self.spread = Decimal(str(spread_percentage)) / 200
+        self.quantity = Decimal(quantity)
+        self.requote_ticks = requote_ticks
+        self.tick = tick
+        self.next_order_id = 10**12  # kept apart from recorded order ids
+        self.quotes = {}  # symbol : {"bid": order_id, "ask": order_id, "mid": Decimal}
+        self.inventory = {}
+        self.cash = {}
+        self.last_price = {}
+        self.fills = 0
+
+    def on_result(self, engine, symbol, command, trades):
+        book = engine.books[symbol]
+        requote = False
+        for trade in trades:
+            self.last_price[symbol] = trade["price"]
+            if trade["party1"][0] == self.account:
+                requote = True
+                self._fill(symbol, trade["party1"][1], trade["price"], trade["quantity"])
+            if trade["party2"][0] == self.account:
+                requote = True
+                self._fill(symbol, trade["party2"][1], trade["price"], trade["quantity"])
+        mid = _mid(book)
+        if mid is None:
+            return []
+        current = self.quotes.get(symbol)
+        if current is not None and not requote:
+            if abs(mid - current["mid"]) < self.tick * self.requote_ticks:
+                return []
+        return self._requote(symbol, command["timestamp"], mid, current)
+
+    def report(self):
+        pnl = {}
+        for symbol, inventory in self.inventory.items():
+            mark = self.last_price.get(symbol, Decimal(0))
+            pnl[symbol] = float(self.cash.get(symbol, 0) + inventory * mark)
+        return {
+            "fills": self.fills,
+            "inventory": {k: float(v) for k, v in self.inventory.items()},
+            "pnl": pnl,
+        }
+
+    def _fill(self, symbol, side, price, quantity):
+        self.fills += 1
+        signed = quantity if side == "bid" else -quantity
+        self.inventory[symbol] = self.inventory.get(symbol, 0) + signed
+        self.cash[symbol] = self.cash.get(symbol, 0) - signed * price
+
+    def _requote(self, symbol, timestamp, mid, current):
+        commands = []
+        if current is not None:
+            for side in ("bid", "ask"):
+                commands.append({
+                    "action": "cancel",
+                    "symbol": symbol,
+                    "timestamp": timestamp,
+                    "order_id": current[side],
+                    "side": side,
+                })
+        quotes = {"mid": mid}
+        for side in ("bid", "ask"):
+            self.next_order_id += 1
+            factor = 1 - self.spread if side == "bid" else 1 + self.spread
+            from_network, to_network = DEFAULT_NETWORKS[side]
+            quotes[side] = self.next_order_id
+            commands.append({
+                "action": "limit",
+                "symbol": symbol,
+                "timestamp": timestamp,
+                "order_id": self.next_order_id,
+                "side": side,
+                "price": (mid * factor).quantize(self.tick),
+                "quantity": self.quantity,
+                "account": self.account,
+                "from_network": from_network,
+                "to_network": to_network,
+            })
+        self.quotes[symbol] = quotes
+        return commands
+
+
+STRATEGIES = {"spread": SpreadQuoter}
+
+
+# ==================== ENGINE ====================
+
+
+class ReplayEngine(object):
+    '''Feeds commands through one OrderBook per symbol and measures the run.'''
+
+    def __init__(self, strategy=None, book_factory=OrderBook):
+        self.books = {}
+        self.book_factory = book_factory
+        self.strategy = strategy
+        self.tape_hashes = {}
+        self.latencies = array("q")  # nanoseconds per command
+        self.events = 0
+        self.trades = 0
+        self.rejected = 0
+
+    def book(self, symbol):
+        book = self.books.get(symbol)
+        if book is None:
+            book = self.books[symbol] = self.book_factory()
+            self.tape_hashes[symbol] = hashlib.blake2b(digest_size=16)
+        return book
+
+    def run(self, commands):
+        clock = time.perf_counter_ns
+        latencies = self.latencies
+        started = clock()
+        for command in commands:
+            t0 = clock()
+            trades = self.apply(command)
+            latencies.append(clock() - t0)
+            if self.strategy is not None:
+                for injected in self.strategy.on_result(self, command["symbol"], command, trades):
+                    self.apply(injected)
+        elapsed = (clock() - started) / 1e9
+        return self.report(elapsed)
+
+    def apply(self, command):
+        '''Apply one command and return the trades it produced.'''
+        self.events += 1
+        symbol = command["symbol"]
+        book = self.book(symbol)
+        action = command["action"]
+        timestamp = int(command["timestamp"])
+        if action == "cancel":
+            book.cancel_order(command["side"], int(command["order_id"]), timestamp)
+            return []
+        if action == "modify":
+            book.modify_order(
+                int(command["order_id"]),
+                {
+                    "side": command["side"],
+                    "price": Decimal(command["price"]),
+                    "quantity": Decimal(command["quantity"]),
+                },
+                timestamp,
+            )
+            return []
+        base_asset, quote_asset = symbol.split("_", 1)
+        quote = {
+            "type": action,
+            "timestamp": timestamp,
+            "order_id": int(command["order_id"]),
+            "side": command["side"],
+            "quantity": Decimal(command["quantity"]),
+            "trade_id": command.get("account"),
+            "account": command.get("account"),
+            "private_key": None,
+            "baseAsset": base_asset,
+            "quoteAsset": quote_asset,
+            "from_network": command.get("from_network"),
+            "to_network": command.get("to_network"),
+        }
+        if action == "limit":
+            quote["price"] = Decimal(command["price"])
+        result = book.process_order(quote, True, False)
+        if not result["success"]:
+            self.rejected += 1
+            return []
+        trades = result["data"][0]
+        if trades:
+            self.trades += len(trades)
+            tape_hash = self.tape_hashes[symbol]
+            for trade in trades:
+                tape_hash.update(
+                    ("%s|%s|%s|%s|%s;" % (
+                        trade["timestamp"],
+                        trade["price"],
+                        trade["quantity"],
+                        trade["party1"][2],
+                        trade["party2"][0],
+                    )).encode("utf-8")
+                )
+        return trades
+
+    def report(self, elapsed):
+        ordered = sorted(self.latencies)
+        report = {
+            "events": self.events,
+            "commands": len(ordered),
+            "trades": self.trades,
+            "rejected": self.rejected,
+            "elapsed_s": round(elapsed, 6),
+            "events_per_sec": round(self.events / elapsed, 1) if elapsed else None,
+            "latency_us": {
+                name: round(_percentile(ordered, q) / 1000.0, 3)
+                for name, q in (("p50", 50), ("p90", 90), ("p99", 99), ("p999", 99.9), ("max", 100))
+            },
+            "book_hashes": {symbol: book_hash(book) for symbol, book in sorted(self.books.items())},
+            "tape_hashes": {symbol: h.hexdigest() for symbol, h in sorted(self.tape_hashes.items())},
+        }
+        if self.strategy is not None:
+            report["strategy"] = self.strategy.report()
+        return report
+
+
+def book_hash(book):
+    '''Hash of every resting order in price/time priority.'''
+    digest = hashlib.blake2b(digest_size=16)
+    for side, tree in (("bid", book.bids), ("ask", book.asks)):
+        for price in tree.prices:
+            order = tree.price_map[price].head_order
+            while order is not None:
+                digest.update(
+                    ("%s|%s|%s|%s|%s;" % (
+                        side, price, order.order_id, order.quantity, order.timestamp
+                    )).encode("utf-8")
+                )
+                order = order.next_order
+    return digest.hexdigest()
+
+
+def check_determinism(make_commands, runs=2, strategy_factory=None):
+    '''Replay the same input several times and compare final book and tape hashes.'''
+    reports = []
+    for _ in range(runs):
+        strategy = strategy_factory() if strategy_factory else None
+        reports.append(ReplayEngine(strategy).run(make_commands()))
+    first = reports[0]
+    deterministic = all(
+        r["book_hashes"] == first["book_hashes"] and r["tape_hashes"] == first["tape_hashes"]
+        for r in reports[1:]
+    )
+    return deterministic, reports
+
+
+def _mid(book):
+    best_bid = book.get_best_bid()
+    best_ask = book.get_best_ask()
+    if best_bid is None or best_ask is None:
+        return best_bid if best_ask is None else best_ask
+    return (best_bid + best_ask) / 2
+
+
+def _percentile(ordered, q):
+    if not ordered:
+        return 0
+    index = min(len(ordered) - 1, int(round(q / 100.0 * (len(ordered) - 1))))
+    return ordered[index]
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Replay or simulate order flow through OrderBook")
+    parser.add_argument("commands", nargs="?", help="JSON lines command file")
+    parser.add_argument("--generate", type=int, help="generate N synthetic commands instead")
+    parser.add_argument("--symbols", type=int, default=1, help="symbols in generated flow")
+    parser.add_argument("--seed", type=int, default=1)
+    parser.add_argument("--write", help="write the generated commands to this file and exit")
+    parser.add_argument("--strategy", choices=sorted(STRATEGIES), help="strategy to backtest")
+    parser.add_argument("--check-determinism", action="store_true")
+    parser.add_argument("--expect", help="JSON file of book_hashes/tape_hashes to compare against")
+    args = parser.parse_args(argv)
+
+    if args.generate:
+        symbols = tuple("SYM%d_USDT" % i for i in range(args.symbols))
+        make_commands = lambda: generate_commands(args.generate, symbols, args.seed)
+    elif args.commands:
+        make_commands = lambda: read_commands(args.commands)
+    else:
+        parser.error("give a command file or --generate N")
+
+    if args.write:
+        write_commands(args.write, make_commands())
+        return 0
+
+    strategy_factory = STRATEGIES.get(args.strategy)
+    if args.check_determinism:
+        deterministic, reports = check_determinism(make_commands, 2, strategy_factory)
+        report = reports[-1]
+        report["deterministic"] = deterministic
+    else:
+        report = ReplayEngine(strategy_factory() if strategy_factory else None).run(make_commands())
+
+    status = 0
+    if args.expect:
+        with open(args.expect, "r", encoding="utf-8") as f:
+            expected = json.load(f)
+        report["matches_expected"] = (
+            expected.get("book_hashes") == report["book_hashes"]
+            and expected.get("tape_hashes") == report["tape_hashes"]
+        )
+        status = 0 if report["matches_expected"] else 1
+    if report.get("deterministic") is False:
+        status = 1
+    print(json.dumps(report, indent=2))
+    return status
+
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -0,0 +1,309 @@
+'''
+RPC endpoint pool
+
+A web3 provider that spreads a chain's JSON-RPC traffic over several
+endpoints, so one rate-limited or stalled public node no longer stalls
+settlement:
+
+- every endpoint keeps an EWMA of its latency and of its error rate, and
+  requests go to the best-scoring endpoint first
+- read-only calls are hedged: if the chosen endpoint has not answered by
+  its own p95 latency, the same request goes to the next best endpoint
+  and whichever answers first wins
+- an endpoint that fails failure_threshold times in a row is cut off
+  (circuit open) for a cooldown that doubles while it keeps failing;
+  after the cooldown it gets a trial request and either recovers or goes
+  straight back to open
+- any failure (connection error, timeout, HTTP error, rate-limit reply)
+  fails over to the next endpoint
+
+Writes (eth_sendRawTransaction) are never hedged, only failed over. A
+node that timed out may still have taken the transaction, so the next
+node can refuse the resend as already known, or with nonce too low once
+it is mined; those replies to a resend return the transaction's hash as
+a successful send would (nonce too low only if the node finds the
+transaction, since another transaction may have taken the nonce).
+
+Pools are shared per endpoint list (provider_for), so statistics survive
+the short-lived SettlementClients made per settlement batch.
+
+Usage:
+    web3 = Web3(provider_for("https://rpc-a.example,https://rpc-b.example"))
+'''
+
+import logging
+import threading
+import time
+from collections import deque
+from concurrent.futures import FIRST_COMPLETED, ThreadPoolExecutor, wait
+from urllib.parse import urlparse
+
+from web3 import Web3
+from web3.providers import JSONBaseProvider
+
+from . import metrics
+
+logger = logging.getLogger(__name__)
+
+# Read-only methods: sending one twice costs nothing but the request
+HEDGEABLE = frozenset(
+    [
+        "eth_call",
+        "eth_chainId",
+        "eth_blockNumber",
+        "eth_getBlockByNumber",
+        "eth_getBlockByHash",
+        "eth_getLogs",
+        "eth_getBalance",
+        "eth_getCode",
+        "eth_getTransactionCount",
+        "eth_getTransactionByHash",
+        "eth_getTransactionReceipt",
+        "eth_estimateGas",
+        "eth_gasPrice",
+        "eth_maxPriorityFeePerGas",
+        "eth_feeHistory",
+        "net_version",
+        "web3_clientVersion",
+    ]
+)
+# JSON-RPC error codes public nodes use for rate limiting
+RATE_LIMIT_CODES = frozenset([-32005, -32090, 429])
+# Error messages (geth, erigon, nethermind, besu) refusing a transaction the node already has
+ALREADY_KNOWN = ("already known", "known transaction", "alreadyknown", "already imported")
+
+
+class RateLimited(Exception):
+    pass
+
+
+class Endpoint(object):
+    def __init__(self, url, provider=None, timeout=10, window=128):
+        self.url = url
+        self.label = urlparse(url).netloc or url
+        self.provider = provider or Web3.HTTPProvider(url, request_kwargs={"timeout": timeout})
+        self.latency = None  # EWMA of successful request latency, seconds
+        self.error_rate = 0.0  # EWMA of the failure indicator
+        self.samples = deque(maxlen=window)  # recent latencies, for the hedge deadline
+        self._p95 = None
+        self.failures = 0  # consecutive
+        self.open_until = 0.0
+        self.cooldown = 0.0
+
+    def score(self):
+        if self.latency is None:
+            # Unmeasured endpoints go first so each gets tried, unless they have only failed so far
+            return self.error_rate
+        return self.latency * (1.0 + 10.0 * self.error_rate)
+
+    def p95(self):
+        if self._p95 is None and self.samples:
+            ordered = sorted(self.samples)
+            self._p95 = ordered[int(len(ordered) * 0.95)]
+        return self._p95
+
+    def __repr__(self):
+        return "Endpoint(%s, latency=%s, error_rate=%.3f)" % (self.label, self.latency, self.error_rate)
+
+
+class RPCPool(JSONBaseProvider):
+    def __init__(
+        self,
+        urls,
+        providers=None,
+        alpha=0.2,
+        failure_threshold=5,
+        cooldown=5.0,
+        max_cooldown=120.0,
+        min_hedge_delay=0.05,
+        default_hedge_delay=0.5,
+        hedge=True,
+        timeout=10,
+    ):
+        super().__init__()
+        if not urls:
+            raise ValueError("RPCPool needs at least one endpoint")
+        providers = providers or [None] * len(urls)
+        self.endpoints = [Endpoint(url, provider, timeout) for url, provider in zip(urls, providers)]
+        self.endpoint_uri = self.endpoints[0].url
+        self.alpha = alpha
+        self.failure_threshold = failure_threshold
+        self.base_cooldown = cooldown
+        self.max_cooldown = max_cooldown
+        self.min_hedge_delay = min_hedge_delay
+        self.default_hedge_delay = default_hedge_delay
+        self.hedge = hedge
+        self.lock = threading.Lock()
+        # Requests still running after their hedge won keep a thread until they end
+        self.executor = ThreadPoolExecutor(max_workers=4 * len(urls), thread_name_prefix="rpc-pool")
+
+    # ==================== ROUTING ====================
+
+    def ranked(self):
+        '''Endpoints to try, best first; circuits that are open go last, soonest to reopen first.'''
+        now = time.monotonic()
+        with self.lock:
+            closed = [endpoint for endpoint in self.endpoints if endpoint.open_until <= now]
+            opened = [endpoint for endpoint in self.endpoints if endpoint.open_until > now]
+            closed.sort(key=Endpoint.score)
+            opened.sort(key=lambda endpoint: endpoint.open_until)
+        # Open circuits are only tried when nothing else is left
+        return closed + opened
+
+    def hedge_delay(self, endpoint):
+        with self.lock:
+            if len(endpoint.samples) < 16:
+                delay = 2 * endpoint.latency if endpoint.latency else self.default_hedge_delay
+            else:
+                delay = endpoint.p95()
+        return max(delay, self.min_hedge_delay)
+
+    def _record(self, endpoint, elapsed, ok):
+        with self.lock:
+            alpha = self.alpha
+            endpoint.error_rate += alpha * ((0.0 if ok else 1.0) - endpoint.error_rate)
+            if ok:
+                endpoint.latency = elapsed if endpoint.latency is None else endpoint.latency + alpha * (elapsed - endpoint.latency)
+                endpoint.samples.append(elapsed)
+                endpoint._p95 = None
+                endpoint.failures = 0
+                endpoint.cooldown = 0.0
+                endpoint.open_until = 0.0
+                return
+            endpoint.failures += 1
+            if endpoint.failures < self.failure_threshold:
+                return
+            # Open, or back to open after a failed trial, for a cooldown that doubles each time
+            endpoint.cooldown = min(max(endpoint.cooldown * 2, self.base_cooldown), self.max_cooldown)
+            endpoint.open_until = time.monotonic() + endpoint.cooldown
+        metrics.RPC_POOL_EVENTS.labels(endpoint.label, "circuit_open").inc()
+        logger.warning(
+            "RPC endpoint circuit opened",
+            extra={"endpoint": endpoint.label, "failures": endpoint.failures, "cooldown": endpoint.cooldown},
+        )
+
+    def _call(self, endpoint, request):
+        t0 = time.monotonic()
+        try:
+            response = request(endpoint.provider)
+            error = response.get("error") if isinstance(response, dict) else None
+            if isinstance(error, dict) and (
+                error.get("code") in RATE_LIMIT_CODES or "rate limit" in str(error.get("message", "")).lower()
+            ):
+                raise RateLimited("%s: %s" % (endpoint.label, error.get("message")))
+        except Exception:
+            self._record(endpoint, time.monotonic() - t0, False)
+            raise
+        self._record(endpoint, time.monotonic() - t0, True)
+        return response
+
+    def _failover(self, ranked, request, on_resend=None):
+        '''First answer of the ranked endpoints in turn; on_resend(response) filters one after a failure.'''
+        last_error = None
+        for attempt, endpoint in enumerate(ranked):
+            if attempt:
+                metrics.RPC_POOL_EVENTS.labels(endpoint.label, "failover").inc()
+            try:
+                response = self._call(endpoint, request)
+            except Exception as e:
+                last_error = e
+                logger.info("RPC request failed on %s: %s", endpoint.label, e)
+                continue
+            return on_resend(response) if attempt and on_resend is not None else response
+        raise last_error
+
+    def _resent_transaction(self, raw, response):
+        '''A resent eth_sendRawTransaction's reply, as success when the transaction already got through.'''
+        error = response.get("error") if isinstance(response, dict) else None
+        if not isinstance(error, dict):
+            return response
+        message = str(error.get("message", "")).lower()
+        tx_hash = Web3.to_hex(Web3.keccak(hexstr=raw) if isinstance(raw, str) else Web3.keccak(raw))
+        if not any(text in message for text in ALREADY_KNOWN):
+            if "nonce too low" not in message:
+                return response
+            # Mined, or another transaction took the nonce: only the node can tell which
+            try:
+                found = self._failover(
+                    self.ranked(), lambda provider: provider.make_request("eth_getTransactionByHash", [tx_hash])
+                )
+            except Exception:
+                return response
+            if not isinstance(found, dict) or not found.get("result"):
+                return response
+        logger.info("Resent transaction %s was already sent: %s", tx_hash, error.get("message"))
+        return {"jsonrpc": "2.0", "id": response.get("id"), "result": tx_hash}
+
+    def _hedged(self, ranked, request):
+        pending = {self.executor.submit(self._call, ranked[0], request)}
+        remaining = iter(ranked[1:])
+        last_error = None
+        timeout = self.hedge_delay(ranked[0])
+        while True:
+            done, pending = wait(pending, timeout=timeout, return_when=FIRST_COMPLETED)
+            for future in done:
+                try:
+                    return future.result()
+                except Exception as e:
+                    last_error = e
+            # Slow past the deadline (hedge) or failed (failover): bring in the next endpoint
+            endpoint = next(remaining, None)
+            if endpoint is not None:
+                metrics.RPC_POOL_EVENTS.labels(endpoint.label, "hedge" if not done else "failover").inc()
+                pending.add(self.executor.submit(self._call, endpoint, request))
+                timeout = self.hedge_delay(endpoint)
+            elif not pending:
+                raise last_error
+            else:
+                timeout = None  # nothing left to add: wait for what is in flight
+
+    # ==================== PROVIDER API ====================
+
+    def make_request(self, method, params):
+        ranked = self.ranked()
+        request = lambda provider: provider.make_request(method, params)  # noqa: E731
+        if self.hedge and method in HEDGEABLE and len(ranked) > 1:
+            return self._hedged(ranked, request)
+        if method == "eth_sendRawTransaction":
+            return self._failover(ranked, request, lambda response: self._resent_transaction(params[0], response))
+        return self._failover(ranked, request)
+
+    def make_batch_request(self, requests):
+        return self._failover(self.ranked(), lambda provider: provider.make_batch_request(requests))
+
+    def stats(self):
+        now = time.monotonic()
+        with self.lock:
+            return [
+                {
+                    "endpoint": endpoint.label,
+                    "latency_ms": endpoint.latency * 1000 if endpoint.latency is not None else None,
+                    "p95_ms": endpoint.p95() * 1000 if endpoint.samples else None,
+                    "error_rate": endpoint.error_rate,
+                    "circuit_open": endpoint.open_until > now,
+                }
+                for endpoint in self.endpoints
+            ]
+
+
+_pools = {}
+_pools_lock = threading.Lock()
+
+
+def split_urls(rpc):
+    '''A comma separated string or a list of RPC URLs as a list.'''
+    if isinstance(rpc, str):
+        return [url.strip() for url in rpc.split(",") if url.strip()]
+    return list(rpc)
+
+
+def provider_for(rpc, **kwargs):
+    '''HTTPProvider for one URL, the shared RPCPool for several.'''
+    urls = split_urls(rpc)
+    if len(urls) == 1:
+        return Web3.HTTPProvider(urls[0])
+    key = tuple(urls)
+    with _pools_lock:
+        if key not in _pools:
+            _pools[key] = RPCPool(urls, **kwargs)
+        return _pools[key]
@@ -0,0 +1,124 @@
+'''
+Settled-trade index
+
+Remembers which settlement order ids have settled on which chain, so
+duplicate-settlement checks and status queries are answered locally
+instead of with a settledCrossChainOrders() call per order id. It is fed
+by settlement receipts and by CrossChainTradeSettled contract events.
+
+With a path, every entry is appended to a fixed-width binary log (one
+SETTLED record each) and the index is rebuilt from it on startup. The
+app keeps the log in the event store directory, next to the journal.
+
+Usage:
+    index = SettledTradeIndex(os.path.join(EVENT_STORE_DIR, "settled.log"))
+    index.add("42", chain_id=296, tx_hash="0x...", block_number=1234, is_source_chain=True)
+    index.is_settled("42", 296)
+'''
+
+import os
+import struct
+import threading
+import time
+
+from . import signing
+
+# order id (bytes32), chain id, transaction hash, block number, timestamp (ms), is source chain
+SETTLED = struct.Struct("<32sQ32sQqB")
+
+
+class SettledTradeIndex(object):
+    def __init__(self, path=None):
+        self.path = path
+        self.settled = {}  # order id bytes32 : {chain id: entry dict}
+        self.log = None
+        # Settlements run on the event loop and on the gateway's settlement thread
+        self.lock = threading.Lock()
+        if path is not None:
+            directory = os.path.dirname(path)
+            if directory:
+                os.makedirs(directory, exist_ok=True)
+            self._load()
+            self.log = open(path, "ab")
+
+    def _load(self):
+        if not os.path.exists(self.path):
+            return
+        with open(self.path, "rb") as log:
+            raw = log.read()
+        # A torn last record from a crash is ignored
+        for record in SETTLED.iter_unpack(raw[: len(raw) // SETTLED.size * SETTLED.size]):
+            self._insert(*record)
+
+    def _insert(self, order_id, chain_id, tx_hash, block_number, timestamp, is_source_chain):
+        self.settled.setdefault(order_id, {})[chain_id] = {
+            "chain_id": chain_id,
+            "transaction_hash": "0x" + tx_hash.hex() if any(tx_hash) else None,
+            "block_number": block_number,
+            "timestamp": timestamp,
+            "is_source_chain": bool(is_source_chain),
+        }
+
+    def __len__(self):
+        return len(self.settled)
+
+    # ==================== WRITING ====================
+
+    def add(self, order_id, chain_id, tx_hash=None, block_number=0, is_source_chain=False, timestamp=None):
+        '''Record that order_id settled on chain_id; returns False if it was already known.'''
+        key = signing.order_id_bytes(order_id)
+        chain_id = int(chain_id)
+        with self.lock:
+            if chain_id in self.settled.get(key, ()):
+                return False
+            if tx_hash is None:
+                tx_hash = bytes(32)
+            elif isinstance(tx_hash, str):
+                tx_hash = bytes.fromhex(tx_hash[2:] if tx_hash.startswith("0x") else tx_hash)
+            record = (
+                key,
+                chain_id,
+                bytes(tx_hash).rjust(32, b"\0"),
+                int(block_number or 0),
+                int(timestamp if timestamp is not None else time.time() * 1000),
+                1 if is_source_chain else 0,
+            )
+            self._insert(*record)
+            if self.log is not None:
+                # Written through at once: this is what stops a trade settling twice after a restart
+                self.log.write(SETTLED.pack(*record))
+                self.log.flush()
+            return True
+
+    def add_events(self, events):
+        '''Record CrossChainTradeSettled events (see SettlementClient.get_settled_trades); returns how many were new.'''
+        added = 0
+        for event in events:
+            added += self.add(
+                event["order_id"],
+                event["chain_id"],
+                tx_hash=event.get("transaction_hash"),
+                block_number=event.get("block_number", 0),
+                is_source_chain=event.get("is_source_chain", False),
+                timestamp=event.get("timestamp"),
+            )
+        return added
+
+    def close(self):
+        if self.log is not None:
+            self.log.close()
+            self.log = None
+
+    # ==================== READING ====================
+
+    def is_settled(self, order_id, chain_id=None):
+        '''True if order_id settled on chain_id (on any chain when chain_id is None).'''
+        chains = self.settled.get(signing.order_id_bytes(order_id))
+        if not chains:
+            return False
+        return chain_id is None or int(chain_id) in chains
+
+    def get(self, order_id):
+        '''Settlement entries of order_id per chain, an empty list if none are known.'''
+        entries = self.settled.get(signing.order_id_bytes(order_id), {})
+        return sorted(entries.values(), key=lambda entry: entry["timestamp"])
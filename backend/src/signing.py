@@ -0,0 +1,358 @@
+'''
+Settlement message signing
+
+Builds the keccak message hashes the settlement contract checks and signs
+them with the Ethereum personal-message prefix, like eth_account's
+sign_message(encode_defunct(hash)) but without rebuilding everything for
+every signature:
+
+- addresses are checksummed and packed to 20 bytes once (lru_cache), so a
+  token pair or a wallet costs nothing after its first trade
+- keccak of sides, symbols and network names, and small uint256 words
+  (chain ids, flags) are cached
+- private keys are parsed once; deriving the public key is the slowest
+  step after the signature itself
+- amounts are converted to wei from their decimal value with integer
+  arithmetic, never through float * 10**decimals
+
+Signatures clients send are checked locally with ecrecover instead of
+an eth_call. Recovery is as slow as signing, so recovered signers are
+kept in an LRU cache keyed by (message hash, signature): a signature is
+recovered once, however often it is checked afterwards.
+
+SigningService signs batches of (private key, message hash) in a pool,
+and recovers signers missing from the cache there too. With eth_keys'
+pure Python backend both hold the GIL, so the pool is a process pool;
+with coincurve installed it is a thread pool.
+
+Usage:
+    message_hash = trade_message_hash(order_id, base, quote, to_wei(price), ...)
+    signatures = await signing_service.sign([(private_key, message_hash), ...])
+    verify_signature(message_hash, signature, expected_signer)
+'''
+
+import asyncio
+import os
+import threading
+from collections import OrderedDict
+from concurrent.futures import ProcessPoolExecutor, ThreadPoolExecutor
+from decimal import Decimal, ROUND_DOWN
+from functools import lru_cache
+
+from eth_keys import KeyAPI
+from eth_utils import keccak, to_checksum_address
+
+ETH_MESSAGE_PREFIX = b"\x19Ethereum Signed Message:\n32"
+RECOVERED_CACHE_SIZE = 65536
+
+# (message hash, signature) -> recovered signer address, None for signatures that recover nothing
+_recovered = OrderedDict()
+# Checked from the event loop and from the gateway's settlement thread
+_recovered_lock = threading.Lock()
+
+
+def to_wei(amount, decimals=18) -> int:
+    '''Exact integer amount * 10**decimals, truncated like the contract expects.'''
+    if isinstance(amount, int):
+        return amount * 10**decimals
+    if not isinstance(amount, Decimal):
+        # str() of a float is its shortest round-tripping decimal, e.g. 0.1 -> "0.1"
+        amount = Decimal(str(amount))
+    return int(amount.scaleb(decimals).to_integral_value(rounding=ROUND_DOWN))
+
+
+@lru_cache(maxsize=4096)
+def checksum_address(address: str) -> str:
+    return to_checksum_address(address)
+
+
+@lru_cache(maxsize=4096)
+def address_bytes(address: str) -> bytes:
+    return bytes.fromhex(checksum_address(address)[2:].zfill(40))
+
+
+@lru_cache(maxsize=4096)
+def text_hash(text: str) -> bytes:
+    return keccak(text=text)
+
+
+@lru_cache(maxsize=256)
+def _small_uint256(value: int) -> bytes:
+    return value.to_bytes(32, "big")
+
+
+def uint256(value: int) -> bytes:
+    # Chain ids and flags repeat on every trade; amounts, nonces and timestamps don't
+    if value < 1 << 32:
+        return _small_uint256(value)
+    return value.to_bytes(32, "big")
+
+
+def order_id_bytes(order_id) -> bytes:
+    '''Order ids go on-chain as bytes32: hex ids as-is, anything else hashed.'''
+    if isinstance(order_id, str):
+        if order_id.startswith("0x"):
+            return bytes.fromhex(order_id[2:].zfill(64))
+        return keccak(text=order_id)
+    return order_id
+
+
+@lru_cache(maxsize=64)
+def _pair_fragment(base_asset: str, quote_asset: str) -> bytes:
+    return address_bytes(base_asset) + address_bytes(quote_asset)
+
+
+def trade_message_hash(
+    order_id,
+    base_asset: str,
+    quote_asset: str,
+    price_wei: int,
+    quantity_wei: int,
+    side: str,
+    receive_wallet: str,
+    source_chain_id: int,
+    destination_chain_id: int,
+    timestamp: int,
+    nonce: int,
+) -> bytes:
+    '''keccak256(abi.encodePacked(...)) of a party's trade authorization.'''
+    return keccak(
+        b"".join(
+            [
+                order_id_bytes(order_id),
+                _pair_fragment(base_asset, quote_asset),
+                uint256(price_wei),
+                uint256(quantity_wei),
+                text_hash(side),
+                address_bytes(receive_wallet),
+                uint256(source_chain_id),
+                uint256(destination_chain_id),
+                uint256(timestamp),
+                uint256(nonce),
+            ]
+        )
+    )
+
+
+def matching_engine_message_hash(
+    order_id,
+    party1: str,
+    party2: str,
+    party1_receive_wallet: str,
+    party2_receive_wallet: str,
+    base_asset: str,
+    quote_asset: str,
+    price_wei: int,
+    quantity_wei: int,
+    is_source_chain: bool,
+    chain_id: int,
+) -> bytes:
+    '''keccak256(abi.encodePacked(...)) of the matching engine's settlement authorization.'''
+    return keccak(
+        b"".join(
+            [
+                order_id_bytes(order_id),
+                address_bytes(party1),
+                address_bytes(party2),
+                address_bytes(party1_receive_wallet),
+                address_bytes(party2_receive_wallet),
+                _pair_fragment(base_asset, quote_asset),
+                uint256(price_wei),
+                uint256(quantity_wei),
+                uint256(1 if is_source_chain else 0),
+                uint256(chain_id),
+            ]
+        )
+    )
+
+
+def order_message_hash(
+    account: str,
+    base_asset: str,
+    quote_asset: str,
+    side: str,
+    order_type: str,
+    time_in_force: str,
+    price_wei: int,
+    quantity_wei: int,
+    from_network: str,
+    to_network: str,
+    receive_wallet: str,
+    expire_time: int,
+    salt: int,
+) -> bytes:
+    '''
+    keccak256 of the order a client authorizes at entry.
+
+    Symbols, order type, time in force and network names are hashed,
+    addresses packed; market orders sign price 0 and orders without an
+    expiry sign expire_time 0. The salt tells apart otherwise identical
+    orders, and a signed (account, salt) is only accepted once.
+    '''
+    return keccak(
+        b"".join(
+            [
+                address_bytes(account),
+                text_hash(base_asset),
+                text_hash(quote_asset),
+                text_hash(side),
+                text_hash(order_type),
+                text_hash(time_in_force),
+                uint256(price_wei),
+                uint256(quantity_wei),
+                text_hash(from_network),
+                text_hash(to_network),
+                address_bytes(receive_wallet),
+                uint256(expire_time),
+                uint256(salt),
+            ]
+        )
+    )
+
+
+def amend_message_hash(
+    account: str,
+    base_asset: str,
+    quote_asset: str,
+    side: str,
+    order_id: int,
+    price_wei: int,
+    quantity_wei: int,
+    salt: int,
+) -> bytes:
+    '''
+    keccak256 of an amend a client authorizes; a price or quantity left
+    unchanged is signed as 0.
+    '''
+    return keccak(
+        b"".join(
+            [
+                address_bytes(account),
+                text_hash(base_asset),
+                text_hash(quote_asset),
+                text_hash(side),
+                uint256(order_id),
+                uint256(price_wei),
+                uint256(quantity_wei),
+                uint256(salt),
+            ]
+        )
+    )
+
+
+@lru_cache(maxsize=1024)
+def _private_key(private_key: str):
+    return KeyAPI.PrivateKey(bytes.fromhex(private_key[2:] if private_key.startswith("0x") else private_key))
+
+
+def signer_address(private_key: str) -> str:
+    return _private_key(private_key).public_key.to_checksum_address()
+
+
+def sign_hash(private_key: str, message_hash: bytes) -> str:
+    '''Hex r || s || v (v = 27/28) personal-message signature of message_hash.'''
+    signature = _private_key(private_key).sign_msg_hash(keccak(ETH_MESSAGE_PREFIX + message_hash))
+    packed = signature.to_bytes()  # v is 0/1 here, Ethereum signatures carry 27/28
+    return (packed[:64] + bytes([packed[64] + 27])).hex()
+
+
+def _recover(message_hash: bytes, signature: str):
+    try:
+        raw = bytes.fromhex(signature[2:] if signature.startswith("0x") else signature)
+        if len(raw) != 65:
+            return None
+        v = raw[64] - 27 if raw[64] >= 27 else raw[64]
+        public_key = KeyAPI.Signature(raw[:64] + bytes([v])).recover_public_key_from_msg_hash(
+            keccak(ETH_MESSAGE_PREFIX + message_hash)
+        )
+        return public_key.to_checksum_address()
+    except Exception:
+        return None  # malformed hex, out of range r/s/v or no point on the curve
+
+
+def _remember(key, signer):
+    with _recovered_lock:
+        _recovered[key] = signer
+        if len(_recovered) > RECOVERED_CACHE_SIZE:
+            _recovered.popitem(last=False)
+    return signer
+
+
+def cached_signer(message_hash: bytes, signature: str):
+    '''(True, signer) if this signature was recovered before, else (False, None).'''
+    key = (message_hash, signature)
+    with _recovered_lock:
+        if key in _recovered:
+            _recovered.move_to_end(key)
+            return True, _recovered[key]
+    return False, None
+
+
+def recover_signer(message_hash: bytes, signature: str):
+    '''Address that made the personal-message signature of message_hash, or None.'''
+    cached, signer = cached_signer(message_hash, signature)
+    if cached:
+        return signer
+    return _remember((message_hash, signature), _recover(message_hash, signature))
+
+
+def matches_signer(recovered, signer: str) -> bool:
+    if recovered is None:
+        return False
+    try:
+        return recovered == checksum_address(signer)
+    except ValueError:
+        return False  # signer is not an address
+
+
+def verify_signature(message_hash: bytes, signature: str, signer: str) -> bool:
+    return matches_signer(recover_signer(message_hash, signature), signer)
+
+
+def sign_batch(jobs):
+    '''Sign [(private key, message hash)], in order. Runs in the pool's workers.'''
+    return [sign_hash(private_key, message_hash) for private_key, message_hash in jobs]
+
+
+def _native_backend():
+    return type(KeyAPI().backend).__name__ == "NativeECCBackend"
+
+
+class SigningService(object):
+    def __init__(self, workers=None, executor=None):
+        self.workers = workers or os.cpu_count() or 1
+        if executor is None:
+            pool = ProcessPoolExecutor if _native_backend() else ThreadPoolExecutor
+            executor = pool(max_workers=self.workers)
+        self.executor = executor
+
+    async def sign(self, jobs):
+        '''Signatures for [(private key, message hash)], spread over the pool's workers.'''
+        jobs = list(jobs)
+        if not jobs:
+            return []
+        loop = asyncio.get_running_loop()
+        size = -(-len(jobs) // min(self.workers, len(jobs)))
+        chunks = await asyncio.gather(
+            *[
+                loop.run_in_executor(self.executor, sign_batch, jobs[start:start + size])
+                for start in range(0, len(jobs), size)
+            ]
+        )
+        return [signature for chunk in chunks for signature in chunk]
+
+    async def recover_signer(self, message_hash, signature):
+        '''recover_signer(), with cache misses recovered in the pool.'''
+        cached, signer = cached_signer(message_hash, signature)
+        if cached:
+            return signer
+        signer = await asyncio.get_running_loop().run_in_executor(
+            self.executor, _recover, message_hash, signature
+        )
+        return _remember((message_hash, signature), signer)
+
+    async def verify_signature(self, message_hash, signature, signer):
+        return matches_signer(await self.recover_signer(message_hash, signature), signer)
+
+    def close(self):
+        self.executor.shutdown(wait=False, cancel_futures=True)
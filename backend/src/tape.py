@@ -0,0 +1,276 @@
+import os
+import re
+import operator
+from array import array
+from decimal import Decimal
+
+# Prices and quantities are kept as fixed point integers at the gateway's wire scale (1e8),
+# so sums over a window are exact and read back as the Decimals the engine traded
+SCALE = 10**8
+_SCALE = Decimal(SCALE)
+SEGMENT_NAME = re.compile(r"^tape-(\d{20})-(\d{20})\.seg$")
+
+
+def to_fixed(value):
+    if not isinstance(value, Decimal):
+        value = Decimal(str(value))
+    return int(value * SCALE)
+
+
+def from_fixed(value):
+    return Decimal(value) / _SCALE
+
+
+class Tape(object):
+    '''
+    A bounded, column-oriented ring buffer of recent trades.
+
+    Each trade is stored as one slot across parallel typed columns (sequence
+    number, timestamp, price, quantity) plus the two trade ids involved, so
+    range queries are plain array slices instead of walks over Python dicts.
+    No private keys or party arrays are kept here.
+
+    Price and quantity columns hold fixed point integers scaled by SCALE;
+    from_fixed turns a value back into a Decimal.
+
+    When the buffer is full the oldest chunk of trades is evicted. If a
+    spill_dir is given, evicted chunks are written to disk as columnar
+    segment files and can still be read back through the query API;
+    segments already in spill_dir (from an earlier run) are picked up and
+    sequence numbers continue after them.
+    '''
+
+    COLUMNS = (("seq", "q"), ("timestamp", "q"), ("price", "q"), ("quantity", "q"))
+
+    def __init__(self, capacity=100000, spill_dir=None, spill_chunk=None):
+        if capacity <= 0:
+            raise ValueError("Tape capacity must be positive")
+        self.capacity = capacity
+        self.spill_dir = spill_dir
+        self.spill_chunk = spill_chunk or max(1, capacity // 4)
+        self.seq = array("q", bytes(8 * capacity))
+        self.timestamp = array("q", bytes(8 * capacity))
+        self.price = array("q", bytes(8 * capacity))
+        self.quantity = array("q", bytes(8 * capacity))
+        self.maker = [None] * capacity  # trade id of the resting order
+        self.taker = [None] * capacity  # trade id of the incoming order
+        self.tail = 0  # physical slot of the oldest trade
+        self.count = 0  # number of trades held in memory
+        self.next_seq = 1  # sequence number given to the next trade
+        self.segments = []  # (first_seq, last_seq, first_ts, last_ts, path) of spilled chunks
+        if spill_dir:
+            os.makedirs(spill_dir, exist_ok=True)
+            self._load_segments()
+
+    def __len__(self):
+        return self.count
+
+    def __iter__(self):
+        '''Iterate over in-memory trades, oldest first.'''
+        for i in range(self.count):
+            slot = (self.tail + i) % self.capacity
+            yield {
+                "seq": self.seq[slot],
+                "timestamp": self.timestamp[slot],
+                "price": from_fixed(self.price[slot]),
+                "quantity": from_fixed(self.quantity[slot]),
+                "time": self.timestamp[slot],
+                "party1": self.maker[slot],
+                "party2": self.taker[slot],
+            }
+
+    def append(self, timestamp, price, quantity, maker=None, taker=None):
+        '''Record a trade and return its sequence number.'''
+        if self.count == self.capacity:
+            self._evict(self.spill_chunk)
+        slot = (self.tail + self.count) % self.capacity
+        seq = self.next_seq
+        self.seq[slot] = seq
+        self.timestamp[slot] = int(timestamp)
+        self.price[slot] = to_fixed(price)
+        self.quantity[slot] = to_fixed(quantity)
+        self.maker[slot] = maker
+        self.taker[slot] = taker
+        self.count += 1
+        self.next_seq += 1
+        return seq
+
+    def clear(self):
+        '''Drop every in-memory trade. Spilled segments are left on disk.'''
+        self.tail = 0
+        self.count = 0
+        self.maker = [None] * self.capacity
+        self.taker = [None] * self.capacity
+
+    def first_seq(self):
+        return self.seq[self.tail] if self.count else None
+
+    def last_seq(self):
+        return self.seq[(self.tail + self.count - 1) % self.capacity] if self.count else None
+
+    # ==================== QUERIES ====================
+
+    def trades_since(self, seq, include_spilled=False):
+        '''Columns of every trade with a sequence number greater than seq.'''
+        result = self._spilled(lambda s: s[1] > seq, lambda cols: _bisect(cols["seq"], seq, right=True)) \
+            if include_spilled else _empty_columns()
+        if self.count:
+            # Sequence numbers are contiguous in memory, so the start is O(1)
+            start = max(0, seq + 1 - self.seq[self.tail])
+            _extend(result, self._slice(start, self.count))
+        return result
+
+    def trades_between(self, start_time, end_time, include_spilled=False):
+        '''Columns of every trade with start_time <= timestamp <= end_time.'''
+        result = self._spilled(
+            lambda s: s[3] >= start_time and s[2] <= end_time,
+            lambda cols: _bisect(cols["timestamp"], start_time),
+            lambda cols: _bisect(cols["timestamp"], end_time, right=True),
+        ) if include_spilled else _empty_columns()
+        lo = self._search_time(start_time)
+        hi = self._search_time(end_time, right=True)
+        if lo < hi:
+            _extend(result, self._slice(lo, hi))
+        return result
+
+    def recent(self, n):
+        '''Columns of the n most recent in-memory trades.'''
+        return self._slice(max(0, self.count - n), self.count)
+
+    def vwap(self, start_time, end_time, include_spilled=False):
+        '''Volume weighted average price over a window, or None if nothing traded.'''
+        cols = self.trades_between(start_time, end_time, include_spilled)
+        volume = sum(cols["quantity"])
+        if not volume:
+            return None
+        # Exact integer sums; one rounding, in the division
+        return Decimal(sum(map(operator.mul, cols["price"], cols["quantity"]))) / volume / _SCALE
+
+    def ohlcv(self, start_time, end_time, include_spilled=False):
+        '''Open/high/low/close/volume over a window, or None if nothing traded.'''
+        cols = self.trades_between(start_time, end_time, include_spilled)
+        if not len(cols["price"]):
+            return None
+        prices = cols["price"]
+        return {
+            "open": from_fixed(prices[0]),
+            "high": from_fixed(max(prices)),
+            "low": from_fixed(min(prices)),
+            "close": from_fixed(prices[-1]),
+            "volume": from_fixed(sum(cols["quantity"])),
+            "trades": len(prices),
+            "start": start_time,
+            "end": end_time,
+        }
+
+    # ==================== INTERNALS ====================
+
+    def _search_time(self, timestamp, right=False):
+        '''Binary search the logical position of timestamp in memory.'''
+        lo, hi = 0, self.count
+        while lo < hi:
+            mid = (lo + hi) // 2
+            value = self.timestamp[(self.tail + mid) % self.capacity]
+            if value < timestamp or (right and value == timestamp):
+                lo = mid + 1
+            else:
+                hi = mid
+        return lo
+
+    def _slice(self, start, stop):
+        '''Copy logical positions [start, stop) out of every column.'''
+        result = {}
+        first = (self.tail + start) % self.capacity
+        length = stop - start
+        for name, _ in self.COLUMNS:
+            column = getattr(self, name)
+            if length <= 0:
+                result[name] = column[0:0]
+            elif first + length <= self.capacity:
+                result[name] = column[first:first + length]
+            else:
+                # Wrapped around the end of the buffer
+                result[name] = column[first:] + column[:first + length - self.capacity]
+        return result
+
+    def _evict(self, n):
+        '''Drop the n oldest trades, spilling them to a segment file if configured.'''
+        n = min(n, self.count)
+        if self.spill_dir:
+            cols = self._slice(0, n)
+            path = os.path.join(
+                self.spill_dir, "tape-%020d-%020d.seg" % (cols["seq"][0], cols["seq"][-1])
+            )
+            with open(path, "wb") as segment:
+                for name, _ in self.COLUMNS:
+                    cols[name].tofile(segment)
+            self.segments.append(
+                (cols["seq"][0], cols["seq"][-1], cols["timestamp"][0], cols["timestamp"][-1], path)
+            )
+        for i in range(n):
+            slot = (self.tail + i) % self.capacity
+            self.maker[slot] = None
+            self.taker[slot] = None
+        self.tail = (self.tail + n) % self.capacity
+        self.count -= n
+
+    def _load_segments(self):
+        '''Index segments spilled by an earlier run, so they stay queryable and are not overwritten.'''
+        width = array("q").itemsize
+        for name in sorted(os.listdir(self.spill_dir)):
+            match = SEGMENT_NAME.match(name)
+            if match is None:
+                continue
+            first_seq, last_seq = int(match.group(1)), int(match.group(2))
+            length = last_seq - first_seq + 1
+            path = os.path.join(self.spill_dir, name)
+            timestamps = array("q")
+            with open(path, "rb") as segment:
+                # Columns are stored one after another: the timestamp column follows seq
+                segment.seek(length * width)
+                timestamps.fromfile(segment, length)
+            self.segments.append((first_seq, last_seq, timestamps[0], timestamps[-1], path))
+            self.next_seq = max(self.next_seq, last_seq + 1)
+
+    def _spilled(self, wanted, lower, upper=None):
+        '''Gather columns from spilled segments that pass the wanted filter.'''
+        result = _empty_columns()
+        for segment in self.segments:
+            if not wanted(segment):
+                continue
+            cols = _read_segment(segment[4], segment[1] - segment[0] + 1)
+            lo = lower(cols)
+            hi = upper(cols) if upper else len(cols["seq"])
+            for name, _ in self.COLUMNS:
+                result[name].extend(cols[name][lo:hi])
+        return result
+
+
+def _empty_columns():
+    return {name: array(code) for name, code in Tape.COLUMNS}
+
+
+def _extend(result, cols):
+    for name, _ in Tape.COLUMNS:
+        result[name].extend(cols[name])
+
+
+def _read_segment(path, length):
+    cols = {}
+    with open(path, "rb") as segment:
+        for name, code in Tape.COLUMNS:
+            column = array(code)
+            column.fromfile(segment, length)
+            cols[name] = column
+    return cols
+
+
+def _bisect(column, value, right=False):
+    lo, hi = 0, len(column)
+    while lo < hi:
+        mid = (lo + hi) // 2
+        if column[mid] < value or (right and column[mid] == value):
+            lo = mid + 1
+        else:
+            hi = mid
+    return lo
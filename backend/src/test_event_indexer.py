@@ -0,0 +1,226 @@
+'''
+ContractEventIndexer against a scripted chain
+
+FakeChain stands in for web3: eth.block_number, get_block and get_logs over
+blocks whose hashes the test controls, returning ABI-encoded settlement
+contract logs, with a node-side cap on the getLogs range. Run from backend/:
+
+    python -m pytest src/test_event_indexer.py
+'''
+
+import os
+import tempfile
+
+from eth_abi import encode
+from eth_utils import keccak, to_checksum_address
+
+from src.event_indexer import ContractEventIndexer, EventIndexStore
+from src.trade_settlement_client import load_abi
+
+CHAIN_ID = 296
+CONTRACT = to_checksum_address("0x" + "c0" * 20)
+USER = to_checksum_address("0x" + "11" * 20)
+COUNTERPARTY = to_checksum_address("0x" + "22" * 20)
+TOKEN = to_checksum_address("0x" + "33" * 20)
+
+
+class FakeChain(object):
+    '''Blocks 0..head, a hash per (fork, block) and logs per block; refuses getLogs over max_range blocks.'''
+
+    def __init__(self, head, max_range=None):
+        self.head = head
+        self.max_range = max_range
+        self.forks = {}  # block number : fork generation, 0 when absent
+        self.logs = {}  # block number : [log without block fields]
+        self.requests = []  # (fromBlock, toBlock) of every getLogs call, refused ones included
+        self.eth = self
+
+    @property
+    def block_number(self):
+        return self.head
+
+    def _hash(self, number):
+        return keccak(b"%d:%d" % (self.forks.get(number, 0), number))
+
+    def get_block(self, number):
+        assert number <= self.head
+        return {"number": number, "hash": self._hash(number)}
+
+    def get_logs(self, query):
+        first, last = query["fromBlock"], query["toBlock"]
+        self.requests.append((first, last))
+        if self.max_range is not None and last - first + 1 > self.max_range:
+            raise ValueError("query returned more than 10000 results")
+        assert query["address"] == CONTRACT
+        wanted = set(query["topics"][0])
+        result = []
+        for number in range(first, min(last, self.head) + 1):
+            for log_index, log in enumerate(self.logs.get(number, [])):
+                if "0x" + log["topics"][0].hex() not in wanted:
+                    continue
+                result.append(dict(
+                    log,
+                    blockNumber=number,
+                    blockHash=self._hash(number),
+                    transactionHash=keccak(self._hash(number) + bytes([log_index])),
+                    logIndex=log_index,
+                ))
+        return result
+
+    def add_log(self, number, log):
+        self.logs.setdefault(number, []).append(log)
+
+    def reorg(self, first):
+        '''Replace every block from first on with a new fork that has none of the old logs.'''
+        for number in range(first, self.head + 1):
+            self.forks[number] = self.forks.get(number, 0) + 1
+            self.logs.pop(number, None)
+
+
+def _topic(value, kind):
+    return encode([kind], [value])
+
+
+def deposit(amount, timestamp=1700000000):
+    return {
+        "topics": [
+            keccak(text="EscrowDepositEvent(address,address,uint256,uint256)"),
+            _topic(USER, "address"),
+            _topic(TOKEN, "address"),
+        ],
+        "data": encode(["uint256", "uint256"], [amount, timestamp]),
+    }
+
+
+def settlement(order_id, amount, timestamp=1700000000):
+    return {
+        "topics": [
+            keccak(text="CrossChainTradeSettled(bytes32,address,address,address,uint256,uint256,bool,uint256)"),
+            order_id,
+            _topic(USER, "address"),
+            _topic(COUNTERPARTY, "address"),
+        ],
+        "data": encode(
+            ["address", "uint256", "uint256", "bool", "uint256"], [TOKEN, amount, CHAIN_ID, True, timestamp]
+        ),
+    }
+
+
+def make_indexer(chain, store, **kwargs):
+    options = dict(start_block=0, batch_blocks=1000, confirmations=0, reorg_depth=20)
+    options.update(kwargs)
+    return ContractEventIndexer(chain, CONTRACT, CHAIN_ID, store, load_abi("settlement_abi"), **options)
+
+
+def catch_up(indexer):
+    polls = 1
+    while indexer.poll():
+        polls += 1
+    return polls
+
+
+def temp_store():
+    directory = tempfile.mkdtemp()
+    return EventIndexStore(os.path.join(directory, "chain_events.db"))
+
+
+def test_get_logs_range_halving():
+    chain = FakeChain(head=999, max_range=100)
+    for number in (5, 250, 501, 998):
+        chain.add_log(number, deposit(number))
+    store = temp_store()
+    indexer = make_indexer(chain, store)
+    catch_up(indexer)
+
+    sizes = [last - first + 1 for first, last in chain.requests]
+    # Refused down to 62 blocks, doubled after a success and refused again at 124
+    assert sizes[:6] == [1000, 500, 250, 125, 62, 124]
+    assert store.checkpoint(CHAIN_ID)[0] == 999
+    assert store.escrow_summary(CHAIN_ID, USER, TOKEN)["deposited"] == 5 + 250 + 501 + 998
+    # Every block was asked for by an accepted call, none twice
+    accepted = [(first, last) for first, last in chain.requests if last - first + 1 <= 100]
+    covered = [number for first, last in accepted for number in range(first, last + 1)]
+    assert covered == list(range(1000))
+    store.close()
+
+
+def test_reorg_rewinds_to_the_fork():
+    chain = FakeChain(head=50)
+    chain.add_log(10, deposit(1))
+    chain.add_log(35, deposit(10))
+    chain.add_log(45, deposit(100))
+    store = temp_store()
+    indexer = make_indexer(chain, store)
+    catch_up(indexer)
+    assert store.escrow_summary(CHAIN_ID, USER, TOKEN)["deposited"] == 111
+
+    # Blocks 40.. are replaced: the deposit at 45 is gone, one at 47 takes its place
+    chain.reorg(40)
+    chain.head = 55
+    chain.add_log(47, deposit(1000))
+    catch_up(indexer)
+
+    # Rewound to block 35, the newest recorded block whose hash still matches, and re-indexed
+    assert chain.requests[-1] == (36, 55)
+    assert store.escrow_summary(CHAIN_ID, USER, TOKEN)["deposited"] == 1011
+    assert store.checkpoint(CHAIN_ID) == (55, chain.get_block(55)["hash"])
+
+    # No recorded hash matches any more: the reorg_depth window below the checkpoint is re-indexed
+    # (a reorg deeper than reorg_depth is past what the indexer undoes)
+    chain.reorg(30)
+    chain.head = 60
+    catch_up(indexer)
+    assert chain.requests[-1] == (36, 60)
+    assert store.escrow_summary(CHAIN_ID, USER, TOKEN)["deposited"] == 11
+    store.close()
+
+
+def test_settlements_passed_on_only_past_reorg_depth():
+    chain = FakeChain(head=40)
+    order_id = keccak(b"order-1")
+    chain.add_log(30, settlement(order_id, 7))
+    passed = []
+    store = temp_store()
+    indexer = make_indexer(chain, store, on_settled=passed.extend)
+    catch_up(indexer)
+    # Indexed, but only 10 blocks deep: a reorg could still remove it
+    assert len(store.settlements(order_id)) == 1
+    assert passed == []
+
+    chain.head = 50
+    catch_up(indexer)
+    assert [entry["order_id"] for entry in passed] == [order_id]
+    assert passed[0]["block_number"] == 30
+
+    chain.head = 60
+    catch_up(indexer)
+    assert len(passed) == 1
+    store.close()
+
+
+def test_resume_from_checkpoint():
+    chain = FakeChain(head=100)
+    chain.add_log(20, deposit(1))
+    store = temp_store()
+    catch_up(make_indexer(chain, store))
+    path = store.path
+    store.close()
+
+    # A restart: new store on the same file, new indexer; start_block is only for a fresh database
+    chain.head = 150
+    chain.add_log(120, deposit(10))
+    chain.requests = []
+    store = EventIndexStore(path)
+    catch_up(make_indexer(chain, store, start_block=0))
+
+    assert chain.requests == [(101, 150)]
+    assert store.escrow_summary(CHAIN_ID, USER, TOKEN)["deposited"] == 11
+    assert len(store.history(CHAIN_ID, USER)) == 2
+    store.close()
+
+
+if __name__ == "__main__":
+    for name, test in sorted(globals().items()):
+        if name.startswith("test_") and callable(test):
+            test()
+            print("ok", name)
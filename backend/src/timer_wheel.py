@@ -0,0 +1,105 @@
+'''
+Hierarchical timing wheel
+
+Schedules items against millisecond deadlines so that expiring them costs
+O(expired) rather than a scan of everything pending. Level 0 has one slot
+per tick; every higher level has slots as wide as the whole level below
+it. A level's slot is cascaded into finer levels when the clock reaches
+it, so each item moves down at most once per level before it comes due.
+Deadlines beyond the top level wait in an overflow list that is
+re-examined every time the top level completes a turn.
+
+Items are never removed early: callers check on expiry whether the item
+is still live (lazy cancellation), which keeps schedule() O(1) and
+avoids per-item bookkeeping when orders fill or are cancelled.
+
+Usage:
+    wheel = TimerWheel(start=now_ms)
+    wheel.schedule(now_ms + 30000, order_id)
+    for deadline, order_id in wheel.advance(now_ms):
+        ...
+'''
+
+
+class TimerWheel(object):
+    def __init__(self, tick=10, slots=(256, 64, 64, 64), start=0):
+        self.tick = tick  # resolution in milliseconds
+        self.slots = slots
+        self.current = start // tick  # last tick processed
+        self.levels = [[[] for _ in range(count)] for count in slots]
+        # granularity[i]: ticks covered by one slot of level i
+        self.granularity = []
+        span = 1
+        for count in slots:
+            self.granularity.append(span)
+            span *= count
+        self.span = span  # ticks covered by all levels together
+        self.overflow = []
+        self.due = []  # scheduled at or before the current tick
+        self.count = 0
+
+    def __len__(self):
+        return self.count
+
+    def schedule(self, deadline, item):
+        '''Make item due once advance() reaches deadline (milliseconds).'''
+        expiry = -(-deadline // self.tick)  # round up: never fire early
+        self.count += 1
+        if expiry <= self.current:
+            self.due.append((deadline, expiry, item))
+        else:
+            self._insert((deadline, expiry, item))
+
+    def _insert(self, entry):
+        delta = entry[1] - self.current
+        for level, count in enumerate(self.slots):
+            granularity = self.granularity[level]
+            if delta < granularity * count:
+                self.levels[level][(entry[1] // granularity) % count].append(entry)
+                return
+        self.overflow.append(entry)
+
+    def advance(self, now):
+        '''Move the clock to now (milliseconds) and return [(deadline, item)] that came due.'''
+        target = now // self.tick
+        expired = [(deadline, item) for deadline, _, item in self.due]
+        self.due = []
+        if not self.count or target <= self.current:
+            self.count -= len(expired)
+            if not self.count:
+                self.current = max(self.current, target)
+            return expired
+
+        first = self.levels[0]
+        first_count = self.slots[0]
+        while self.current < target:
+            if self.count == len(expired):
+                # Nothing left anywhere: jump instead of walking empty slots
+                self.current = target
+                break
+            self.current += 1
+            if self.current % first_count == 0:
+                self._cascade()
+            slot = first[self.current % first_count]
+            if slot:
+                expired.extend((deadline, item) for deadline, _, item in slot)
+                del slot[:]
+        self.count -= len(expired)
+        return expired
+
+    def _cascade(self):
+        # Coarse levels first, so their items can settle all the way down this tick
+        for level in range(len(self.slots) - 1, 0, -1):
+            granularity = self.granularity[level]
+            if self.current % granularity:
+                continue
+            if level == len(self.slots) - 1 and self.current % self.span == 0 and self.overflow:
+                overflow, self.overflow = self.overflow, []
+                for entry in overflow:
+                    self._insert(entry)
+            slot = self.levels[level][(self.current // granularity) % self.slots[level]]
+            if slot:
+                entries = slot[:]
+                del slot[:]
+                for entry in entries:
+                    self._insert(entry)
@@ -0,0 +1,174 @@
+'''
+Token registry
+
+Resolves a token symbol to its checksum address and decimals once, and
+converts between engine amounts (Decimal prices and quantities) and the
+integer base units the contracts use, exactly, without floats:
+
+- symbols are matched case-insensitively; per-chain deployments follow
+  the TOKEN_ADDRESSES naming, SYMBOL_NETWORK (cNGN_BSC, xZAR_ETH), and
+  address(symbol, network) picks the one for a network when it exists
+- addresses are checksummed when registered, not on every lookup
+- decimals come from configuration, or from the token's decimals() on
+  first use; the answer is cached per address. A failed lookup raises
+  DecimalsUnavailable rather than guess: an amount converted with the
+  wrong decimals would validate or settle a fill off by powers of ten.
+  The failure is remembered and the chain asked again after
+  DECIMALS_RETRY seconds
+
+The registry is a mapping of symbol to address, so it can stand in for
+the plain TOKEN_ADDRESSES dict everywhere that takes one.
+
+Usage:
+    tokens = TokenRegistry({"USDT": "0xc8b4..."}, decimals={"USDT": 6})
+    tokens.to_wei("USDT", Decimal("12.5"))   # 12500000
+    tokens.quote_wei("USDT", quantity, price, web3)
+'''
+
+import logging
+import re
+import time
+from collections.abc import Mapping
+from decimal import Decimal
+from typing import NamedTuple
+
+from . import signing
+
+logger = logging.getLogger(__name__)
+
+DEFAULT_DECIMALS = 18
+# Prices are signed and settled as 18-decimal fixed point, whatever the tokens' decimals
+PRICE_DECIMALS = 18
+DECIMALS_RETRY = 60.0
+# TOKEN_ADDRESSES suffix of a network's deployments where it is not the upper-cased network name
+NETWORK_SUFFIXES = {"ethereum": "ETH"}
+DECIMALS_ABI = [
+    {
+        "constant": True,
+        "inputs": [],
+        "name": "decimals",
+        "outputs": [{"name": "", "type": "uint8"}],
+        "type": "function",
+    }
+]
+ADDRESS = re.compile(r"^0x[0-9a-fA-F]{40}$")
+
+
+class DecimalsUnavailable(LookupError):
+    '''A token's decimals are neither configured nor readable from the chain.'''
+
+
+class Token(NamedTuple):
+    symbol: str
+    address: str
+    decimals: int
+
+
+def to_decimal(amount) -> Decimal:
+    '''Decimal value of an engine amount; floats go through their shortest repr, never binary.'''
+    if isinstance(amount, Decimal):
+        return amount
+    if isinstance(amount, int):
+        return Decimal(amount)
+    return Decimal(str(amount))
+
+
+class TokenRegistry(Mapping):
+    def __init__(self, addresses=None, decimals=None):
+        self.addresses = {}  # upper-cased symbol : checksum address
+        self.names = {}  # upper-cased symbol : symbol as registered
+        self.symbols = {}  # checksum address : symbol as registered
+        self.known_decimals = {}  # checksum address : decimals
+        self.failed_lookups = {}  # checksum address : monotonic time of the last failed decimals()
+        decimals = decimals or {}
+        for symbol, address in (addresses or {}).items():
+            self.register(symbol, address, decimals.get(symbol))
+
+    @classmethod
+    def of(cls, token_addresses):
+        '''token_addresses as a registry: itself if it is one, else a registry built from the dict.'''
+        if isinstance(token_addresses, cls):
+            return token_addresses
+        return cls(token_addresses)
+
+    def register(self, symbol, address, decimals=None):
+        address = signing.checksum_address(address)
+        self.addresses[symbol.upper()] = address
+        self.names[symbol.upper()] = symbol
+        self.symbols.setdefault(address, symbol)
+        if decimals is not None:
+            self.known_decimals[address] = int(decimals)
+
+    # ==================== MAPPING ====================
+
+    def __getitem__(self, symbol):
+        return self.addresses[symbol.upper()]
+
+    def __iter__(self):
+        return iter(self.names.values())
+
+    def __len__(self):
+        return len(self.addresses)
+
+    # ==================== LOOKUPS ====================
+
+    def address(self, token, network=None) -> str:
+        '''
+        Checksum address of a symbol (the network's own deployment first, when
+        network is given) or of an address. Anything else comes back as given.
+        '''
+        key = token.upper()
+        if network is not None:
+            suffixed = "%s_%s" % (key, NETWORK_SUFFIXES.get(network, network).upper())
+            if suffixed in self.addresses:
+                return self.addresses[suffixed]
+        if key in self.addresses:
+            return self.addresses[key]
+        if ADDRESS.match(token):
+            return signing.checksum_address(token)
+        return token
+
+    def decimals(self, token, web3=None) -> int:
+        '''
+        Decimals of a symbol or address; read from the chain through web3 the first time.
+
+        Without web3 (offline tools) an unconfigured token is taken to have 18.
+        With web3, raises DecimalsUnavailable for an unknown symbol or a failed read.
+        '''
+        address = self.address(token)
+        if address in self.known_decimals:
+            return self.known_decimals[address]
+        if web3 is None:
+            return DEFAULT_DECIMALS
+        if not ADDRESS.match(address):
+            raise DecimalsUnavailable("unknown token %s" % token)
+        failed = self.failed_lookups.get(address)
+        if failed is not None and time.monotonic() - failed < DECIMALS_RETRY:
+            raise DecimalsUnavailable("decimals() of %s failed %.0fs ago" % (address, time.monotonic() - failed))
+        try:
+            decimals = int(web3.eth.contract(address=address, abi=DECIMALS_ABI).functions.decimals().call())
+        except Exception as e:
+            self.failed_lookups[address] = time.monotonic()
+            logger.warning("decimals() lookup failed for %s: %s", address, e)
+            raise DecimalsUnavailable("decimals() of %s failed: %s" % (address, e)) from e
+        self.known_decimals[address] = decimals
+        self.failed_lookups.pop(address, None)
+        return decimals
+
+    def token(self, token, web3=None, network=None) -> Token:
+        address = self.address(token, network)
+        return Token(self.symbols.get(address, token), address, self.decimals(address, web3))
+
+    # ==================== CONVERSIONS ====================
+
+    def to_wei(self, token, amount, web3=None) -> int:
+        '''amount of token in its base units, truncated like the contract.'''
+        return signing.to_wei(to_decimal(amount), self.decimals(token, web3))
+
+    def from_wei(self, token, amount_wei: int, web3=None) -> Decimal:
+        '''Exact token amount of amount_wei base units.'''
+        return Decimal(int(amount_wei)).scaleb(-self.decimals(token, web3))
+
+    def quote_wei(self, token, quantity, price, web3=None) -> int:
+        '''Base units of quote token worth quantity at price, multiplied before any rounding.'''
+        return self.to_wei(token, to_decimal(quantity) * to_decimal(price), web3)
@@ -6,19 +6,42 @@ including escrow management, token approvals, signature creation, and trade sett
 """
 
 import json
+import os
+import time
+import logging
+from functools import cached_property, lru_cache
+from urllib.parse import urlparse
 from web3 import Web3
 from eth_account import Account
-from eth_account.messages import encode_defunct
 from typing import Dict, Optional
 
+from . import metrics
+from . import signing
+from .rpc_pool import provider_for, split_urls
+
 # from src import settlement ERC20_ABI, TRADE_SETTLEMENT_ABI
 
+logger = logging.getLogger(__name__)
+
+# backend/abis, wherever the process is started from
+ABI_DIR = os.path.join(os.path.dirname(os.path.dirname(os.path.abspath(__file__))), "abis")
+
 
-with open("orderbook/abis/ERC20_abi.json", "r", encoding="utf-8") as f:
-    ERC20_ABI = json.load(f)
+@lru_cache(maxsize=None)
+def load_abi(name: str) -> list:
+    """ABI in abis/<name>.json, parsed on first use and shared afterwards (don't mutate it)"""
+    with open(os.path.join(ABI_DIR, name + ".json"), "r", encoding="utf-8") as f:
+        data = json.load(f)
+    return data["abi"] if isinstance(data, dict) and "abi" in data else data
 
-with open("orderbook/abis/settlement_abi.json", "r", encoding="utf-8") as f:
-    TRADE_SETTLEMENT_ABI = json.load(f)
+
+def __getattr__(name):
+    # ERC20_ABI and TRADE_SETTLEMENT_ABI stay importable without being read at import
+    if name == "ERC20_ABI":
+        return load_abi("ERC20_abi")
+    if name == "TRADE_SETTLEMENT_ABI":
+        return load_abi("settlement_abi")
+    raise AttributeError(f"module {__name__!r} has no attribute {name!r}")
 
 
 class SettlementClient:
@@ -38,30 +61,85 @@ class SettlementClient:
         web3_provider: str,
         contract_address: str,
         private_key: Optional[str] = None,
+        settled_index=None,
     ):
         """
         Initialize the Settlement Client
 
         Args:
-            web3_provider: RPC URL for the blockchain network
+            web3_provider: RPC URL for the blockchain network; several URLs
+                (comma separated or a list) are pooled with failover and hedging
             contract_address: Address of the deployed settlement contract
             private_key: Private key for signing transactions (optional)
+            settled_index: SettledTradeIndex answering check_trade_settled locally (optional)
         """
-        self.web3 = Web3(Web3.HTTPProvider(web3_provider))
-
-        if not self.web3.is_connected():
-            raise ConnectionError(f"Failed to connect to {web3_provider}")
+        self.web3 = Web3(provider_for(web3_provider))
+        # Host of the RPC endpoint(s), used to label latency metrics per chain
+        self.endpoint = "+".join(urlparse(url).netloc or url for url in split_urls(web3_provider))
 
+        # Nothing here touches the network: the contract is built on first use and
+        # check_connection() is left to callers that can afford to wait on the RPC
         self.contract_address = Web3.to_checksum_address(contract_address)
-        self.contract = self.web3.eth.contract(
-            address=self.contract_address, abi=TRADE_SETTLEMENT_ABI
+        self.account = Account.from_key(private_key) if private_key else None
+        self.settled_index = settled_index
+        self._chain_id = None
+        self._token_contracts = {}
+        self.connected = None  # unknown until check_connection()
+
+        logger.debug(
+            "Settlement client created",
+            extra={
+                "endpoint": self.endpoint,
+                "contract": self.contract_address,
+                "account": self.account.address if self.account else None,
+            },
         )
 
-        self.account = Account.from_key(private_key) if private_key else None
+    @cached_property
+    def contract(self):
+        return self.web3.eth.contract(
+            address=self.contract_address, abi=load_abi("settlement_abi")
+        )
 
-        print(f"✅ Connected to network (Chain ID: {self.web3.eth.chain_id})")
-        if self.account:
-            print(f"✅ Account loaded: {self.account.address}")
+    def token_contract(self, token_address: str):
+        """ERC20 contract object for token_address, built once per client"""
+        token_address = signing.checksum_address(token_address)
+        if token_address not in self._token_contracts:
+            self._token_contracts[token_address] = self.web3.eth.contract(
+                address=token_address, abi=load_abi("ERC20_abi")
+            )
+        return self._token_contracts[token_address]
+
+    def check_connection(self) -> bool:
+        """Ask the RPC endpoint whether it is reachable; blocks for up to the request timeout"""
+        was_connected = self.connected
+        try:
+            self.connected = bool(self.web3.is_connected())
+        except Exception:
+            self.connected = False
+        if not self.connected and was_connected is not False:
+            logger.warning("Settlement RPC unreachable", extra={"endpoint": self.endpoint})
+        return self.connected
+
+    @property
+    def chain_id(self) -> int:
+        """Chain id of the connected network, read once"""
+        if self._chain_id is None:
+            self._chain_id = self.web3.eth.chain_id
+        return self._chain_id
+
+    def _call(self, method: str, function):
+        """Run a contract read, recording its latency and any error"""
+        t0 = time.perf_counter_ns()
+        try:
+            return function.call()
+        except Exception as e:
+            metrics.ERRORS.labels("rpc_" + type(e).__name__).inc()
+            raise
+        finally:
+            metrics.RPC_LATENCY.labels(self.endpoint, method).observe_ns(
+                time.perf_counter_ns() - t0
+            )
 
     # ==================== ESCROW MANAGEMENT ====================
 
@@ -89,9 +167,9 @@ class SettlementClient:
 
         try:
             token_address = Web3.to_checksum_address(token_address)
-            amount_wei = int(amount * (10**token_decimals))
+            amount_wei = signing.to_wei(amount, token_decimals)
 
-            print(f"📥 Depositing {amount} tokens to escrow...")
+            logger.info("Depositing %s of %s to escrow", amount, token_address)
 
             # Build transaction
             tx = self.contract.functions.depositToEscrow(
@@ -109,17 +187,17 @@ class SettlementClient:
             signed_tx = self.web3.eth.account.sign_transaction(tx, self.account.key)
             tx_hash = self.web3.eth.send_raw_transaction(signed_tx.raw_transaction)
 
-            print(f"🚀 Transaction sent: {tx_hash.hex()}")
-            print("⏳ Waiting for confirmation...")
+            logger.info("Deposit transaction sent: %s", tx_hash.hex())
 
             receipt = self.web3.eth.wait_for_transaction_receipt(tx_hash, timeout=120)
 
             if receipt.status == 1:
-                print(f"✅ Deposit successful!")
-                print(f"   Gas used: {receipt.gasUsed}")
-                print(f"   Block: {receipt.blockNumber}")
+                logger.info(
+                    "Deposit confirmed",
+                    extra={"gas_used": receipt.gasUsed, "block": receipt.blockNumber},
+                )
             else:
-                print("❌ Transaction failed")
+                logger.error("Deposit transaction failed: %s", tx_hash.hex())
 
             return {
                 "success": receipt.status == 1,
@@ -131,7 +209,7 @@ class SettlementClient:
             }
 
         except Exception as e:
-            print(f"❌ Deposit failed: {e}")
+            logger.error("Deposit failed: %s", e)
             return {"success": False, "error": str(e)}
 
     def withdraw_from_escrow(
@@ -158,9 +236,9 @@ class SettlementClient:
 
         try:
             token_address = Web3.to_checksum_address(token_address)
-            amount_wei = int(amount * (10**token_decimals))
+            amount_wei = signing.to_wei(amount, token_decimals)
 
-            print(f"📤 Withdrawing {amount} tokens from escrow...")
+            logger.info("Withdrawing %s of %s from escrow", amount, token_address)
 
             tx = self.contract.functions.withdrawFromEscrow(
                 token_address, amount_wei
@@ -176,13 +254,13 @@ class SettlementClient:
             signed_tx = self.web3.eth.account.sign_transaction(tx, self.account.key)
             tx_hash = self.web3.eth.send_raw_transaction(signed_tx.raw_transaction)
 
-            print(f"🚀 Transaction sent: {tx_hash.hex()}")
+            logger.info("Withdrawal transaction sent: %s", tx_hash.hex())
             receipt = self.web3.eth.wait_for_transaction_receipt(tx_hash, timeout=120)
 
             if receipt.status == 1:
-                print(f"✅ Withdrawal successful!")
+                logger.info("Withdrawal confirmed", extra={"block": receipt.blockNumber})
             else:
-                print("❌ Transaction failed")
+                logger.error("Withdrawal transaction failed: %s", tx_hash.hex())
 
             return {
                 "success": receipt.status == 1,
@@ -193,7 +271,7 @@ class SettlementClient:
             }
 
         except Exception as e:
-            print(f"❌ Withdrawal failed: {e}")
+            logger.error("Withdrawal failed: %s", e)
             return {"success": False, "error": str(e)}
 
     def check_escrow_balance(
@@ -214,9 +292,10 @@ class SettlementClient:
             user_address = Web3.to_checksum_address(user_address)
             token_address = Web3.to_checksum_address(token_address)
 
-            total, available, locked = self.contract.functions.checkEscrowBalance(
-                user_address, token_address
-            ).call()
+            total, available, locked = self._call(
+                "checkEscrowBalance",
+                self.contract.functions.checkEscrowBalance(user_address, token_address),
+            )
 
             divisor = 10**token_decimals
 
@@ -232,9 +311,61 @@ class SettlementClient:
             }
 
         except Exception as e:
-            print(f"❌ Error checking balance: {e}")
+            logger.error("Error checking balance: %s", e)
             return {"error": str(e)}
 
+    def check_escrow_balances(self, pairs, token_decimals: int = 18) -> Dict:
+        """
+        Escrow balances for many (user, token) pairs in one JSON-RPC batch
+
+        Falls back to one call per pair when the provider or web3 version
+        cannot batch. Returns {(user_address, token_address): balance dict},
+        keyed by the addresses as given, with the same fields as
+        check_escrow_balance.
+        """
+        pairs = list(dict.fromkeys(pairs))
+        if not pairs:
+            return {}
+        divisor = 10**token_decimals
+        t0 = time.perf_counter_ns()
+        try:
+            with self.web3.batch_requests() as batch:
+                for user_address, token_address in pairs:
+                    batch.add(
+                        self.contract.functions.checkEscrowBalance(
+                            Web3.to_checksum_address(user_address),
+                            Web3.to_checksum_address(token_address),
+                        )
+                    )
+                results = batch.execute()
+        except Exception as e:
+            logger.debug("Batched escrow read unavailable, reading one by one: %s", e)
+            return {
+                (user_address, token_address): self.check_escrow_balance(
+                    user_address, token_address, token_decimals
+                )
+                for user_address, token_address in pairs
+            }
+        finally:
+            metrics.RPC_LATENCY.labels(self.endpoint, "checkEscrowBalance_batch").observe_ns(
+                time.perf_counter_ns() - t0
+            )
+
+        balances = {}
+        for (user_address, token_address), result in zip(pairs, results):
+            total, available, locked = result
+            balances[(user_address, token_address)] = {
+                "total": total / divisor,
+                "total_wei": total,
+                "available": available / divisor,
+                "available_wei": available,
+                "locked": locked / divisor,
+                "locked_wei": locked,
+                "user": user_address,
+                "token": token_address,
+            }
+        return balances
+
     # ==================== TOKEN OPERATIONS ====================
 
     def approve_token(
@@ -265,14 +396,12 @@ class SettlementClient:
             # Unlimited approval if no amount specified
             if amount is None:
                 amount_wei = 2**256 - 1
-                print(f"🔓 Approving unlimited spending for {token_address}...")
+                logger.info("Approving unlimited spending of %s", token_address)
             else:
-                amount_wei = int(amount * (10**token_decimals))
-                print(f"🔓 Approving {amount} tokens for spending...")
+                amount_wei = signing.to_wei(amount, token_decimals)
+                logger.info("Approving %s of %s for spending", amount, token_address)
 
-            token_contract = self.web3.eth.contract(
-                address=token_address, abi=ERC20_ABI
-            )
+            token_contract = self.token_contract(token_address)
 
             tx = token_contract.functions.approve(
                 self.contract_address, amount_wei
@@ -288,13 +417,13 @@ class SettlementClient:
             signed_tx = self.web3.eth.account.sign_transaction(tx, self.account.key)
             tx_hash = self.web3.eth.send_raw_transaction(signed_tx.raw_transaction)
 
-            print(f"🚀 Approval transaction sent: {tx_hash.hex()}")
+            logger.info("Approval transaction sent: %s", tx_hash.hex())
             receipt = self.web3.eth.wait_for_transaction_receipt(tx_hash, timeout=120)
 
             if receipt.status == 1:
-                print(f"✅ Approval successful!")
+                logger.info("Approval confirmed", extra={"block": receipt.blockNumber})
             else:
-                print("❌ Approval failed")
+                logger.error("Approval transaction failed: %s", tx_hash.hex())
 
             return {
                 "success": receipt.status == 1,
@@ -304,7 +433,7 @@ class SettlementClient:
             }
 
         except Exception as e:
-            print(f"❌ Approval failed: {e}")
+            logger.error("Approval failed: %s", e)
             return {"success": False, "error": str(e)}
 
     def check_token_allowance(
@@ -322,18 +451,19 @@ class SettlementClient:
             Current allowance amount
         """
         try:
-            token_contract = self.web3.eth.contract(
-                address=Web3.to_checksum_address(token_address), abi=ERC20_ABI
-            )
+            token_contract = self.token_contract(token_address)
 
-            allowance = token_contract.functions.allowance(
-                Web3.to_checksum_address(owner), self.contract_address
-            ).call()
+            allowance = self._call(
+                "allowance",
+                token_contract.functions.allowance(
+                    Web3.to_checksum_address(owner), self.contract_address
+                ),
+            )
 
             return allowance / (10**token_decimals)
 
         except Exception as e:
-            print(f"❌ Error checking allowance: {e}")
+            logger.error("Error checking allowance: %s", e)
             return 0
 
     def check_token_balance(
@@ -351,18 +481,17 @@ class SettlementClient:
             Token balance
         """
         try:
-            token_contract = self.web3.eth.contract(
-                address=Web3.to_checksum_address(token_address), abi=ERC20_ABI
-            )
+            token_contract = self.token_contract(token_address)
 
-            balance = token_contract.functions.balanceOf(
-                Web3.to_checksum_address(owner)
-            ).call()
+            balance = self._call(
+                "balanceOf",
+                token_contract.functions.balanceOf(Web3.to_checksum_address(owner)),
+            )
 
             return balance / (10**token_decimals)
 
         except Exception as e:
-            print(f"❌ Error checking balance: {e}")
+            logger.error("Error checking balance: %s", e)
             return 0
 
     # ==================== NONCE MANAGEMENT ====================
@@ -379,15 +508,18 @@ class SettlementClient:
             Current nonce value
         """
         try:
-            nonce = self.contract.functions.getUserNonce(
-                Web3.to_checksum_address(user_address),
-                Web3.to_checksum_address(token_address),
-            ).call()
+            nonce = self._call(
+                "getUserNonce",
+                self.contract.functions.getUserNonce(
+                    Web3.to_checksum_address(user_address),
+                    Web3.to_checksum_address(token_address),
+                ),
+            )
 
             return nonce
 
         except Exception as e:
-            print(f"❌ Error getting nonce: {e}")
+            logger.error("Error getting nonce: %s", e)
             return 0
 
     # ==================== SIGNATURE CREATION ====================
@@ -432,57 +564,28 @@ class SettlementClient:
             Signature as hex string
         """
         try:
-            account = Account.from_key(user_private_key)
-
-            # Convert order_id string to bytes32
-            if isinstance(order_id, str):
-                if order_id.startswith("0x"):
-                    order_id_bytes = bytes.fromhex(order_id[2:].zfill(64))
-                else:
-                    order_id_bytes = Web3.keccak(text=order_id)
-            else:
-                order_id_bytes = order_id
-
-            # Convert amounts to wei
-            price_wei = int(price * (10**price_decimals))
-            quantity_wei = int(quantity * (10**quantity_decimals))
-
-            # Create message hash matching contract
-            # Must match: keccak256(abi.encodePacked(...))
-            message_hash = Web3.keccak(
-                b"".join(
-                    [
-                        order_id_bytes,
-                        bytes.fromhex(
-                            Web3.to_checksum_address(base_asset)[2:].zfill(40)
-                        ),
-                        bytes.fromhex(
-                            Web3.to_checksum_address(quote_asset)[2:].zfill(40)
-                        ),
-                        price_wei.to_bytes(32, "big"),
-                        quantity_wei.to_bytes(32, "big"),
-                        Web3.keccak(text=side),
-                        bytes.fromhex(
-                            Web3.to_checksum_address(receive_wallet)[2:].zfill(40)
-                        ),
-                        source_chain_id.to_bytes(32, "big"),
-                        destination_chain_id.to_bytes(32, "big"),
-                        timestamp.to_bytes(32, "big"),
-                        nonce.to_bytes(32, "big"),
-                    ]
-                )
+            # Fragments, key and side hash are cached in signing.py; amounts convert exactly
+            message_hash = signing.trade_message_hash(
+                order_id,
+                base_asset,
+                quote_asset,
+                signing.to_wei(price, price_decimals),
+                signing.to_wei(quantity, quantity_decimals),
+                side,
+                receive_wallet,
+                source_chain_id,
+                destination_chain_id,
+                timestamp,
+                nonce,
             )
+            signature = signing.sign_hash(user_private_key, message_hash)
 
-            # Sign with Ethereum prefix
-            eth_message = encode_defunct(message_hash)
-            signature = account.sign_message(eth_message)
+            logger.debug("Trade signature created for %s", signing.signer_address(user_private_key))
 
-            print(f"✅ Trade signature created for {account.address}")
-
-            return signature.signature.hex()
+            return signature
 
         except Exception as e:
-            print(f"❌ Error creating trade signature: {e}")
+            logger.error("Error creating trade signature: %s", e)
             raise
 
     def create_matching_engine_signature(
@@ -528,63 +631,29 @@ class SettlementClient:
             Signature as hex string
         """
         try:
-            account = Account.from_key(matching_engine_private_key)
-
-            # Convert order_id to bytes32
-            if isinstance(order_id, str):
-                if order_id.startswith("0x"):
-                    order_id_bytes = bytes.fromhex(order_id[2:].zfill(64))
-                else:
-                    order_id_bytes = Web3.keccak(text=order_id)
-            else:
-                order_id_bytes = order_id
-
-            price_wei = int(price * (10**price_decimals))
-            quantity_wei = int(quantity * (10**quantity_decimals))
-
-            # Create hash matching contract verification
-            # Must match the contract's matching engine signature verification
-            message_hash = Web3.keccak(
-                b"".join(
-                    [
-                        order_id_bytes,
-                        bytes.fromhex(Web3.to_checksum_address(party1)[2:].zfill(40)),
-                        bytes.fromhex(Web3.to_checksum_address(party2)[2:].zfill(40)),
-                        bytes.fromhex(
-                            Web3.to_checksum_address(party1_receive_wallet)[2:].zfill(
-                                40
-                            )
-                        ),
-                        bytes.fromhex(
-                            Web3.to_checksum_address(party2_receive_wallet)[2:].zfill(
-                                40
-                            )
-                        ),
-                        bytes.fromhex(
-                            Web3.to_checksum_address(base_asset)[2:].zfill(40)
-                        ),
-                        bytes.fromhex(
-                            Web3.to_checksum_address(quote_asset)[2:].zfill(40)
-                        ),
-                        price_wei.to_bytes(32, "big"),
-                        quantity_wei.to_bytes(32, "big"),
-                        (1 if is_source_chain else 0).to_bytes(32, "big"),
-                        chain_id.to_bytes(32, "big"),
-                    ]
-                )
+            message_hash = signing.matching_engine_message_hash(
+                order_id,
+                party1,
+                party2,
+                party1_receive_wallet,
+                party2_receive_wallet,
+                base_asset,
+                quote_asset,
+                signing.to_wei(price, price_decimals),
+                signing.to_wei(quantity, quantity_decimals),
+                is_source_chain,
+                chain_id,
             )
+            signature = signing.sign_hash(matching_engine_private_key, message_hash)
 
-            eth_message = encode_defunct(message_hash)
-            signature = account.sign_message(eth_message)
-
-            print(
-                f"✅ Matching engine signature created (Chain: {chain_id}, Source: {is_source_chain})"
+            logger.debug(
+                "Matching engine signature created (chain %s, source %s)", chain_id, is_source_chain
             )
 
-            return signature.signature.hex()
+            return signature
 
         except Exception as e:
-            print(f"❌ Error creating matching engine signature: {e}")
+            logger.error("Error creating matching engine signature: %s", e)
             raise
 
     # ==================== TRADE SETTLEMENT ====================
@@ -652,30 +721,25 @@ class SettlementClient:
         """
         if not self.account:
             raise ValueError("No private key provided for transaction signing")
+        # The chain this call settles on, known from the trade: reporting it costs no RPC call,
+        # even when the RPC is what just failed
+        chain_id = source_chain_id if is_source_chain else destination_chain_id
 
         try:
-            # Convert order_id to bytes32
-            if isinstance(order_id, str):
-                if order_id.startswith("0x"):
-                    order_id_bytes = bytes.fromhex(order_id[2:].zfill(64))
-                else:
-                    order_id_bytes = Web3.keccak(text=order_id)
-            else:
-                order_id_bytes = order_id
-
-            # Convert amounts to wei
-            price_wei = int(price * (10**price_decimals))
-            quantity_wei = int(quantity * (10**quantity_decimals))
+            order_id_bytes = signing.order_id_bytes(order_id)
+            # Same exact conversion the signatures were made over
+            price_wei = signing.to_wei(price, price_decimals)
+            quantity_wei = signing.to_wei(quantity, quantity_decimals)
 
             # Build trade data tuple matching the contract struct
             trade_data = (
                 order_id_bytes,
-                Web3.to_checksum_address(party1),
-                Web3.to_checksum_address(party2),
-                Web3.to_checksum_address(party1_receive_wallet),
-                Web3.to_checksum_address(party2_receive_wallet),
-                Web3.to_checksum_address(base_asset),
-                Web3.to_checksum_address(quote_asset),
+                signing.checksum_address(party1),
+                signing.checksum_address(party2),
+                signing.checksum_address(party1_receive_wallet),
+                signing.checksum_address(party2_receive_wallet),
+                signing.checksum_address(base_asset),
+                signing.checksum_address(quote_asset),
                 price_wei,
                 quantity_wei,
                 party1_side,
@@ -692,18 +756,20 @@ class SettlementClient:
             sig2_bytes = bytes.fromhex(signature2.replace("0x", ""))
             me_sig_bytes = bytes.fromhex(matching_engine_signature.replace("0x", ""))
 
-            print(f"\n{'='*60}")
-            print(
-                f"🔄 Settling cross-chain trade on {'SOURCE' if is_source_chain else 'DESTINATION'} chain"
+            logger.info(
+                "Settling cross-chain trade",
+                extra={
+                    "order_id": order_id,
+                    "chain": "source" if is_source_chain else "destination",
+                    "endpoint": self.endpoint,
+                    "party1": party1,
+                    "party1_side": party1_side,
+                    "party2": party2,
+                    "party2_side": party2_side,
+                    "price": price,
+                    "quantity": quantity,
+                },
             )
-            print(f"{'='*60}")
-            print(f"Order ID: {order_id}")
-            print(f"Party 1: {party1} ({party1_side})")
-            print(f"Party 2: {party2} ({party2_side})")
-            print(f"Price: {price}")
-            print(f"Quantity: {quantity}")
-            print(f"Chain ID: {self.web3.eth.chain_id}")
-            print(f"{'='*60}\n")
 
             # Build transaction
             function = self.contract.functions.settleCrossChainTrade(
@@ -714,11 +780,10 @@ class SettlementClient:
             try:
                 gas_estimate = function.estimate_gas({"from": self.account.address})
                 gas_limit = int(gas_estimate * 1.3)  # Add 30% buffer
-                print(f"⛽ Estimated gas: {gas_estimate}, using limit: {gas_limit}")
+                logger.debug("Estimated gas %s, using limit %s", gas_estimate, gas_limit)
             except Exception as gas_error:
-                print(f"⚠️  Gas estimation failed: {gas_error}")
                 gas_limit = 500000  # Fallback gas limit
-                print(f"⛽ Using fallback gas limit: {gas_limit}")
+                logger.warning("Gas estimation failed, using fallback limit %s: %s", gas_limit, gas_error)
 
             # Build transaction
             tx = function.build_transaction(
@@ -732,21 +797,28 @@ class SettlementClient:
 
             # Sign and send
             signed_tx = self.web3.eth.account.sign_transaction(tx, self.account.key)
+            t0 = time.perf_counter_ns()
             tx_hash = self.web3.eth.send_raw_transaction(signed_tx.raw_transaction)
 
-            print(f"🚀 Settlement transaction sent: {tx_hash.hex()}")
-            print("⏳ Waiting for confirmation...")
+            logger.info("Settlement transaction sent: %s", tx_hash.hex())
 
             receipt = self.web3.eth.wait_for_transaction_receipt(tx_hash, timeout=180)
+            metrics.RPC_LATENCY.labels(self.endpoint, "settleCrossChainTrade").observe_ns(
+                time.perf_counter_ns() - t0
+            )
 
             if receipt.status == 1:
-                print(f"\n✅ TRADE SETTLED SUCCESSFULLY!")
-                print(f"   Gas used: {receipt.gasUsed}")
-                print(f"   Block: {receipt.blockNumber}")
-                print(f"   Transaction: {receipt.transactionHash.hex()}\n")
+                logger.info(
+                    "Trade settled",
+                    extra={
+                        "order_id": order_id,
+                        "tx": tx_hash.hex(),
+                        "gas_used": receipt.gasUsed,
+                        "block": receipt.blockNumber,
+                    },
+                )
             else:
-                print(f"\n❌ SETTLEMENT FAILED")
-                print(f"   Transaction: {receipt.transactionHash.hex()}\n")
+                logger.error("Settlement transaction failed", extra={"order_id": order_id, "tx": tx_hash.hex()})
 
             return {
                 "success": receipt.status == 1,
@@ -754,16 +826,16 @@ class SettlementClient:
                 "gas_used": receipt.gasUsed,
                 "block_number": receipt.blockNumber,
                 "is_source_chain": is_source_chain,
-                "chain_id": self.web3.eth.chain_id,
+                "chain_id": chain_id,
             }
 
         except Exception as e:
-            print(f"\n❌ Settlement failed: {e}\n")
+            logger.error("Settlement failed: %s", e, extra={"order_id": order_id})
             return {
                 "success": False,
                 "error": str(e),
                 "is_source_chain": is_source_chain,
-                "chain_id": self.web3.eth.chain_id,
+                "chain_id": chain_id,
             }
 
     # ==================== VERIFICATION METHODS ====================
@@ -785,9 +857,14 @@ class SettlementClient:
         signature: str,
         price_decimals: int = 18,
         quantity_decimals: int = 18,
+        on_chain: bool = False,
     ) -> bool:
         """
-        Verify a trade signature on-chain
+        Verify a trade signature
+
+        Checked locally by default: the signer is recovered from the
+        signature (ecrecover, cached per signature) with no RPC at all.
+        on_chain=True asks the contract instead.
 
         Args:
             signer: Expected signer address
@@ -805,44 +882,56 @@ class SettlementClient:
             signature: Signature to verify
             price_decimals: Price decimals
             quantity_decimals: Quantity decimals
+            on_chain: Verify with an eth_call to the contract instead of locally
 
         Returns:
             True if signature is valid, False otherwise
         """
         try:
-            # Convert order_id to bytes32
-            if isinstance(order_id, str):
-                if order_id.startswith("0x"):
-                    order_id_bytes = bytes.fromhex(order_id[2:].zfill(64))
-                else:
-                    order_id_bytes = Web3.keccak(text=order_id)
-            else:
-                order_id_bytes = order_id
+            order_id_bytes = signing.order_id_bytes(order_id)
+            price_wei = signing.to_wei(price, price_decimals)
+            quantity_wei = signing.to_wei(quantity, quantity_decimals)
+            if not on_chain:
+                message_hash = signing.trade_message_hash(
+                    order_id_bytes,
+                    base_asset,
+                    quote_asset,
+                    price_wei,
+                    quantity_wei,
+                    side,
+                    receive_wallet,
+                    source_chain_id,
+                    destination_chain_id,
+                    timestamp,
+                    nonce,
+                )
+                return signing.verify_signature(message_hash, signature, signer)
 
-            price_wei = int(price * (10**price_decimals))
-            quantity_wei = int(quantity * (10**quantity_decimals))
             sig_bytes = bytes.fromhex(signature.replace("0x", ""))
 
-            result = self.contract.functions.verifyCrossChainTradeSignature(
-                Web3.to_checksum_address(signer),
-                order_id_bytes,
-                Web3.to_checksum_address(base_asset),
-                Web3.to_checksum_address(quote_asset),
-                price_wei,
-                quantity_wei,
-                side,
-                Web3.to_checksum_address(receive_wallet),
-                source_chain_id,
-                destination_chain_id,
-                timestamp,
-                nonce,
-                sig_bytes,
-            ).call()
+            result = self._call(
+                "verifyCrossChainTradeSignature",
+                self.contract.functions.verifyCrossChainTradeSignature(
+                    Web3.to_checksum_address(signer),
+                    order_id_bytes,
+                    Web3.to_checksum_address(base_asset),
+                    Web3.to_checksum_address(quote_asset),
+                    price_wei,
+                    quantity_wei,
+                    side,
+                    Web3.to_checksum_address(receive_wallet),
+                    source_chain_id,
+                    destination_chain_id,
+                    timestamp,
+                    nonce,
+                    sig_bytes,
+                ),
+            )
 
             return result
 
         except Exception as e:
-            print(f"❌ Error verifying signature: {e}")
+            logger.error("Error verifying signature: %s", e)
             return False
 
     def check_trade_settled(self, order_id: str) -> bool:
@@ -856,32 +945,68 @@ class SettlementClient:
             True if settled, False otherwise
         """
         try:
-            if isinstance(order_id, str):
-                if order_id.startswith("0x"):
-                    order_id_bytes = bytes.fromhex(order_id[2:].zfill(64))
-                else:
-                    order_id_bytes = Web3.keccak(text=order_id)
-            else:
-                order_id_bytes = order_id
-
-            settled = self.contract.functions.settledCrossChainOrders(
-                order_id_bytes
-            ).call()
+            order_id_bytes = signing.order_id_bytes(order_id)
+            # Settled trades stay settled: once the index knows, there is nothing to read
+            if self.settled_index is not None and self.settled_index.is_settled(order_id_bytes, self.chain_id):
+                return True
+
+            settled = self._call(
+                "settledCrossChainOrders",
+                self.contract.functions.settledCrossChainOrders(order_id_bytes),
+            )
+            if settled and self.settled_index is not None:
+                self.settled_index.add(order_id_bytes, self.chain_id)
 
             return settled
 
         except Exception as e:
-            print(f"❌ Error checking settlement status: {e}")
+            logger.error("Error checking settlement status: %s", e)
             return False
 
     # ==================== UTILITY METHODS ====================
 
+    def get_settled_trades(self, from_block: int, to_block="latest") -> list:
+        """
+        CrossChainTradeSettled events between two blocks
+
+        Args:
+            from_block: First block to read
+            to_block: Last block to read (default latest)
+
+        Returns:
+            List of dicts SettledTradeIndex.add_events() accepts
+        """
+        t0 = time.perf_counter_ns()
+        try:
+            logs = self.contract.events.CrossChainTradeSettled.get_logs(
+                from_block=from_block, to_block=to_block
+            )
+        except Exception as e:
+            metrics.ERRORS.labels("rpc_" + type(e).__name__).inc()
+            raise
+        finally:
+            metrics.RPC_LATENCY.labels(self.endpoint, "getLogs").observe_ns(
+                time.perf_counter_ns() - t0
+            )
+
+        return [
+            {
+                "order_id": bytes(log["args"]["orderId"]),
+                "chain_id": log["args"]["chainId"],
+                "is_source_chain": log["args"]["isSourceChain"],
+                "transaction_hash": bytes(log["transactionHash"]),
+                "block_number": log["blockNumber"],
+                "timestamp": log["args"]["timestamp"] * 1000,
+            }
+            for log in logs
+        ]
+
     def get_contract_owner(self) -> str:
         """Get the contract owner address"""
         try:
-            return self.contract.functions.owner().call()
+            return self._call("owner", self.contract.functions.owner())
         except Exception as e:
-            print(f"❌ Error getting owner: {e}")
+            logger.error("Error getting owner: %s", e)
             return ""
 
     def display_account_info(self):